@@ -7,6 +7,7 @@ More informations on https://openhomesystem.com/
 """
 
 import sys
+import asyncio
 import logging
 from threading import Thread
 import argparse
@@ -20,6 +21,7 @@ openhemsPath = Path(__file__).parents[1]
 sys.path.append(str(openhemsPath))
 # pylint: disable=wrong-import-position
 from openhems.modules.network.driver.home_assistant_api import HomeAssistantAPI
+from openhems.modules.network.driver.home_assistant_websocket import HomeAssistantWebSocket
 from openhems.modules.network.driver.fake_network import FakeNetwork
 from openhems.modules.network import Network, HomeStateUpdaterException
 from openhems.unix_socket_server import UnixSocketServer
@@ -44,6 +46,9 @@ class OpenHEMSApplication:
 		if networkSource=="homeassistant":
 			logger.info("Network: HomeAssistantAPI")
 			networkUpdater = HomeAssistantAPI(configurator)
+		elif networkSource=="homeassistant_ws":
+			logger.info("Network: HomeAssistantWebSocket")
+			networkUpdater = HomeAssistantWebSocket(configurator)
 		elif networkSource=="fake":
 			logger.info("Network: FakeNetwork")
 			networkUpdater = FakeNetwork(configurator)
@@ -152,7 +157,10 @@ class OpenHEMSApplication:
 		if self.server is not None:
 			# server.run() is infinite loop (never give hand back)
 			try:
-				self.server.run()
+				if self.configurator.get("server.asyncLoop", "bool"):
+					asyncio.run(self.server.runAsync())
+				else:
+					self.server.run()
 			except Exception as e: # pylint: disable=broad-exception-caught
 				self.logger.error("Error occurred while running management server: %s", e)
 		else:
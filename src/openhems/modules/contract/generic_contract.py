@@ -2,9 +2,8 @@
 Generic class to manage contracts when no more precise one is available
 """
 
-import datetime
 import logging
-from openhems.modules.util import HoursRanges, CastUtililty
+from openhems.modules.util import HoursRanges, CastUtililty, getClock
 
 
 class GenericContract:
@@ -22,7 +21,7 @@ class GenericContract:
 			)
 		self._inOffpeakRange = None
 		self.sellPrice = sellPrice
-		self.rangeEnd = datetime.datetime.now()
+		self.rangeEnd = getClock().now()
 
 	@staticmethod
 	def fromdict(dictConf, configuration):
@@ -46,6 +45,13 @@ class GenericContract:
 		hoursRanges = GenericContract.get("hoursRanges", keys, "list")
 		return (hoursRanges, defaultPrice, outRangePrice, sellPrice)
 
+	def refresh(self, now=None):
+		"""
+		Fetch in advance data needed by getPrice() (Like tariffs from web API),
+		 so it can be done concurrently with other I/O. Nothing to do by default.
+		"""
+		del now
+
 	def getHoursRanges(self, now=None, attime=None):
 		"""
 		Return: hours range as dedicated type
@@ -81,12 +87,12 @@ class GenericContract:
 		"""
 		Get "attime" real value (never None)
 		Consider, that if attime is None, attime=now
-		And if now is None, now = datetime.datetime.now()
+		And if now is None, now = getClock().now()
 		"""
 		if attime is None:
 			attime = now
 			if attime is None:
-				attime = datetime.datetime.now()
+				attime = getClock().now()
 		return attime
 
 
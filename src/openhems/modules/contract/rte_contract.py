@@ -6,7 +6,7 @@ import datetime
 # import functools
 import requests
 from openhems.modules.network.feeder import Feeder
-from openhems.modules.util import HoursRanges, ConfigurationException
+from openhems.modules.util import HoursRanges, ConfigurationException, getClock
 from .generic_contract import GenericContract
 
 # pylint: disable=too-few-public-methods
@@ -97,6 +97,15 @@ class RTETempoContract(RTEContract):
 	# callApiRteTempo("today")
 	# callApiRteTempo("2025-03-02")
 
+	def refresh(self, now=None):
+		"""
+		Fetch colors from web API in advance when Home-Assistant do not give them.
+		"""
+		if self.color is None:
+			self.getCurColor(now)
+		if self.colorNext is None:
+			self.getNextColor(now)
+
 	def getColor(self, now=None, attime=None):
 		"""
 		Return "day color". As it change every day, keep cache for 1 hour at least
@@ -108,7 +117,7 @@ class RTETempoContract(RTEContract):
 		if now==attime or attime is None:
 			return self.getCurColor(now)
 		if now is None:
-			now = datetime.datetime.now()
+			now = getClock().now()
 		daytime = self.getColorDate(attime)
 		if self.getColorDate(now)==daytime:
 			return self.getCurColor(now)
@@ -149,7 +158,7 @@ class RTETempoContract(RTEContract):
 		"""
 		# print(f"getNextColor({now})", file=sys.stderr)
 		if now is None:
-			now = datetime.datetime.now()
+			now = getClock().now()
 		curCall = now.strftime("%Y%m%d%H")
 		if self.lastCallNext!=curCall:
 			if self.colorNext is not None:
@@ -166,7 +175,7 @@ class RTETempoContract(RTEContract):
 		Warning: A beter way would be to use Web API directly
 		"""
 		if now is None:
-			now = datetime.datetime.now()
+			now = getClock().now()
 		curCall = now.strftime("%Y%m%d%H")
 		if self.lastCall!=curCall:
 			if self.color is not None:
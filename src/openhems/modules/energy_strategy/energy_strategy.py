@@ -19,6 +19,7 @@ from dataclasses import dataclass
 from openhems.modules.network import (
 	Network, Node, Switch, FeedbackSwitch
 )
+from openhems.modules.util import getClock
 
 @dataclass
 class StrategyNode:
@@ -71,7 +72,7 @@ class EnergyStrategy:
 		self.network = network
 		self._nodes = None
 		self.evalFrequence = datetime.timedelta(minutes=evalFrequency)
-		self.nextEvalDate = datetime.datetime.now() - self.evalFrequence
+		self.nextEvalDate = getClock().now() - self.evalFrequence
 		self.deferables = {}
 		self.deferablesKeys = []
 
@@ -209,11 +210,11 @@ class EnergyStrategy:
 		"""
 		# self.logger.debug("EnergyStrategy.check()")
 		if now is None:
-			now = datetime.datetime.now()
+			now = getClock().now()
 		if self.updateDeferables() or now>self.nextEvalDate:
 			# self.logger.debug("EnergyStrategy.check() : eval")
 			self.eval()
-			self.nextEvalDate = datetime.datetime.now() + self.evalFrequence
+			self.nextEvalDate = getClock().now() + self.evalFrequence
 
 	def eval(self):
 		"""
@@ -235,9 +236,12 @@ class EnergyStrategy:
 		In that case, sub-strategy must implement :
 		- eval()
 		- apply(cycleDuration, now)
+		:cycleDuration: Seconds since the strategy was last called.
+		return: Seconds before the strategy need to be called again
+		 (0 to be called again on next server loop).
 		"""
 		if now is None:
-			now = datetime.datetime.now()
+			now = getClock().now()
 		self.check(now)
 		return self.apply(cycleDuration, now=now)
 
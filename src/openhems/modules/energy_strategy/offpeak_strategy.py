@@ -8,7 +8,7 @@ The strategy is to switch on electric devices only on "off-peak" hours
 import logging
 from datetime import datetime, timedelta
 from openhems.modules.network.network import Network
-from openhems.modules.util import ConfigurationException, DATETIME_PRINT_FORMAT
+from openhems.modules.util import ConfigurationException, DATETIME_PRINT_FORMAT, getClock
 from .energy_strategy import EnergyStrategy
 
 TIMEDELTA_0 = timedelta(0)
@@ -45,7 +45,7 @@ class OffPeakStrategy(EnergyStrategy):
 		 and set end time of this range
 		"""
 		if nowDatetime is None:
-			nowDatetime = datetime.now()
+			nowDatetime = getClock().now()
 		inoffpeakPrev = self.inOffpeakRange
 		useCache = False
 		# use cache
@@ -73,7 +73,7 @@ class OffPeakStrategy(EnergyStrategy):
 		 ELSE : Switch off all AND Sleep until off-peak
 		"""
 		if now is None:
-			now = datetime.now()
+			now = getClock().now()
 		if now>self.rangeEnd:
 			self.checkRange(now)
 		time2Wait = 0
@@ -89,9 +89,10 @@ class OffPeakStrategy(EnergyStrategy):
 					time2Wait = self.hoursRanges.getTime2NextRange(now)
 				else:
 					self.logger.warning("Fail to switch off all. We will try again on next loop.")
-			# TODO : check time2Wait with check4MissingOffeakTime
 			# Even on peak hours, start devices with no other solutions to respect timeout
-			self.check4MissingOffeakTime(now)
+			nextChange = self.check4MissingOffeakTime(now)
+			if time2Wait>0 and nextChange is not None:
+				time2Wait = min(time2Wait, (nextChange-now).total_seconds())
 		return time2Wait
 
 	def getMissingTime(self, schedule, now):
@@ -140,7 +141,10 @@ class OffPeakStrategy(EnergyStrategy):
 		"""
 		Switch on nodes wich must be switch on during peak-periods
 		due to missing time during offpeak period to respect timeout
+		return: The next time a node will have to be switched on/off, None if there is not.
+		 'now' if a node could not be switched on.
 		"""
+		nextChange = None
 		# TODO : A better solution should be to not iterate over all nodes and ask get_strategy_cache()
 		# Maybe a way to remove OffPeakStrategy cache directly... a callback?
 		for elem in self.getNodes():
@@ -156,16 +160,22 @@ class OffPeakStrategy(EnergyStrategy):
 						                 onPeriod[1].strftime(DATETIME_PRINT_FORMAT), schedule)
 			for onPeriod in onPeriods:
 				start, end = onPeriod
+				for changeTime in onPeriod:
+					if changeTime>=now and (nextChange is None or changeTime<nextChange):
+						nextChange = changeTime
 				if now>start:
 					if end>now:
 						if self.switchSchedulable(elem, True):
 							self.logger.info(
 							    "Switch on '%s' due to missing time on offpeak periods to respect constraints.",
 							    elem.id)
+						if not elem.isOn():
+							nextChange = now # Switch on failed : try again on next loop
 					else:
 						if not elem.switchOn(False):
 							# TODO : remove past periods : useless anymore
 							schedule.set_strategy_cache(self.strategyId, onPeriods)
+		return nextChange
 
 	def getPeakPeriods(self, now, schedule):
 		"""
@@ -1,9 +1,9 @@
 """ The Simulated Annealing (recuit simulé) algorithm"""
+import time
 import random
 import math
-import copy
 import functools
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 import scipy.optimize
 import numpy as np
@@ -17,6 +17,8 @@ from openhems.modules.network import OutNode
 #   - Using scipy.optimize.basinhopping
 #   - From custom (coreSimulatedAnnealing2)
 #   Problem: Results to random, difficulties to use standard due to discrete values.
+# - Dynamic programming : objectives only depend on the total power of devices,
+#   so it's a multiple-choice knapsack solved exactly on reachable power sums.
 # - PuLP (for linear integer programming):
 # - DEAP (flexible evolutionary algorithms):
 # - Optuna (hyperparameter optimization, supports discrete spaces):
@@ -33,6 +35,7 @@ class Algorithme(Enum):
 	SIMULATED_ANNEAALING_CUSTOM = 2
 	BASIN_HOPPING_SCIPY = 3 # Close to SIMULATED_ANNEAALING, can be reduce to it.
 	GENETIC = 4
+	DYNAMIC_PROGRAMMING = 5
 
 class OptimizationAlgorithm:
 	"""
@@ -44,6 +47,8 @@ class OptimizationAlgorithm:
 	It's inspired by https://github.com/jmcollin78/solar_optimizer.git
 	"""
 	GENETIC_MODULO = 64
+	DP_POWER_STEP = 10 # W, precision of reachable power sums for dynamicProgramming()
+	POWER_TOLERANCE = 10 # W, under this power changes, inputs are the same (See run())
 
 	@dataclass
 	class Solution:
@@ -67,6 +72,7 @@ class OptimizationAlgorithm:
 		minTemperature:float
 		coolingFactor:float
 		maxNumberOfIteration:int
+		maxTime:float = None # Seconds, no limit if None
 
 	@dataclass
 	class Node:
@@ -94,13 +100,24 @@ class OptimizationAlgorithm:
 		sell:float
 		sellTax:float
 
+	@dataclass
+	class Stats:
+		"""
+		What the last run of an algorithm did
+		"""
+		iterations:int = 0
+		duration:float = 0 # Seconds
+		# (iteration, seconds, target) each time the best target improved
+		improvements:list = field(default_factory=list)
+		timeout:bool = False # True if stopped by maxTime
+
 
 	def __init__(self, *, initialTemp:float=1000, minTemp:float=0.1, coolingFactor:float=0.95,
-		maxIterationNumber:int=1000,logger=None, algo=Algorithme.GENETIC):
+		maxIterationNumber:int=1000,logger=None, algo=Algorithme.GENETIC, maxTime:float=None):
 		self.logger = logger
 		"""Initialize the algorithm with values"""
 		self.algoParams = OptimizationAlgorithm.SimulatedAnnealingAlgorithmParams(
-			initialTemp, minTemp, coolingFactor, maxIterationNumber
+			initialTemp, minTemp, coolingFactor, maxIterationNumber, maxTime
 		)
 		self._totalPowerOfInitialEquipments: float = 0
 		self._netConsumption: float = 0
@@ -108,12 +125,27 @@ class OptimizationAlgorithm:
 		self._equipments: list[OptimizationAlgorithm.Node] = []
 		self.logger.info(
 			"Initializing the SimulatedAnnealingAlgorithm with "
-			"initialTemp=%.2f minTemp=%.2f _coolingFactor=%.2f max_iterations_number=%d",
+			"initialTemp=%.2f minTemp=%.2f _coolingFactor=%.2f max_iterations_number=%d maxTime=%s",
 			self.algoParams.initialTemperature, self.algoParams.minTemperature,
 			self.algoParams.coolingFactor, self.algoParams.maxNumberOfIteration,
+			self.algoParams.maxTime,
 		)
 		self.algo = algo
 		self.prices = None
+		# Genetic algorithm : real power of each (device, gene value), see getGeneticPowerTable()
+		self._powerTable = None
+		# Inputs and best solution of the last run : to skip or warm-start the next one
+		self._lastInputs = None
+		self._lastBest = None
+		self.cacheHits = 0
+		# Power value indexes of the last best solution to start from (See getWarmStartIndexes())
+		self._seedIndexes = None
+		# Power of each (device, value index), see getPowerMatrix()
+		self._powerMatrix = None
+		self._powerCounts = None
+		# Time budget and stats of the last run, see isOverTime()
+		self._startTime = 0
+		self.stats = OptimizationAlgorithm.Stats()
 		# pylint: disable=import-error, import-outside-toplevel
 
 	def takeStep(self, x):
@@ -121,14 +153,10 @@ class OptimizationAlgorithm:
 		Function to determine neightboor for scipy.optimize.basinhopping
 		"""
 		i = random.randint(0, len(x)-1)
-		y = copy.deepcopy(x)
-		current = int(round(x[i]))
-		values =  range(len(self._equipments[i].powerValues))
+		y = np.rint(x)
+		current = int(y[i])
+		values =  range(self._powerCounts[i])
 		y[i] = np.random.choice([v for v in values if v != current])
-		# Re-round values
-		for idx,v in enumerate(y):
-			roundedValue = int(round(v))
-			y[idx] = roundedValue
 		# print("take_step(",x,",",i,") :",y)
 		return y
 
@@ -136,14 +164,8 @@ class OptimizationAlgorithm:
 		"""
 		Objective function to optimize for scipy.optimize.basinhopping
 		"""
-		devicesConsumption = 0
-		for i,v in enumerate(x):
-			idx = int(round(v))
-			values = self._equipments[i].powerValues
-			# print(f"idx:{idx} for:{v} {values[i].name}")
-			l = len(values)
-			idx = idx if idx<l else l-1
-			devicesConsumption += values[idx]
+		idx = np.minimum(np.rint(x).astype(np.intp), self._powerCounts-1)
+		devicesConsumption = self._powerMatrix[np.arange(len(idx)), idx].sum()
 		newConsumption = self._netConsumption-self._totalPowerOfInitialEquipments+devicesConsumption
 		elseConsumption = devicesConsumption-self._totalPowerOfInitialEquipments
 		if newConsumption<0:
@@ -158,22 +180,81 @@ class OptimizationAlgorithm:
 		# print("objective(",x,") :",ratio)
 		return ratio
 
+	def getPowerMatrix(self):
+		"""
+		Return the (devices x values) matrix of powerValues (padded with the last value)
+		 and the number of values of each device.
+		"""
+		counts = np.array([len(e.powerValues) for e in self._equipments], dtype=np.intp)
+		matrix = np.zeros((len(self._equipments), max(counts, default=1)))
+		for i, equipment in enumerate(self._equipments):
+			values = [power for _, power in sorted(equipment.powerValues.items())]
+			matrix[i, :len(values)] = values
+			matrix[i, len(values):] = values[-1]
+		return matrix, counts
+
+	def getPowerIndexes(self):
+		"""
+		Return the index of the closest power value of the requested power of each equipment.
+		"""
+		return [
+			int(np.argmin(np.abs(self._powerMatrix[i, :self._powerCounts[i]]
+				- (equipment.requestedPower if equipment.state else 0))))
+			for i, equipment in enumerate(self._equipments)
+		]
+
+	def setPowerIndexes(self, indexes):
+		"""
+		Set requested power of equipments from the index of their power value.
+		"""
+		for i, equipment in enumerate(self._equipments):
+			idx = min(int(round(indexes[i])), self._powerCounts[i]-1)
+			equipment.requestedPower = float(self._powerMatrix[i, idx])
+			equipment.state = equipment.requestedPower>0
+
+	def isOverTime(self):
+		"""
+		Return True if the run took more than maxTime : algorithms check it
+		 to stop and return the best solution found so far.
+		"""
+		if self.algoParams.maxTime is None:
+			return False
+		if time.perf_counter()-self._startTime>self.algoParams.maxTime:
+			self.stats.timeout = True
+		return self.stats.timeout
+
+	def _addImprovement(self, target):
+		"""
+		Record in stats that the best target improved.
+		"""
+		self.stats.improvements.append(
+			(self.stats.iterations, time.perf_counter()-self._startTime, float(target)))
+
 	def bassinhopping(self):
 		"""
 		Core algorithm of simulated annealing using scipy.optimize.basinhopping
 		"""
+		# Best minimum found (basinhopping only keep the ones with a successfull local minimization)
+		best = [None, math.inf]
+		def callback(x, f, accept):
+			del accept
+			self.stats.iterations += 1
+			if f<best[1]:
+				best[0], best[1] = np.copy(x), f
+				self._addImprovement(f)
+			return self.isOverTime() # Stop basinhopping if True
 		# Generate an initial solution
 		solution = scipy.optimize.basinhopping(
 			self.objective,
-			[d.requestedPower for d in self._equipments],
+			self.getPowerIndexes() if self._seedIndexes is None else self._seedIndexes,
 			niter=100,
 			T=1.0,       # Temperature parameter
 			stepsize=1, # Initial step size (not used in take_step, but required)
 			minimizer_kwargs={"method": "Powell", "options": {"maxiter": 0}},  # Skip local minimization
 			take_step=self.takeStep,
-			stepwise_factor=0.99999
+			stepwise_factor=0.99999,
+			callback=callback
 			# accept_test=None,
-			# callback=myfCB,
 			# interval=50,
 			# disp=False,
 			# niter_success=None,
@@ -181,7 +262,10 @@ class OptimizationAlgorithm:
 			# target_accept_rate=0.5,
 		)
 		self.logger.debug("Solution: %s", solution)
-		return solution
+		if best[1]<solution.fun:
+			solution.x, solution.fun = best
+		self.setPowerIndexes(solution.x)
+		return OptimizationAlgorithm.Solution(self._equipments, float(solution.fun))
 
 	def coreSimulatedAnnealing2(self):
 		"""
@@ -191,6 +275,9 @@ class OptimizationAlgorithm:
 		current = OptimizationAlgorithm.Solution(initialState, self.objective(initialState))
 		temp = self.algoParams.initialTemperature
 		for _ in range(self.algoParams.maxNumberOfIteration):
+			if self.isOverTime():
+				break
+			self.stats.iterations += 1
 			# Generate neighbor by flipping one random variable
 			neighbor = OptimizationAlgorithm.Solution(current.solution.copy(), 0)
 			# Choose a random value in the vector
@@ -225,6 +312,7 @@ class OptimizationAlgorithm:
 			- bestObjective: the measure of the objective for that solution,
 			- totalPowerConsumption: the total of power consumption for 
 			  all _equipments which should be activated (state=True)
+			Stats of the run (iterations, duration...) are then in self.stats.
 		"""
 		del batterySoc
 		if ( len(devices)==0 or
@@ -262,6 +350,21 @@ class OptimizationAlgorithm:
 				)
 			)
 		self.logger.debug("enabled _equipments are: %s", self._equipments)
+		inputs = self._getInputs()
+		if self._isSameInputs(inputs):
+			self.cacheHits += 1
+			self.logger.debug("Same inputs than last run : keep %s", self._lastBest)
+			self.stats = OptimizationAlgorithm.Stats()
+			best = self._lastBest
+			return (
+				best.solution,
+				best.target,
+				OptimizationAlgorithm.devicesConsumption(best.solution),
+			)
+		self._powerMatrix, self._powerCounts = self.getPowerMatrix()
+		self._seedIndexes = self.getWarmStartIndexes()
+		self.stats = OptimizationAlgorithm.Stats()
+		self._startTime = time.perf_counter()
 		match self.algo:
 			case Algorithme.SIMULATED_ANNEAALING_SOLAROPTIMIZER:
 				best = self.coreSimulatedAnnealing()
@@ -271,63 +374,115 @@ class OptimizationAlgorithm:
 				best = self.bassinhopping()
 			case Algorithme.GENETIC:
 				best = self.geneticAlgorithm()
-		self.logger.debug("Best solution: %s", best)
+			case Algorithme.DYNAMIC_PROGRAMMING:
+				best = self.dynamicProgramming()
+		self.stats.duration = time.perf_counter()-self._startTime
+		self.logger.debug("Best solution: %s, %s", best, self.stats)
+		self._lastInputs = inputs
+		self._lastBest = best
 		return (
 			best.solution,
 			best.target,
 			OptimizationAlgorithm.devicesConsumption(best.solution),
 		)
 
-	def coreSimulatedAnnealing(self):
+	def _getInputs(self):
 		"""
-		Core algorithm of simulated annealing
+		Return all what the best solution depends on (See _isSameInputs()).
 		"""
-		# Generate an initial solution
-		current = OptimizationAlgorithm.Solution(None,None)
-		neighbor = OptimizationAlgorithm.Solution(None,None)
-		current.solution = self.generateInitialSolution(self._equipments)
-		best = OptimizationAlgorithm.Solution(current.solution, self.evalTarget(current.solution))
-		temperature = self.algoParams.initialTemperature
-		# self.logger.debug("OptimizationAlgorithm.run(%s)", self.algoParams)
-		for _ in range(self.algoParams.maxNumberOfIteration):
-			# Generate a neighbor
-			current.target = self.evalTarget(current.solution)
-			# self.logger.debug("Current : %s", current)
+		return (
+			tuple((e.name, tuple(e.powerValues.items()), e.isUsable) for e in self._equipments),
+			self.prices,
+			[e.currentPower for e in self._equipments]
+				+ [self._netConsumption, self.solarProduction]
+		)
 
-			# Calculate objectives for the current solution and the neighbor
-			neighbor.solution = self._equipmentswap(current.solution)
-			neighbor.target = self.evalTarget(neighbor.solution)
-			# self.logger.debug("Neighbor : %s", neighbor)
+	def _isSameInputs(self, inputs):
+		"""
+		Return True if inputs are the same than on last run : same devices,
+		 same prices and same powers (Up to POWER_TOLERANCE).
+		"""
+		if self._lastInputs is None:
+			return False
+		devices, prices, powers = inputs
+		lastDevices, lastPrices, lastPowers = self._lastInputs
+		return (devices==lastDevices and prices==lastPrices
+			and all(abs(p-lp)<=OptimizationAlgorithm.POWER_TOLERANCE
+				for p, lp in zip(powers, lastPowers)))
+
+	def getWarmStartIndexes(self):
+		"""
+		Return power value indexes of the last best solution to start from,
+		 or None without last solution. Equipments keep their current power if the last one
+		 is not possible anymore. Equipments themselves are not changed : their requested power
+		 stay the measured one.
+		"""
+		if self._lastBest is None:
+			return None
+		lastPowers = {e.name: e.requestedPower for e in self._lastBest.solution}
+		indexes = self.getPowerIndexes()
+		for i, equipment in enumerate(self._equipments):
+			matches = np.flatnonzero(
+				self._powerMatrix[i, :self._powerCounts[i]]==lastPowers.get(equipment.name))
+			if len(matches)>0:
+				indexes[i] = int(matches[0])
+		return indexes
 
-			# Accept the neighbor if its objective is better
-			# or if the total consumption does not exceed solar production
-			if neighbor.target<current.target:
-				self.logger.debug("---> Keeping the neighbor objective : %s", neighbor)
-				current.solution = neighbor.solution
-				goal = self.evalTarget(best.solution)
-				if neighbor.target<goal:
-					self.logger.debug("---> This is the best so far")
-					best = neighbor
+	def coreSimulatedAnnealing(self):
+		"""
+		Core algorithm of simulated annealing.
+		The state is the index of the chosen power value of each equipment : a move change
+		 one index, so the total power is updated in O(1) with the power matrix.
+		 Nodes are only updated with the best state at the end.
+		"""
+		# Measured consumption of equipments (Not the warm start one)
+		self._totalPowerOfInitialEquipments = sum(
+			e.currentPower for e in self._equipments if e.state)
+		powers = self._powerMatrix.tolist()
+		counts = self._powerCounts.tolist()
+		# Generate an initial solution : last best one or closest values of requested powers
+		state = self.getPowerIndexes() if self._seedIndexes is None else list(self._seedIndexes)
+		movables = [i for i, e in enumerate(self._equipments) if e.isUsable and counts[i]>1]
+		total = sum(powers[i][v] for i, v in enumerate(state))
+		target = self.evalTargetCB(total)
+		bestState, bestTarget = list(state), target
+		self._addImprovement(bestTarget)
+		temperature = self.algoParams.initialTemperature
+		# self.logger.debug("OptimizationAlgorithm.run(%s)", self.algoParams)
+		for iteration in range(self.algoParams.maxNumberOfIteration if movables else 0):
+			# Check time budget only sometimes as an iteration is really fast
+			if iteration%64==0 and self.isOverTime():
+				break
+			self.stats.iterations += 1
+			# Generate a neighbor : next or previous power value of a random equipment
+			i = random.choice(movables)
+			current = state[i]
+			if current==0:
+				value = 1
+			elif current==counts[i]-1:
+				value = current-1
 			else:
-				# Accept the neighbor with a certain probability
-				probability = math.exp(
-					(current.target - neighbor.target) / temperature
-				)
-				if (threshold := random.random()) < probability:
-					current.solution = neighbor.solution
-					self.logger.debug(
-						"---> Keeping the neighbor objective because "
-						"threshold (%.2f) is less than probability (%.2f)",
-						threshold, probability,
-					)
-				# else: self.logger.debug("--> Not accepting")
-
+				value = current+random.choice((-1, 1))
+			neighborTotal = total+powers[i][value]-powers[i][current]
+			neighborTarget = self.evalTargetCB(neighborTotal)
+			# Accept the neighbor if its objective is better
+			#  or with a probability decreasing with temperature
+			if (neighborTarget<target
+					or random.random()<math.exp((target-neighborTarget)/temperature)):
+				state[i] = value
+				total = neighborTotal
+				target = neighborTarget
+				if target<bestTarget:
+					bestState, bestTarget = list(state), target
+					self._addImprovement(bestTarget)
 			# Reduce the temperature
 			temperature *= self.algoParams.coolingFactor
-			# self.logger.debug(" !! Temperature %.2f", temperature)
 			if temperature < self.algoParams.minTemperature:
 				break
-		return best
+		self.setPowerIndexes(bestState)
+		# Clear cache : on next call class's attributes will be differents.
+		self.evalTargetCB.cache_clear()
+		return OptimizationAlgorithm.Solution(self._equipments, bestTarget)
 
 	def evalTarget2(self, solution):
 		"""
@@ -397,14 +552,6 @@ class OptimizationAlgorithm:
 			dischargeCoefficients = (forcedSellCost) / (self.prices.buy + forcedSellCost)
 		return importCoefficients * newImport + dischargeCoefficients * newDischarges
 
-	def generateInitialSolution(self, solution):
-		"""
-		Generate the initial solution (which is the solution given in argument) 
-		and calculate the total initial power
-		"""
-		self._totalPowerOfInitialEquipments = OptimizationAlgorithm.devicesConsumption(solution)
-		return copy.deepcopy(solution)
-
 	@staticmethod
 	def devicesConsumption(solution):
 		"""
@@ -413,98 +560,6 @@ class OptimizationAlgorithm:
 		return sum(equipment.requestedPower
 			for equipment in solution if equipment.state)
 
-	def evalNewPower(self, equipment):
-		"""
-		Calculate a new power
-		"""
-		choices = []
-		powerMinToUse = equipment.powerValues[0]
-		if equipment.currentPower > powerMinToUse:
-			choices.append(-1)
-		if equipment.currentPower < equipment.powerMax:
-			choices.append(1)
-
-		if len(choices) <= 0:
-			# No changes
-			return equipment.currentPower
-		# Find the index of closest power possible value
-		currentPowerIndex, currentPowerValue = min(
-			equipment.powerValues.items(),
-			key=lambda x: abs(equipment.currentPower - x[1])
-		)
-		requestedPowerIdx = random.choice(choices) + currentPowerIndex
-		requestedPowerIdx = max(requestedPowerIdx, 0)
-		if len(equipment.powerValues) <= requestedPowerIdx:
-			requestedPowerIdx = len(equipment.powerValues) - 1
-		requestedPower = equipment.powerValues.get(requestedPowerIdx)
-		self.logger.debug("Change power to %d, currentPower=%d", requestedPower, currentPowerValue)
-		return requestedPower
-
-	def _equipmentswap(self, solution):
-		"""Swap the state of a random equipment"""
-		neighbor = copy.deepcopy(solution)
-
-		usable = [eqt for eqt in neighbor if eqt.isUsable]
-
-		if len(usable) <= 0:
-			return neighbor
-
-		equipment = random.choice(usable)
-
-		state = equipment.state
-		canChangePower = equipment.canChangePower
-		isWaiting = equipment.isWaiting
-
-		# Current power is the last requestedPower
-		# currentPower = equipment.requestedPower
-		powerMax = equipment.powerMax
-		if canChangePower:
-			powerMin = equipment.powerValues[0]
-		else:
-			# If power is not manageable, min = max
-			powerMin = powerMax
-
-		if (not canChangePower and isWaiting) or (
-			not state and canChangePower and isWaiting
-		):
-			self.logger.debug("not canChangePower and isWaiting -> do nothing")
-			return neighbor
-
-		if state and canChangePower and isWaiting:
-			# Calculate a new power but do not switch off (because waiting)
-			requestedPower = self.evalNewPower(equipment)
-			assert (
-				requestedPower > 0
-			), "requestedPower should be > 0 because isWaiting is True"
-
-		elif state and canChangePower and not isWaiting:
-			# Change power and accept switching off
-			requestedPower = self.evalNewPower(equipment)
-			if requestedPower <= powerMin:
-				# Deactivate the equipment
-				equipment.state = False
-				requestedPower = 0
-
-		elif not state and not isWaiting:
-			# Turn on
-			equipment.state = not state
-			requestedPower = powerMin
-
-		elif state and not isWaiting:
-			# Turn off
-			equipment.state = not state
-			requestedPower = 0
-
-		elif "requestedPower" not in locals():
-			self.logger.error("We should not be here. equipment=%s", equipment)
-			assert False, "Requested power was not calculated. This is not normal"
-
-		equipment.requestedPower = requestedPower
-
-		# self.logger.debug("      -- Swapping %s max power of %.2f. It changes to %s",
-		# 	equipment.name, equipment.requestedPower, equipment.state,)
-		return neighbor
-
 	@functools.lru_cache(maxsize=20000)
 	def geneticGetPower(self, fakeValue, index):
 		"""
@@ -540,9 +595,69 @@ class OptimizationAlgorithm:
 			)
 			self.customParam = customParam
 			def funcTransformed(x):
-				return np.array([func(self.customParam, tuple(y)) for y in x])
+				return func(self.customParam, x) # Score the whole population at once
 			self.func = funcTransformed
 
+	def getGeneticPowerTable(self):
+		"""
+		Return the (devices x GENETIC_MODULO+1) table of the real power for each gene value
+		 (See geneticGetPower()).
+		"""
+		table = np.zeros((len(self._equipments), OptimizationAlgorithm.GENETIC_MODULO+1))
+		for i in range(len(self._equipments)):
+			for v in range(OptimizationAlgorithm.GENETIC_MODULO+1):
+				table[i, v] = self.geneticGetPower(v, i)
+		return table
+
+	def getGeneticGenes(self, indexes):
+		"""
+		Return the genes (one per device) of power value indexes (See getPowerMatrix()),
+		 None if one is not reachable.
+		"""
+		genes = []
+		for i, idx in enumerate(indexes):
+			matches = np.flatnonzero(self._powerTable[i]==self._powerMatrix[i, idx])
+			if len(matches)==0:
+				return None
+			genes.append(int(matches[0]))
+		return genes
+
+	@staticmethod
+	def geneticChromosome(genes, lind):
+		"""
+		Return the sko.GA chromosome (Gray code of lind[i] bits per gene) of genes.
+		"""
+		bits = []
+		for gene, length in zip(genes, lind):
+			gray = gene ^ (gene >> 1)
+			bits += [(gray >> (length-1-b)) & 1 for b in range(length)]
+		return np.array(bits)
+
+	@staticmethod
+	def evalPopulation(customParam, population):
+		"""
+		Vectorised evalTarget3() for geneticAlgorithm() :
+		 score all individuals (one per row) in one NumPy pass.
+		"""
+		genes = np.rint(population).astype(np.intp)
+		table = customParam._powerTable # pylint: disable=protected-access
+		devicesConsumption = table[np.arange(table.shape[0]), genes].sum(axis=1)
+		return customParam.evalTarget3Vector(devicesConsumption)
+
+	def evalTarget3Vector(self, devicesConsumption):
+		"""
+		Vectorised evalTarget3CB() on an array of devices consumptions.
+		"""
+		basedConsumption = self._netConsumption-self._totalPowerOfInitialEquipments
+		newConsumption = basedConsumption+devicesConsumption
+		newPrice = newConsumption*np.where(newConsumption<0, self.prices.sell, self.prices.buy)
+		elseConsumption = basedConsumption+self.solarProduction
+		if elseConsumption<0:
+			elsePrice = elseConsumption*self.prices.sell
+		else:
+			elsePrice = elseConsumption*self.prices.offpeak
+		return np.square(newPrice-elsePrice)
+
 	@staticmethod
 	def evalTarget3(customParam, x):
 		"""
@@ -582,6 +697,7 @@ class OptimizationAlgorithm:
 		"""
 		Use genetic algorythm to find the best solution
 		"""
+		self._powerTable = self.getGeneticPowerTable()
 		ga0 = GA(
 			func=self.evalTarget3,
 			n_dim=len(self._equipments),
@@ -591,16 +707,66 @@ class OptimizationAlgorithm:
 			lb=0, ub=OptimizationAlgorithm.GENETIC_MODULO, # Use modulo to adapt
 			precision=1,      # Treat variables as integers (0 or 1)
 		)
-		ga = self.ParamGA(customParam=self, func=self.evalTarget3, ga=ga0)
+		ga = self.ParamGA(customParam=self, func=self.evalPopulation, ga=ga0)
+		if self._seedIndexes is not None:
+			# Warm start : put the last best solution in the initial population
+			genes = self.getGeneticGenes(self._seedIndexes)
+			if genes is not None:
+				ga.Chrom[0] = self.geneticChromosome(genes, ga.Lind)
 		# print(f"Run Genetic Algorythm for {self._equipments}")
-		bestX, bestY = ga.run()
+		# Run generation by generation to check time budget
+		bestY = math.inf
+		for _ in range(ga0.max_iter):
+			bestX, y = ga.run(1)
+			self.stats.iterations += 1
+			if y[0]<bestY:
+				bestY = y[0]
+				self._addImprovement(bestY)
+			if self.isOverTime():
+				break
 		for i,v in enumerate(bestX):
-			self._equipments[i].requestedPower = self.geneticGetPower(v, i)
+			self._equipments[i].requestedPower = self._powerTable[i, int(round(v))]
 		best = OptimizationAlgorithm.Solution(self._equipments, bestY)
 		# Clear caches to free memory
 		#  on next call class's attributes will be differents, so caches will be wrong.
-		# self.logger.debug("Caches : %s; %s;",
-		# 	self.evalTarget3CB.cache_info(), self.geneticGetPower.cache_info())
 		self.evalTarget3CB.cache_clear()
 		self.geneticGetPower.cache_clear()
 		return best
+
+	def dynamicProgramming(self):
+		"""
+		Find the best solution for evalTarget3CB() (Same objective as geneticAlgorithm())
+		 with dynamic programming over reachable total powers of devices.
+		Totals are merged by DP_POWER_STEP buckets, so it's exact up to this precision,
+		 and deterministic : on equality, the first power values (lowest keys) are kept.
+		"""
+		step = OptimizationAlgorithm.DP_POWER_STEP
+		reachable = {0: 0.0} # bucket -> exact total power
+		layers = [] # For each equipment : bucket -> (previous bucket, power)
+		indexes = self.getPowerIndexes()
+		for i, equipment in enumerate(self._equipments):
+			choices = [power for _, power in sorted(equipment.powerValues.items())]
+			if not equipment.isUsable or self.isOverTime():
+				# Unusable, or out of time for remaining equipments : keep requested power
+				choices = [choices[indexes[i]]]
+			nextReachable = {}
+			layer = {}
+			self.stats.iterations += len(reachable)*len(choices)
+			for bucket, total in reachable.items():
+				for power in choices:
+					newTotal = total+power
+					newBucket = int(round(newTotal/step))
+					if newBucket not in nextReachable:
+						nextReachable[newBucket] = newTotal
+						layer[newBucket] = (bucket, power)
+			reachable = nextReachable
+			layers.append(layer)
+		buckets = list(reachable.keys())
+		targets = self.evalTarget3Vector(np.array([reachable[b] for b in buckets]))
+		bestIdx = int(np.argmin(targets))
+		self._addImprovement(targets[bestIdx])
+		bucket = buckets[bestIdx]
+		for equipment, layer in zip(reversed(self._equipments), reversed(layers)):
+			bucket, equipment.requestedPower = layer[bucket]
+			equipment.state = equipment.requestedPower>0
+		return OptimizationAlgorithm.Solution(self._equipments, float(targets[bestIdx]))
@@ -8,9 +8,9 @@ It's inspired by https://github.com/jmcollin78/solar_optimizer.git
 #TODO: RunOk - InProd : 4/6
 """
 
-from datetime import datetime, timedelta
+from datetime import timedelta
 from openhems.modules.network.network import Network
-from openhems.modules.util import ConfigurationManager
+from openhems.modules.util import ConfigurationManager, ConfigurationException, getClock
 from .optimization_algorithm import OptimizationAlgorithm, Algorithme
 from .energy_strategy import EnergyStrategy
 
@@ -33,21 +33,26 @@ class SimulatedAnnealingStrategy(EnergyStrategy):
 		minTemp = float(configurationAnnealing.get("min_temp"))
 		coolingFactor = float(configurationAnnealing.get("cooling_factor"))
 		maxIterationNumber = int(configurationAnnealing.get("max_iteration_number"))
+		maxTimeMs = float(configurationAnnealing.get("max_time_ms", 0))
+		algoName = str(configurationAnnealing.get("algo", "genetic")).strip().upper()
+		if algoName not in Algorithme.__members__:
+			raise ConfigurationException(f"SimulatedAnnealingStrategy : unknown algo '{algoName}'"
+				f", availables are {list(Algorithme.__members__)}")
 		self._algo = OptimizationAlgorithm(
 			initialTemp=initTemp,
 			minTemp=minTemp, coolingFactor=coolingFactor,
 			maxIterationNumber=maxIterationNumber,
-			logger=self.logger, algo=Algorithme.GENETIC
+			logger=self.logger, algo=Algorithme[algoName],
+			maxTime=maxTimeMs/1000 if maxTimeMs>0 else None
 		)
 		self.network = network
 		freq = configurationAnnealing.get("freq")
 		self.evalFrequence = timedelta(minutes=freq)
 		self.data = None
-		self.nextEvalDate = datetime.now() - self.evalFrequence
+		self.nextEvalDate = getClock().now() - self.evalFrequence
 		self._bestSolution = None
 		self._bestGoal = None
 		self._totalPower = None
-		self.deferables = {}
 
 	def eval(self):
 		"""
@@ -67,8 +72,6 @@ class SimulatedAnnealingStrategy(EnergyStrategy):
 		offpeakPrice = self.network.getHoursRanges().getOffpeakPrice()
 		# sellTaxPercent = 100 * (buyCost - sellCost) / buyCost if buyCost != 0 else 0
 		nodes = self.getNodes()
-		for node in nodes:
-			self.deferables[node.id] = node
 		self._bestSolution, self._bestGoal, self._totalPower \
 			= self._algo.run(
 			nodes,
@@ -80,6 +83,18 @@ class SimulatedAnnealingStrategy(EnergyStrategy):
 			offpeakPrice=offpeakPrice
 		)
 
+	def getCacheHits(self):
+		"""
+		Return the number of eval() skipped because inputs did not change.
+		"""
+		return self._algo.cacheHits
+
+	def getStats(self):
+		"""
+		Return stats (iterations, duration, improvements) of the last optimization.
+		"""
+		return self._algo.stats
+
 	def apply(self, cycleDuration, now=None):
 		"""
 		This apply what eval function computed.
@@ -91,7 +106,7 @@ class SimulatedAnnealingStrategy(EnergyStrategy):
 		for equipment in self._bestSolution:
 			nodeId = equipment.name
 			requestedPower = equipment.requestedPower
-			node = self.deferables.get(nodeId)
+			node = self.network.getNode(nodeId)
 			if node is None:
 				continue
 			state = requestedPower>0
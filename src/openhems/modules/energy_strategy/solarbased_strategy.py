@@ -7,7 +7,7 @@ from dataclasses import dataclass
 import astral
 from astral.sun import sun
 from openhems.modules.network.network import Network
-from openhems.modules.util import ConfigurationManager
+from openhems.modules.util import ConfigurationManager, getClock
 from .energy_strategy import EnergyStrategy
 
 @dataclass
@@ -41,8 +41,8 @@ class SolarBasedStrategy(EnergyStrategy):
 			configurationGlobal.get("localization.altitude")
 		)
 		self._nightime = False
-		self._sunrise = datetime.datetime.now() # TODO
-		self._sunset = datetime.datetime.now() # TODO
+		self._sunrise = getClock().now() # TODO
+		self._sunset = getClock().now() # TODO
 		self.timezone = datetime.datetime.now(datetime.timezone.utc)\
 			.astimezone().tzinfo
 		self.location = astral\
@@ -74,17 +74,18 @@ class SolarBasedStrategy(EnergyStrategy):
 		usefull for solar production management
 		"""
 		if now is None:
-			now = datetime.datetime.now()
+			now = getClock().now()
 		if self._nightime:
 			if now>self._sunrise:
 				self._nightime = False
 		else:
 			if now>self._sunset:
 				self._nightime = True
-				tomorowDate = datetime.date.today() + datetime.timedelta(days=1)
+				tomorowDate = now.date() + datetime.timedelta(days=1)
 				sunParams = sun(self.location.observer, date=tomorowDate)
-				self._sunrise = sunParams['sunrise'].astimezone(self.timezone)
-				self._nightime = sunParams['sunset'].astimezone(self.timezone)
+				# Naive local datetimes to compare with now
+				self._sunrise = sunParams['sunrise'].astimezone(self.timezone).replace(tzinfo=None)
+				self._sunset = sunParams['sunset'].astimezone(self.timezone).replace(tzinfo=None)
 				self.lastAutonomousRatio = self.getAutonomousRatio()
 				self.solarTime = self.gridTime = 0
 
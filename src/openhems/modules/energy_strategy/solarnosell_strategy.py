@@ -129,4 +129,4 @@ class SolarNoSellStrategy(SolarBasedStrategy):
 		# TODO : Return short timeout if we switch on a device,
 		#  to quicly react if it's not enough (or too much)
 		#  (more chances are the state will evolv after).
-		return cycleDuration
+		return 0 # Back to each server loop after a quick reaction
@@ -7,7 +7,7 @@ This is in case we just base on "off-peak" range hours to control output.
 """
 from datetime import datetime
 from openhems.modules.network.network import Network
-from openhems.modules.util import ConfigurationException, HoursRanges
+from openhems.modules.util import ConfigurationException, HoursRanges, getClock
 from .energy_strategy import EnergyStrategy
 
 
@@ -24,7 +24,7 @@ class SwitchoffStrategy(EnergyStrategy):
 		super().__init__(strategyId, network, mylogger)
 		self.offHoursRanges = HoursRanges(offHoursRanges)
 		self.inOffRange = False
-		self._rangeEnd = datetime.now()
+		self._rangeEnd = getClock().now()
 		self._rangeChangeDone = False
 		self._todo = self.getNodes()
 		self._backupStates = {}
@@ -122,7 +122,7 @@ class SwitchoffStrategy(EnergyStrategy):
 		 ELSE : Switch off all AND Sleep until off-peak
 		"""
 		if now is None:
-			now = datetime.now()
+			now = getClock().now()
 		if now>=self._rangeEnd:
 			self.checkRange()
 		if not self._rangeChangeDone:
@@ -13,7 +13,7 @@ from .outnode import OutNode, Switch
 from .feedback_switch import FeedbackSwitch, HeatingSystem
 from .inoutnode import InOutNode, PublicPowerGrid, SolarPanel, Battery
 from .feeder import (
-	Feeder, SourceFeeder, RandomFeeder, ConstFeeder,
-	RotationFeeder, FakeSwitchFeeder, StateFeeder, SumFeeder # For fakeNetwork
+	Feeder, DerivedFeeder, SourceFeeder, RandomFeeder, ConstFeeder,
+	RotationFeeder, FakeSwitchFeeder, StateFeeder, SumFeeder, DailyFeeder # For fakeNetwork
 )
 from .schedule import OpenHEMSSchedule
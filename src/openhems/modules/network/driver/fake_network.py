@@ -5,23 +5,32 @@ This is a fake network for tests.
 """
 
 import re
+import random
 from openhems.modules.util.cast_utility import CastUtililty
 from openhems.modules.network import (
 	HomeStateUpdater,
-	Feeder, RandomFeeder, ConstFeeder, RotationFeeder, StateFeeder, SumFeeder
+	Feeder, RandomFeeder, ConstFeeder, RotationFeeder, StateFeeder, SumFeeder, DailyFeeder
 )
 
 RANDOM_FEEDER = r'^RANDOM\( *([0-9]+(.[0-9]+)?) *, *([0-9]+(.[0-9]+)?) *, *([0-9]+(.[0-9]+)?) *\)$'
 REGEXP_RANDOM_FEEDER = re.compile(RANDOM_FEEDER)
 REGEXP_SUM_FEEDER = re.compile(r'^SUM\( *([a-zA-Z]+) *\)$')
+REGEXP_DAILY_FEEDER = re.compile(r'^DAILY\(([0-9., ]+)\)$')
 
 class FakeNetwork(HomeStateUpdater):
 	"""
-	This is a fake network for tests.
+	This is a fake network for tests (and simulations).
 	"""
 
-#	def __init__(self, conf) -> None:
-#		super().__init__(conf)
+	def __init__(self, conf) -> None:
+		super().__init__(conf)
+		self.random = random.Random() # Seed it for deterministic runs
+
+	def seed(self, value):
+		"""
+		Seed random feeders to get same values on each run.
+		"""
+		self.random.seed(value)
 
 	def getFeeder(self, value,
 			   *, expectedType=None, defaultValue=None, nameid="", node=None
@@ -43,11 +52,15 @@ class FakeNetwork(HomeStateUpdater):
 			if REGEXP_RANDOM_FEEDER.match(value):
 				vals = REGEXP_RANDOM_FEEDER.match(value)
 				# self.logger.debug("RandomFeeder(%s, %s, %s)", vals[1], vals[3], vals[5])
-				feeder = RandomFeeder(self, float(vals[1]), float(vals[3]), float(vals[5]))
-			if REGEXP_SUM_FEEDER.match(value):
+				feeder = RandomFeeder(self, float(vals[1]), float(vals[3]), float(vals[5]),
+					rand=self.random)
+			elif REGEXP_SUM_FEEDER.match(value):
 				vals = REGEXP_SUM_FEEDER.match(value)
 				# self.logger.debug("SumFeeder(%s)", vals[1])
 				feeder = SumFeeder(self.network, vals[1])
+			elif REGEXP_DAILY_FEEDER.match(value):
+				vals = REGEXP_DAILY_FEEDER.match(value)
+				feeder = DailyFeeder(self, [float(v) for v in vals[1].split(",")])
 			else:
 				self.logger.debug("ConstFeeder(%s) - default str", value)
 				feeder = ConstFeeder(value, None, expectedType)
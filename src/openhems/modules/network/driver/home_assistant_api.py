@@ -5,14 +5,17 @@ It access to this by the API using URL and long_lived_token
 """
 
 import os
+import sys
 import time
 import json
 import requests
+from requests.adapters import HTTPAdapter
 from openhems.modules.network import (
 	HomeStateUpdater, HomeStateUpdaterException
 )
 from openhems.modules.network.feeder import Feeder, SourceFeeder, ConstFeeder
 from openhems.modules.util.cast_utility import CastUtililty, CastException
+from openhems.modules.util.circuit_breaker import CircuitBreaker, CircuitState
 from openhems.modules.util.configuration_manager import ConfigurationManager, ConfigurationException
 
 class HATypeExcetion(Exception):
@@ -23,11 +26,83 @@ class HATypeExcetion(Exception):
 		self.message = message
 		self.defaultValue = defaultValue
 
+class HAEntityCatalog:
+	"""
+	Compact catalog of Home-Assistant entities : only entity id,
+	 domain and device class are kept (as interned strings),
+	 not the whole "/states" payload.
+	"""
+	# Render only entity_id and device_class of all entities.
+	CATALOG_TEMPLATE = (
+		"[{% for s in states %}"
+		"{{ [s.entity_id, s.attributes.device_class | default(none)] | tojson }}"
+		"{{ ',' if not loop.last }}{% endfor %}]"
+	)
+
+	def __init__(self):
+		self.entities = {} # entity_id => (domain, device_class)
+
+	def load(self, elements):
+		"""
+		Replace the catalog content from a "/states" like list,
+		 or a list of [entity_id, device_class].
+		"""
+		entities = {}
+		for elem in elements:
+			if isinstance(elem, dict):
+				entityId = elem['entity_id']
+				deviceClass = elem.get('attributes', {}).get('device_class', None)
+			else:
+				entityId, deviceClass = elem
+			entityId = sys.intern(entityId)
+			domain = sys.intern(entityId.split(".", 1)[0])
+			if deviceClass is not None:
+				deviceClass = sys.intern(deviceClass)
+			entities[entityId] = (domain, deviceClass)
+		self.entities = entities
+
+	def getDomain(self, entityId):
+		"""
+		Return the domain of an entity ("sensor", "switch"...), None if unknown.
+		"""
+		entity = self.entities.get(entityId, None)
+		return None if entity is None else entity[0]
+
+	def getDeviceClass(self, entityId):
+		"""
+		Return the device class of an entity ("power", "energy"...), None if unknown.
+		"""
+		entity = self.entities.get(entityId, None)
+		return None if entity is None else entity[1]
+
+	def getIds(self, domain=None, deviceClass=None):
+		"""
+		Return sorted entities ids, filtered on domain and device class if set.
+		"""
+		return sorted(entityId for entityId, (eDomain, eDeviceClass) in self.entities.items()
+			if (domain is None or domain==eDomain)
+				and (deviceClass is None or deviceClass==eDeviceClass))
+
+	def __contains__(self, entityId):
+		return entityId in self.entities
+
+	def __len__(self):
+		return len(self.entities)
+
 class HomeAssistantAPI(HomeStateUpdater):
 	"""
 	This HomeStateUpdater is based on home-Assistant software. 
 	It access to this by the API using URL and long_lived_token
 	"""
+	# Render only registered entities, as a JSON list like "/states" one.
+	STATES_TEMPLATE = (
+		"{% set ids = ENTITY_IDS %}["
+		"{% for s in states | selectattr('entity_id', 'in', ids) %}"
+		"{{ {'entity_id': s.entity_id, 'state': s.state,"
+		" 'last_changed': s.last_changed.isoformat()} | tojson }}"
+		"{{ ',' if not loop.last }}{% endfor %}]"
+	)
+
 	def __init__(self, conf:ConfigurationManager) -> None:
 		super().__init__(conf)
 		self.token = os.getenv("SUPERVISOR_TOKEN") # Injected by Supervisor on Home-Assistant OS
@@ -37,25 +112,103 @@ class HomeAssistantAPI(HomeStateUpdater):
 		else:
 			self.apiUrl = "http://supervisor/core/api"
 		self.cachedIds = {}
-		# Time to sleep after wrong HomeAssistant call
-		self.sleepDurationOnerror = 2
+		# Stop calling Home-Assistant for a while after errors (Without blocking the loop)
+		self.breaker = CircuitBreaker(retryDelay=2, maxRetryDelay=64)
+		self._lastRefresh = None # Time of last successful states update (breaker clock)
 		self.network = None
-		self.haElements = None
+		self.catalog = HAEntityCatalog()
+		self.statesFetch = conf.get("api.states_fetch", defaultValue="template")
+		self._statesTemplate = None
+		self.getTimeout = conf.get("api.get_timeout", defaultValue=5)
+		self.postTimeout = conf.get("api.post_timeout", defaultValue=15)
+		# One keep-alive transport shared by polling, switchOn() and notify()
+		self.session = self.getSession(conf.get("api.pool_size", defaultValue=4))
+		self.latencies = {}
+
+	def getSession(self, poolSize):
+		"""
+		Return a pooled keep-alive HTTP session with authentication headers set once.
+		"""
+		session = requests.Session()
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=poolSize)
+		session.mount("http://", adapter)
+		session.mount("https://", adapter)
+		session.headers.update({
+			"Authorization": "Bearer " + self.token,
+			"content-type": "application/json",
+		})
+		return session
+
+	@staticmethod
+	def getEndpoint(url):
+		"""
+		Return the endpoint of an API url, without entity id
+		 (So latency counters do not grow with entities).
+		"""
+		if url.startswith("/states/"):
+			return "/states/<entity_id>"
+		return url
+
+	def addLatency(self, url, duration):
+		"""
+		Update latency counters of url's endpoint: [count, total, min, max]
+		"""
+		endpoint = self.getEndpoint(url)
+		counter = self.latencies.get(endpoint, None)
+		if counter is None:
+			self.latencies[endpoint] = [1, duration, duration, duration]
+		else:
+			counter[0] += 1
+			counter[1] += duration
+			counter[2] = min(counter[2], duration)
+			counter[3] = max(counter[3], duration)
+
+	def getLatencies(self):
+		"""
+		Return per endpoint latency statistics (in seconds)
+		"""
+		return {endpoint:{
+				"count":count, "mean":total/count, "min":minDuration, "max":maxDuration
+			} for endpoint, (count, total, minDuration, maxDuration) in list(self.latencies.items())}
 
 	def initNetwork(self, network):
 		"""
 		Get all nodes according to Home-Assistants
 		"""
-		# print("HomeAssistant.initNetwork()")
-		response = self.callAPI("/states")
-		self.haElements = {}
-		for e in response:
-			# print(e)
-			entityId = e['entity_id']
-			self.haElements[entityId] = e
-			# print(entityId, e['state'], e['attributes'])
+		self.refreshCatalog()
 		self.network = network
-		# print("getHANodes() = ", self.haElements)
+
+	def refreshCatalog(self):
+		"""
+		Reload the entities catalog from Home-Assistant.
+		 Only entity_id and device_class are rendered (with one "POST /template" call),
+		 we fall back on "/states" if it fail (So template failures are not counted by the breaker).
+		"""
+		response = None
+		if self.statesFetch=="template":
+			try:
+				response = self.callAPI("/template", {"template": HAEntityCatalog.CATALOG_TEMPLATE},
+					countFailure=False, raiseOnError=True)
+			except HomeStateUpdaterException as e:
+				self.logger.warning("HomeAssistantAPI.refreshCatalog() : %s", e.message)
+			if not isinstance(response, list):
+				self.logger.warning("HomeAssistantAPI.refreshCatalog() : "
+					"Unexpected response, fall back on '/states'.")
+				response = None
+		if response is None:
+			response = self.callAPI("/states")
+		self.catalog.load(response)
+		self.logger.debug("HomeAssistantAPI.refreshCatalog() : %d entities", len(self.catalog))
+		return self.catalog
+
+	def listEntities(self, refresh=False):
+		"""
+		Return Home-Assistant entities ids.
+		:refresh: Reload the catalog from Home-Assistant before.
+		"""
+		if refresh or len(self.catalog)==0:
+			self.refreshCatalog()
+		return self.catalog.getIds()
 
 	def getFeeder(self, value,
 			   *, expectedType=None, defaultValue=None, nameid="", node=None
@@ -68,7 +221,7 @@ class HomeAssistantAPI(HomeStateUpdater):
 		del nameid, node
 		feeder = None
 		if value is not None:
-			if isinstance(value, str) and value in self.haElements:
+			if isinstance(value, str) and value in self.catalog:
 				self.logger.debug("SourceFeeder(%s)", value)
 				feeder = SourceFeeder(value, self, expectedType)
 			else:
@@ -85,7 +238,9 @@ class HomeAssistantAPI(HomeStateUpdater):
 		Register a Home-Assistant entity for the cache.
 		"""
 		if self.cachedIds.get(nameid, None) is None:
-			self.cachedIds[nameid] = [None, typename]
+			# [value, typename, last_changed, caster]
+			self.cachedIds[nameid] = [None, typename, None, CastUtililty.getCaster(typename)]
+			self._statesTemplate = None
 
 	def getEntityValue(self, entityId):
 		"""
@@ -99,7 +254,7 @@ class HomeAssistantAPI(HomeStateUpdater):
 			val = response.get("state", None)
 			if entity is not None:
 				try:
-					val = CastUtililty.toType(entity[1], val)
+					val = entity[3](val)
 				except CastException as e:
 					raise HomeStateUpdaterException(e.message) from e
 			return val
@@ -115,23 +270,105 @@ class HomeAssistantAPI(HomeStateUpdater):
 			self.logger.warning("HomeAssistantAPI.updateNetwork() : "
 				"No entities to update.")
 			return True
-		response = self.callAPI("/states")
-		for e in response:
-			# print(e)
-			entityId = e['entity_id']
-			if entityId in self.cachedIds:
-				val = e["state"]
-				try:
-					value = CastUtililty.toType(self.cachedIds[entityId][1], val)
-				except CastException as e:
-					raise HomeStateUpdaterException(
-						"Home-Assitant entity_id='"+entityId+"' : "+e.message, 0
-					) from e
-				self.cachedIds[entityId][0] = value
-				self.logger.info("HomeAssistantAPI.updateNetwork(%s) = %s", \
-					entityId, value)
+		try:
+			response = None
+			if self.statesFetch=="template":
+				response = self.getFilteredStates()
+			if response is None:
+				response = self.callAPI("/states")
+		except (HomeStateUpdaterException, ConfigurationException) as e:
+			if self._lastRefresh is None:
+				raise
+			self.logger.warning("HomeAssistantAPI.updateNetwork() : %s : "
+				"Keep last known values (%.0f seconds old).", e.message, self.getStaleness())
+			self.changedIds = set() # Nothing changed since last known values
+			return False
+		self._lastRefresh = self.breaker.clock()
+		self.changedIds = self.updateEntities(response)
 		return True
 
+	def updateEntities(self, states):
+		"""
+		Update cached entities from a "/states" like list.
+		Only entities whose last_changed moved are casted again.
+		return: set of changed entities ids
+		"""
+		changedIds = set()
+		for elem in states:
+			entityId = elem['entity_id']
+			entity = self.cachedIds.get(entityId, None)
+			if entity is None:
+				continue
+			lastChanged = elem.get("last_changed", None)
+			if lastChanged is not None and lastChanged==entity[2] and entity[0] is not None:
+				continue
+			try:
+				value = entity[3](elem["state"])
+			except CastException as e:
+				raise HomeStateUpdaterException(
+					"Home-Assitant entity_id='"+entityId+"' : "+e.message, 0
+				) from e
+			entity[0] = value
+			entity[2] = lastChanged
+			changedIds.add(entityId)
+			self.logger.info("HomeAssistantAPI.updateNetwork(%s) = %s", \
+				entityId, value)
+		return changedIds
+
+	def refreshEntities(self, entityIds):
+		"""
+		Refresh only some entities with one "/states/<entity_id>" call per entity.
+		return: set of changed entities ids
+		"""
+		states = [self.callAPI("/states/"+entityId) for entityId in entityIds]
+		return self.updateEntities([state for state in states if state is not None])
+
+	def getStaleness(self):
+		"""
+		Return how old (in seconds) are the entities values.
+		 None if they never have been updated.
+		"""
+		if self._lastRefresh is None:
+			return None
+		return self.breaker.clock() - self._lastRefresh
+
+	def getStatesTemplate(self):
+		"""
+		Return the Jinja template rendering states of registered entities only.
+		"""
+		if self._statesTemplate is None:
+			self._statesTemplate = self.STATES_TEMPLATE.replace(
+				"ENTITY_IDS", json.dumps(list(self.cachedIds.keys())))
+		return self._statesTemplate
+
+	def getFilteredStates(self):
+		"""
+		Get state and last_changed of registered entities only,
+		 with one "POST /template" call.
+		 So payload is proportional to configured nodes, not to Home-Assistant size.
+		Return None if it fail (Then caller should fall back on "/states").
+		 Failures are not counted by the breaker nor notified : only the fallback is.
+		 If the template is refused (Old Home-Assistant...), "/states" is used from now.
+		"""
+		try:
+			response = self.callAPI("/template", {"template": self.getStatesTemplate()},
+				countFailure=False, raiseOnError=True)
+		except HomeStateUpdaterException as e:
+			if e.code==400: # Template error, not an authentication or server one
+				self.logger.warning("HomeAssistantAPI.getFilteredStates() : %s, "
+					"use '/states' from now.", e.message)
+				self.statesFetch = "all"
+			else:
+				self.logger.warning("HomeAssistantAPI.getFilteredStates() : %s, "
+					"fall back on '/states'.", e.message)
+			return None
+		if not isinstance(response, list):
+			self.logger.warning("HomeAssistantAPI.getFilteredStates() : "
+				"Unexpected response '%s', use '/states' from now.", response)
+			self.statesFetch = "all"
+			return None
+		return response
+
 	def createNodeElement(self, elem):
 		"""
 		Create node element
@@ -154,8 +391,7 @@ class HomeAssistantAPI(HomeStateUpdater):
 		if isOn!=rIsOn and node.isSwitchable():
 			self.logger.debug("switchOn(%s, %s)", isOn, node)
 			expectStr = "on" if isOn else "off"
-			# pylint: disable=protected-access
-			entityId = node._isOn.nameid # (Should do in an other way?)
+			entityId = node.getFeeder("isOn").nameid
 			response = self.callAPI(
 				"/services/switch/turn_"+expectStr,
 				{"entity_id": entityId}
@@ -172,6 +408,37 @@ class HomeAssistantAPI(HomeStateUpdater):
 		# Nothing to do.")
 		return rIsOn
 
+	def switchNodes(self, isOn:bool, nodes:list):
+		"""
+		Switch on/off all nodes with one service call (list of entity_id).
+		The new states are set in cache.
+		return: dict of nodes state after, by node id
+		"""
+		expectStr = "on" if isOn else "off"
+		entityIds = {node.getFeeder("isOn").nameid:node for node in nodes}
+		self.logger.debug("switchNodes(%s, %s)", isOn, list(entityIds.keys()))
+		try:
+			response = self.callAPI(
+				"/services/switch/turn_"+expectStr,
+				{"entity_id": list(entityIds.keys())}
+			)
+		except HomeStateUpdaterException:
+			return {node.id:not isOn for node in nodes}
+		if not isinstance(response, list): # Error response
+			return {node.id:not isOn for node in nodes}
+		# Entities with no change in switch position are not in response
+		results = {node.id:isOn for node in nodes}
+		for state in response:
+			node = entityIds.get(state.get("entity_id"), None)
+			if node is not None:
+				results[node.id] = state.get("state")=="on"
+		for entityId, node in entityIds.items():
+			entity = self.cachedIds.get(entityId, None)
+			if entity is not None:
+				entity[0] = results[node.id]
+				entity[2] = None # Force update on next poll
+		return results
+
 	def getServices(self):
 		"""
 		Print Home-Assistant services list.
@@ -191,14 +458,18 @@ class HomeAssistantAPI(HomeStateUpdater):
 			"message":message,
 			"title":"Notification from OpenHEMS."
 		}
-		self.callAPI("/services/notify/persistent_notification", data=data)
-		data = {
-			"entity_id": "device_tracker.2410fpcc5g",
-			# "entity_id": "my_direct_message_notifier",
-			"message": message,
-			"title": "Notification from OpenHEMS."
-		}
-		self.callAPI("/services/notify/send_message", data=data)
+		try:
+			self.callAPI("/services/notify/persistent_notification", data=data)
+			data = {
+				"entity_id": "device_tracker.2410fpcc5g",
+				# "entity_id": "my_direct_message_notifier",
+				"message": message,
+				"title": "Notification from OpenHEMS."
+			}
+			self.callAPI("/services/notify/send_message", data=data)
+		except HomeStateUpdaterException as e:
+			# Do not fail on notification (It's usually called on errors)
+			self.logger.error("Fail notify '%s' : %s", message, e.message)
 
 	def getValue(self, entityId, key="state"):
 		"""
@@ -211,25 +482,29 @@ class HomeAssistantAPI(HomeStateUpdater):
 		return None
 
 	# pylint: disable=too-many-branches
-	def callAPI(self, url: str, data=None):
+	def callAPI(self, url: str, data=None, *, countFailure=True, raiseOnError=False):
 		"""
 		Call Home-Assistant API.
+		:param countFailure: If False, errors do not open the breaker (When there is a fallback).
+		:param raiseOnError: If True, an error status raise a HomeStateUpdaterException
+		 (with the status as code) instead of a notification : the caller handle it.
 		"""
-		headers = {
-			"Authorization": "Bearer " + self.token,
-			"content-type": "application/json",
-		}
+		if not self.breaker.allow():
+			raise HomeStateUpdaterException(
+				f"Home-Assistant calls suspended after errors, retry in {self.breaker.getRetryIn():.0f}s"
+				f" ({url})")
 		response = None
 		self.logger.debug("callAPI(%s)", url)
+		start = time.perf_counter()
 		try:
 			if data is None:
-				response = requests.get(self.apiUrl+url,
-					headers=headers, timeout=5
+				response = self.session.get(self.apiUrl+url,
+					timeout=self.getTimeout
 					# verify='/etc/letsencrypt/live/openproduct.freeboxos.fr/cert.pem'
 				)
 			else:
-				response = requests.post(self.apiUrl+url,
-					headers=headers, json=data, timeout=15
+				response = self.session.post(self.apiUrl+url,
+					json=data, timeout=self.postTimeout
 					# verify='/etc/letsencrypt/live/openproduct.freeboxos.fr/cert.pem'
 				)
 				self.logger.debug("  With data : %s", data)
@@ -240,7 +515,11 @@ class HomeAssistantAPI(HomeStateUpdater):
 			msg = ("Unable to access Home Assistance instance, check URL "
 		  		f": {self.apiUrl}{url} ({data}) : {error}")
 			self.logger.error(msg)
+			if countFailure:
+				self.breaker.failure()
 			raise HomeStateUpdaterException(msg) from error
+		finally:
+			self.addLatency(url, time.perf_counter()-start)
 		errMsg = ""
 		errCodeMsg = {
 			500 : ("Unable to access Home Assistance due to error, "
@@ -255,31 +534,35 @@ class HomeAssistantAPI(HomeStateUpdater):
 				errMsg = errCodeMsg[response.status_code]
 			elif response.status_code > 299:
 				errMsg = "Request Get Error: {response.status_code}"
-			time.sleep(self.sleepDurationOnerror)
-			# Maybe is the server overload,
-			# overwise it's better to slow down to avoid useless
-			# infinite loop on errors.
-			self.sleepDurationOnerror = min(self.sleepDurationOnerror*2, 64)
 			try:
 				errMsg = errMsg.format_map(locals())+" ("+self.apiUrl+url+", "+str(data)+")"
 			except KeyError:
 				pass
+			if raiseOnError:
+				if countFailure:
+					self.breaker.failure()
+				raise HomeStateUpdaterException(errMsg, response.status_code)
 			self.logger.error(errMsg)
 			self.logger.debug("With token '%s'", self.token)
 			if url not in [
 						"/services/notify/persistent_notification",
 						"/services/notify/send_message"
-					]:
+					] and self.breaker.state==CircuitState.CLOSED:
 				# To avoid infinite loop : It's url for notify()
+				# Only on first error : then calls are suspended by the breaker.
 				self.notify("Error callAPI() : "
 					f"status_code={response.status_code} : {errMsg}")
+			# Maybe is the server overload or a configuration error (token...),
+			# overwise it's better to slow down to avoid useless infinite loop on errors.
+			if countFailure:
+				self.breaker.failure()
 			if url=="/states":
 				raise ConfigurationException(
 					"Fail get states of Home-Assistant. "
 					"Check the Home-Assistant server is up and check 'Api' tab's parameters."
 				)
 		else:
-			self.sleepDurationOnerror = max(self.sleepDurationOnerror/2, 1)
+			self.breaker.success()
 		try:  # Sometimes when there are connection problems we need to catch empty retrieved json
 			return response.json()
 		except (json.decoder.JSONDecodeError, requests.exceptions.JSONDecodeError):
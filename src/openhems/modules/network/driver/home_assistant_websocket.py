@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+This HomeStateUpdater is based on home-Assistant software.
+Instead of polling "/states" on each loop, it subscribe to Home-Assistant
+ WebSocket API (subscribe_entities) for registered entities only
+ and update the cache as events arrive.
+"""
+
+import json
+import threading
+from websockets.sync.client import connect
+from websockets.exceptions import WebSocketException
+from openhems.modules.network.driver.home_assistant_api import HomeAssistantAPI
+from openhems.modules.util.cast_utility import CastException
+from openhems.modules.util.configuration_manager import ConfigurationManager
+
+class HomeAssistantWebSocketError(Exception):
+	"""
+	Error on Home-Assistant WebSocket protocol.
+	"""
+
+class HomeAssistantWebSocket(HomeAssistantAPI):
+	"""
+	Push-based Home-Assistant updater.
+	The REST API is still used for initNetwork(), switchOn() and notify()
+	 and as fallback when the WebSocket is not connected.
+	"""
+	RECV_TIMEOUT = 1
+	FIRST_STATES_TIMEOUT = 5
+	RECONNECT_DELAY = 5
+
+	def __init__(self, conf:ConfigurationManager) -> None:
+		super().__init__(conf)
+		self.wsUrl = self.getWebSocketUrl(self.apiUrl)
+		self._msgId = 0
+		self._subscribedIds = set()
+		self._thread = None
+		self._stop = threading.Event()
+		self._connected = threading.Event()
+		self._received = threading.Event()
+		self._changesLock = threading.Lock()
+		self._pendingChanges = set()
+
+	@staticmethod
+	def getWebSocketUrl(apiUrl):
+		"""
+		Deduce WebSocket API URL from REST API URL.
+		 http://host:8123/api => ws://host:8123/api/websocket
+		 http://supervisor/core/api => ws://supervisor/core/websocket
+		"""
+		url = apiUrl.rstrip("/")
+		if url.startswith("https://"):
+			url = "wss://"+url[8:]
+		elif url.startswith("http://"):
+			url = "ws://"+url[7:]
+		if url.endswith("/core/api"):
+			url = url[:-4]
+		return url+"/websocket"
+
+	def isConnected(self):
+		"""
+		Return True if WebSocket subscription is alive.
+		"""
+		return self._connected.is_set()
+
+	def start(self):
+		"""
+		Start the listening thread (Done on first updateNetwork()).
+		"""
+		if self._thread is None or not self._thread.is_alive():
+			self._stop.clear()
+			self._thread = threading.Thread(target=self._run, daemon=True,
+				name="HomeAssistantWebSocket")
+			self._thread.start()
+
+	def stop(self):
+		"""
+		Stop the listening thread.
+		"""
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join(self.RECV_TIMEOUT*2)
+		self._thread = None
+
+	def _run(self):
+		while not self._stop.is_set():
+			try:
+				with connect(self.wsUrl, open_timeout=self.RECV_TIMEOUT*5) as ws:
+					self._authenticate(ws)
+					self._subscribedIds = set()
+					self._listen(ws)
+			except (OSError, TimeoutError, WebSocketException, HomeAssistantWebSocketError) as e:
+				self.logger.error("HomeAssistantWebSocket(%s) : %s", self.wsUrl, e)
+			if self._connected.is_set() and self._received.is_set():
+				# Values are no more refreshed from now
+				self._lastRefresh = self.breaker.clock()
+			# Updates may be missed until the first event of next subscription
+			#  (It add all subscribed entities) : poll them meanwhile.
+			self._received.clear()
+			self._connected.clear()
+			self._stop.wait(self.RECONNECT_DELAY)
+
+	def _authenticate(self, ws):
+		msg = json.loads(ws.recv(self.RECV_TIMEOUT*5))
+		if msg.get("type")=="auth_required":
+			ws.send(json.dumps({"type":"auth", "access_token":self.token}))
+			msg = json.loads(ws.recv(self.RECV_TIMEOUT*5))
+		if msg.get("type")!="auth_ok":
+			raise HomeAssistantWebSocketError(f"Authentication failed : {msg}")
+
+	def _subscribe(self, ws):
+		"""
+		Subscribe to entities registered since last subscription.
+		"""
+		newIds = [i for i in self.cachedIds if i not in self._subscribedIds]
+		if len(newIds)>0:
+			self._msgId += 1
+			ws.send(json.dumps({
+				"id":self._msgId,
+				"type":"subscribe_entities",
+				"entity_ids":newIds
+			}))
+			self._subscribedIds.update(newIds)
+			self.logger.debug("HomeAssistantWebSocket.subscribe(%s)", newIds)
+
+	def _listen(self, ws):
+		self._connected.set()
+		while not self._stop.is_set():
+			self._subscribe(ws)
+			try:
+				raw = ws.recv(self.RECV_TIMEOUT)
+			except TimeoutError:
+				continue
+			msg = json.loads(raw)
+			if msg.get("type")=="event":
+				self.onEvent(msg.get("event", {}))
+			elif msg.get("type")=="result" and not msg.get("success", False):
+				raise HomeAssistantWebSocketError(f"Subscription failed : {msg}")
+
+	def onEvent(self, event):
+		"""
+		Apply a subscribe_entities event ("a": added, "c": changed)
+		 to cachedIds in place.
+		"""
+		for entityId, state in event.get("a", {}).items():
+			self._setValue(entityId, state.get("s"), state.get("lc"))
+		for entityId, diff in event.get("c", {}).items():
+			state = diff.get("+", {})
+			if "s" in state:
+				self._setValue(entityId, state["s"], state.get("lc"))
+		self._received.set()
+
+	def _setValue(self, entityId, val, lastChanged):
+		entity = self.cachedIds.get(entityId, None)
+		if entity is None:
+			return
+		try:
+			value = entity[3](val)
+		except CastException as e:
+			# We are not in main thread : keep last value.
+			self.logger.error("Home-Assitant entity_id='%s' : %s", entityId, e.message)
+			return
+		entity[0] = value
+		entity[2] = lastChanged
+		with self._changesLock:
+			self._pendingChanges.add(entityId)
+		self.logger.info("HomeAssistantWebSocket.updateNetwork(%s) = %s", entityId, value)
+
+	def getStaleness(self):
+		"""
+		Values are up to date while subscription is alive.
+		"""
+		if self.isConnected() and self._received.is_set():
+			return 0
+		return super().getStaleness()
+
+	def refreshEntities(self, entityIds):
+		"""
+		Values are updated by the listening thread : just take pending changes.
+		"""
+		if self.isConnected() and self._received.is_set():
+			with self._changesLock:
+				changedIds = self._pendingChanges
+				self._pendingChanges = set()
+			return changedIds
+		return super().refreshEntities(entityIds)
+
+	def updateNetwork(self):
+		"""
+		Values are updated by the listening thread. We only fall back
+		 on polling "/states" when the WebSocket is down or
+		 before the first event.
+		"""
+		if len(self.cachedIds) == 0:
+			return super().updateNetwork()
+		self.start()
+		if not self._received.is_set() and self._lastRefresh is None:
+			self._received.wait(self.FIRST_STATES_TIMEOUT)
+		if self.isConnected() and self._received.is_set():
+			with self._changesLock:
+				self.changedIds = self._pendingChanges
+				self._pendingChanges = set()
+			return True
+		self.logger.warning("HomeAssistantWebSocket.updateNetwork() : "
+			"WebSocket not connected, poll states.")
+		return super().updateNetwork()
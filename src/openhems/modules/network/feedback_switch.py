@@ -398,6 +398,30 @@ class FeedbackSwitch(Switch):
 		self.check()
 		return 0
 
+	def registerTimers(self, scheduler):
+		"""
+		Ask the server DeadlineScheduler to wake up when the sensor change.
+		"""
+		scheduler.wakeOnChange(self, self._sensor)
+		scheduler.wakeSoon(self)
+
+	def wakeUp(self, now):
+		"""
+		Called by the DeadlineScheduler : check the sensor, then wait for
+		 it's change or next target/range end.
+		While the sensor is out of range (switch may have failed) or
+		 the device caracteristics are evaluated, we check on each loop.
+		"""
+		self.check()
+		scheduler = self.network.server.scheduler
+		sensorValue = self._sensor.getValue()
+		if (self._model.getMode()!=FeedbackModelizer.Mode.RUN
+				or not self._min<=sensorValue<=self._max):
+			scheduler.wakeAt(self, now)
+		else:
+			deadlines = [self._rangeEnd] + [target[0] for target in self._nextTargets[:1]]
+			scheduler.wakeAt(self, min(deadlines))
+
 	def isScheduled(self):
 		return False
 
@@ -2,11 +2,13 @@
 This Feeder aim to abstract the update of a value using the NetworkUpdater.
 For the Network, we always "getValue" but when it's a dynamic value, 
 the NetworkUpdater will really search to update the value. 
+Feeders form a small dataflow graph : when a value change, the feeder is invalidated
+ and so are it's dependents. Derived feeders recompute only once after that.
 """
 
 import random
 import logging
-from openhems.modules.util import CastUtililty
+from openhems.modules.util import CastUtililty, getClock
 # from .homestate_updater import HomeStateUpdater
 
 logger = logging.getLogger(__name__)
@@ -22,9 +24,13 @@ class Feeder:
 	 or variable like form battery/solar-panel.
 	But sometime, it's just because we do not have a sensor for this, 
 	so we use const value as "patch".
+	Feeders are slot-based as each node carries several of them.
 	"""
+	__slots__ = ("value", "_dependents")
+
 	def __init__(self, value=None):
 		self.value = value
+		self._dependents = None # Feeders computed from this one
 
 	def getValue(self):
 		"""
@@ -32,33 +38,98 @@ class Feeder:
 		"""
 		return self.value
 
+	def addDependent(self, feeder):
+		"""
+		Register a feeder to invalidate when this value change.
+		"""
+		if self._dependents is None:
+			self._dependents = []
+		if feeder not in self._dependents:
+			self._dependents.append(feeder)
+
+	def invalidate(self):
+		"""
+		Called when the value may have changed : invalidate dependents.
+		"""
+		if self._dependents is not None:
+			for feeder in self._dependents:
+				feeder.invalidate()
+
+class DerivedFeeder(Feeder):
+	"""
+	Feeder whose value is computed from other feeders (inputs).
+	 The value is computed again only after an input changed.
+	"""
+	__slots__ = ("_dirty",)
+
+	def __init__(self, value=None, inputs=()):
+		super().__init__(value)
+		self._dirty = True
+		for feeder in inputs:
+			feeder.addDependent(self)
+
+	def compute(self):
+		"""
+		Return the value computed from inputs. Should be overiden by sub-class.
+		"""
+		return self.value
+
+	def getValue(self):
+		"""
+		Return value, computed again if an input changed.
+		"""
+		if self._dirty:
+			self._dirty = False
+			self.value = self.compute()
+		return self.value
+
+	def invalidate(self):
+		if not self._dirty: # Else dependents are ever invalidated.
+			self._dirty = True
+			super().invalidate()
+
 # pylint: disable=too-few-public-methods
 class SourceFeeder(Feeder):
 	"""
 	Get value from Network.
 	:source HomeStateUpdater: The source of the value
 	:typename str: The name of the expected type
+	The source invalidate it when the entity value change.
 	"""
+	__slots__ = ("nameid", "source", "_dirty")
+
 	def __init__(self, nameid, source, typename:str):
 		super().__init__()
 		self.nameid = nameid
 		self.source = source
 		self.source.registerEntity(nameid, typename)
-		self.sourceId = -100 # For cache : Warning must be <0 : HomeStateUpdater start at 0
+		self.source.registerFeeder(self, nameid)
+		self._dirty = True
 
 	def getValue(self):
 		"""
-		getValue from the "source" if source.id has been updated.
+		getValue from the "source" if it has been updated.
 		"""
-		# Check if need to update SourceFeeder cache
-		sourceId = self.source.getCycleId()
-		if self.sourceId<sourceId:
-			# Better to update sourceId before in case value is
+		if self._dirty:
+			# Better to update _dirty before in case value is
 			# updated between the 2 next lines
-			self.sourceId = sourceId
+			self._dirty = False
 			self.value = self.source.getEntityValue(self.nameid)
 		return self.value
 
+	def invalidate(self):
+		self._dirty = True
+		super().invalidate()
+
+	def setValue(self, value):
+		"""
+		Overwrite the value until next source update (Like after a switch command).
+		"""
+		self.value = value
+		self._dirty = False
+		self.source.feederOverwritten(self)
+		super().invalidate()
+
 	def __str__(self):
 		return "SourceFeeder("+self.nameid+")"
 
@@ -67,6 +138,8 @@ class ConstFeeder(Feeder):
 	"""
 	This is for value wich are constant.
 	"""
+	__slots__ = ("nameid",)
+
 	def __init__(self, value, nameid=None, expectedType=None):
 		if expectedType is not None:
 			value = CastUtililty.toType(expectedType, value)
@@ -83,26 +156,35 @@ class RandomFeeder(Feeder):
 	 but on each openHEMS cycles it does not change a lot usualy.
 	The evolution is quite slow witch is more realistic.
 	"""
-	def __init__(self, source, minimum, maximum, averageStep=None):
+	__slots__ = ("source", "min", "max", "avgStep", "random", "_dirty")
+
+	def __init__(self, source, minimum, maximum, averageStep=None, rand=None):
 		super().__init__((minimum + maximum) / 2)
 		self.source = source
+		self.random = random if rand is None else rand # random.Random for deterministic runs
 		self.min = minimum
 		self.max = maximum
 		if averageStep is None:
 			averageStep = (maximum - minimum)/10
 		self.avgStep = averageStep
-		self.lastRefreshId = self.source.getCycleId()-1
+		self._dirty = False
+		self.source.registerFeeder(self) # Change on each cycle
 
 	def getValue(self):
 		"""
 		The return 'value' is a random value between a 'minimum' and 'maximum',
 		But each step is a gaussian step between the current value.
 		"""
-		if self.lastRefreshId < self.source.getCycleId():
+		if self._dirty:
+			self._dirty = False
 			self.value = min(max(
-					self.value + random.gauss(0, 2*self.avgStep),
+					self.value + self.random.gauss(0, 2*self.avgStep),
 				self.min), self.max)
 		return self.value
+
+	def invalidate(self):
+		self._dirty = True
+		super().invalidate()
 	def __str__(self):
 		return "RandomFeeder("+str(self.min)+", "+str(self.max)+")"
 
@@ -112,6 +194,8 @@ class RotationFeeder(Feeder):
 	It can be usefull to simulate a cylcle or random but with predicaled values
 	 (Usefull for tests)
 	"""
+	__slots__ = ("len", "values", "source")
+
 	def __init__(self, source, valuesList:list):
 		self.len = len(valuesList)
 		if self.len==0:
@@ -121,6 +205,7 @@ class RotationFeeder(Feeder):
 		super().__init__(valuesList[0])
 		self.values = valuesList
 		self.source = source
+		self.source.registerFeeder(self) # Change on each cycle
 
 	def getValue(self):
 		"""
@@ -133,61 +218,116 @@ class RotationFeeder(Feeder):
 	def __str__(self):
 		return "RotationFeeder("+str(self.values)+")"
 
+class DailyFeeder(Feeder):
+	"""
+	The return 'value' follow a daily profile : 'values' are evenly spread over
+	 the day (from midnight) and linearly interpolated at the clock time.
+	Usefull to simulate solar production or regular consumptions.
+	"""
+	__slots__ = ("values", "source", "_dirty")
+
+	def __init__(self, source, valuesList:list):
+		if len(valuesList)==0:
+			logger.error("DailyFeeder() init with empty list. Sert to default [0]")
+			valuesList = [0]
+		super().__init__(valuesList[0])
+		self.values = valuesList
+		self.source = source
+		self._dirty = True
+		self.source.registerFeeder(self) # Change on each cycle
+
+	def getValue(self):
+		"""
+		Return the profile value at current time (See getClock()).
+		"""
+		if self._dirty:
+			self._dirty = False
+			now = getClock().now()
+			seconds = now.hour*3600 + now.minute*60 + now.second
+			position = seconds * len(self.values) / 86400
+			i = int(position)
+			ratio = position - i
+			nextValue = self.values[(i+1) % len(self.values)]
+			self.value = self.values[i]*(1-ratio) + nextValue*ratio
+		return self.value
+
+	def invalidate(self):
+		self._dirty = True
+		super().invalidate()
+	def __str__(self):
+		return "DailyFeeder("+str(self.values)+")"
+
 class StateFeeder(ConstFeeder):
 	"""
 	This is a state machine : This value is the one set before.
 	(Like a ConstFeeder that we can change)
 	"""
+	__slots__ = ()
 
 	def setValue(self, value):
 		"""
 		Change the value to new one.
 		"""
 		self.value = value
+		self.invalidate()
 	def __str__(self):
 		return "StateFeeder("+str(self.value)+")"
 
-class FakeSwitchFeeder(Feeder):
+class FakeSwitchFeeder(DerivedFeeder):
 	"""
 	The return 'value' rotate on a list of predefined 'values'.
 	It can be usefull to simulate a cylcle or random but with predicaled values
 	 (Usefull for tests)
 	"""
+	__slots__ = ("source", "isOn", "defaultValue")
+
 	def __init__(self, source:Feeder, isOn:Feeder, defaultValue=0):
-		super().__init__(source)
+		self.source = source
 		self.isOn = isOn
 		self.defaultValue = defaultValue
+		super().__init__(inputs=(source, isOn))
 
-	def getValue(self):
+	def compute(self):
 		"""
 		The return 'value' rotate on a list of predefined 'values'.
 		On each OpenHEMS server loop, self.source.cycleId should increment,
 		 witch occure the change, 
 		"""
 		if self.isOn.getValue():
-			return self.value.getValue()
+			return self.source.getValue()
 		return self.defaultValue
 	def __str__(self):
 		return f"FakeSwitchFeeder({self.defaultValue})"
 
-class SumFeeder(Feeder):
+class SumFeeder(DerivedFeeder):
 	"""
-	The return 'value' whitch is the sum of getNodes()
+	The return 'value' whitch is the sum of current power of network.getAll(inputType)
 	"""
+	__slots__ = ("_network", "inputType", "_nodesVersion")
+
 	def __init__(self, network, inputType="out"):
-		super().__init__(inputType.lower())
+		super().__init__(0)
 		self._network = network
+		self.inputType = inputType.lower()
+		self._nodesVersion = -1
 
 	def getValue(self):
 		"""
-		The return 'value' rotate on a list of predefined 'values'.
-		On each OpenHEMS server loop, self.source.cycleId should increment,
-		 witch occure the change, 
+		Return the sum, computed again if a node current power changed
+		 or if network nodes changed.
 		"""
-		mysum = sum(
+		nodesVersion = self._network.getNodesVersion()
+		if self._nodesVersion!=nodesVersion:
+			self._nodesVersion = nodesVersion
+			for node in self._network.getAll(self.inputType):
+				node.getFeeder("currentPower").addDependent(self)
+			self._dirty = True
+		return super().getValue()
+
+	def compute(self):
+		return sum(
 			node.getCurrentPower()
-			for node in self._network.getAll(self.value))
-		return mysum
+			for node in self._network.getAll(self.inputType))
 
 	def __str__(self):
-		return f"SumFeeder({self.value})"
+		return f"SumFeeder({self.inputType})"
@@ -4,6 +4,7 @@ It is used to know devices and to switch on/off them.
 """
 
 from typing import Final
+import asyncio
 import logging
 from openhems.modules.util import (
 	ConfigurationManager, ConfigurationException,
@@ -42,6 +43,14 @@ class HomeStateUpdater:
 		self.conf = conf
 		self.tmp = None # Used to avoid method argument repeated.
 		self.warningMessages = []
+		# Switch commands collected during a server loop (None when not collecting)
+		self._switchQueue = None
+		# Entities ids whose value changed on last updateNetwork() (None if unknown)
+		self.changedIds = None
+		# Feeders to invalidate on updates : by entity id, on each cycle, or on next cycle
+		self._entityFeeders = {}
+		self._cyclicFeeders = []
+		self._overwrittenFeeders = []
 
 	def getCycleId(self):
 		"""
@@ -55,6 +64,65 @@ class HomeStateUpdater:
 		"""
 		# self.refreshId += 1 # useless : self.network.getCycleId() replaceIt?
 
+	def refreshEntities(self, entityIds):
+		"""
+		Refresh only some entities (For the fast safety loop).
+		Default implementation can't refresh partially : nothing change.
+		return: set of changed entities ids
+		"""
+		del entityIds
+		return set()
+
+	def getChangedIds(self):
+		"""
+		Return the set of entities ids whose value changed on last updateNetwork().
+		 None if unknown : then consider all may have changed.
+		"""
+		return self.changedIds
+
+	def registerFeeder(self, feeder, entityId=None):
+		"""
+		Register a feeder to invalidate when the entity value change.
+		 If entityId is None, the feeder is invalidated on each cycle.
+		"""
+		if entityId is None:
+			self._cyclicFeeders.append(feeder)
+		else:
+			self._entityFeeders.setdefault(entityId, []).append(feeder)
+
+	def feederOverwritten(self, feeder):
+		"""
+		A feeder value has been set localy (Like after a switch command) :
+		 get back the source value on next cycle.
+		"""
+		self._overwrittenFeeders.append(feeder)
+
+	def invalidateFeeders(self, changedIds=None, newCycle=True):
+		"""
+		Invalidate feeders (and so their dependents) after an update.
+		:param changedIds: entities ids whose value changed, None if unknown (all).
+		:param newCycle: If False (partial refresh), feeders changing on each cycle are kept.
+		"""
+		feeders = []
+		if newCycle:
+			feeders = self._cyclicFeeders + self._overwrittenFeeders
+			self._overwrittenFeeders = []
+		if changedIds is None:
+			for entityFeeders in self._entityFeeders.values():
+				feeders += entityFeeders
+		else:
+			for entityId in changedIds:
+				feeders += self._entityFeeders.get(entityId, [])
+		for feeder in feeders:
+			feeder.invalidate()
+
+	def getStaleness(self):
+		"""
+		Return how old (in seconds) are the values given by this updater,
+		 None if they never have been updated.
+		"""
+		return 0
+
 	def switchOn(self, isOn, _):
 		"""
 		return: True if the switch is on after, False else
@@ -62,6 +130,89 @@ class HomeStateUpdater:
 		self.logger.error("switchOn() should be implemented in sub-class.")
 		return not isOn
 
+	def openSwitchQueue(self):
+		"""
+		Start collecting switch commands instead of sending them immediately.
+		They will be sent on flushSwitchQueue().
+		 Commands of a queue not flushed yet (Flush skipped) are kept.
+		"""
+		if self._switchQueue is None:
+			self._switchQueue = {}
+
+	def queueSwitchOn(self, isOn:bool, node):
+		"""
+		Ask to switch on/off a node.
+		If the switch queue is open, the command is just collected (Last one win)
+		 and the wanted state is returned. A command reverting a previous one
+		 is dropped. Otherwise the command is sent immediately (switchOn()).
+		return: True if the switch is (or will be) on, False else
+		"""
+		if self._switchQueue is None:
+			return self.switchOn(isOn, node)
+		command = self._switchQueue.get(node.id, None)
+		if command is None:
+			if node.isSwitchable() and node.isOn()!=isOn:
+				self._switchQueue[node.id] = [node, isOn]
+				node.setPendingSwitch(isOn)
+		elif command[1]!=isOn:
+			self.logger.debug("Drop contradictory switch commands for '%s'", node.id)
+			del self._switchQueue[node.id]
+			node.setPendingSwitch(None)
+		return isOn
+
+	def flushSwitchQueue(self):
+		"""
+		Send collected switch commands, one call per direction (Off first to free power).
+		Results are reconciled into nodes.
+		return: list of nodes witch failed to switch
+		"""
+		queue = self._switchQueue
+		self._switchQueue = None
+		failed = []
+		if not queue:
+			return failed
+		for isOn in [False, True]:
+			nodes = [node for node, on in queue.values() if on==isOn]
+			if len(nodes)==0:
+				continue
+			results = self.switchNodes(isOn, nodes)
+			for node in nodes:
+				ok = results.get(node.id, not isOn)
+				node.setSwitchResult(ok)
+				if ok!=isOn:
+					self.logger.warning("Fail switch %s '%s'", "on" if isOn else "off", node.id)
+					failed.append(node)
+		return failed
+
+	def switchNodes(self, isOn:bool, nodes:list):
+		"""
+		Switch on/off a list of nodes.
+		This default implementation call switchOn() for each node,
+		 it should be overiden by sub-class when a grouped command is possible.
+		return: dict of nodes state after, by node id
+		"""
+		return {node.id:self.switchOn(isOn, node) for node in nodes}
+
+	async def updateNetworkAsync(self):
+		"""
+		Asyncio variant of updateNetwork().
+		Default implementation run updateNetwork() in a worker thread,
+		 so blocking I/O do not block the event loop.
+		"""
+		return await asyncio.to_thread(self.updateNetwork)
+
+	async def flushSwitchQueueAsync(self):
+		"""
+		Asyncio variant of flushSwitchQueue().
+		"""
+		return await asyncio.to_thread(self.flushSwitchQueue)
+
+	async def notifyAsync(self, message):
+		"""
+		Asyncio variant of notify().
+		"""
+		return await asyncio.to_thread(self.notify, message)
+
 	def notify(self, message):
 		"""
 		A function witch notify the Network,
@@ -76,6 +227,29 @@ class HomeStateUpdater:
 		"""
 		self.network = network
 
+	def getLoopTimings(self):
+		"""
+		Return rolling statistics of each server loop phase.
+		"""
+		if self.network is None:
+			return {}
+		return self.network.getLoopTimings()
+
+	def getLatencies(self):
+		"""
+		Return per endpoint latency statistics (in seconds).
+		 Can be overiden by sub-class calling a remote API.
+		"""
+		return {}
+
+	def listEntities(self, refresh=False):
+		"""
+		Return available entities ids.
+		 By default, only the registered ones.
+		"""
+		del refresh
+		return sorted(self.cachedIds.keys())
+
 	def listComponents(self):
 		"""
 		Print Home-Assistant components list.
@@ -13,6 +13,8 @@ class InOutNode(Node):
 	param maxPower: positive value, max power we can consume at a time.
 	param minPower: negative value if we can sell or ther is battery, 0 overwise.
 	"""
+	__slots__ = ("marginPower", "minPower")
+
 	def __init__(self, nameid, currentPower, *, maxPower=2300, minPower=0, marginPower=0) -> None:
 		# isAutoAdatative: bool, isControlable: bool, isModulable: bool, isCyclic: bool
 		super().__init__(nameid, currentPower, maxPower)
@@ -76,6 +78,8 @@ class PublicPowerGrid(InOutNode):
 	"""
 	This represent Public power grid. Just one should be possible.
 	"""
+	__slots__ = ("contract",)
+
 	def __init__(self, nameid, currentPower, maxPower, minPower, *, marginPower,
 	             contract=None, networkUpdater=None):
 		super().__init__(nameid, currentPower,
@@ -99,6 +103,9 @@ class SolarPanel(InOutNode):
 	We can have many, but one can represent many solar panel.
 	It depends of sensors number.
 	"""
+	__slots__ = ("moduleModel", "inverterModel", "tilt", "azimuth",
+		"modulesPerString", "stringsPerInverter")
+
 	# pylint: disable=too-many-arguments
 	def __init__(self, nameid, currentPower, maxPower, *,
 			moduleModel=None, inverterModel=None, tilt=45, azimuth=180,
@@ -106,7 +113,7 @@ class SolarPanel(InOutNode):
 		if marginPower is None:
 			marginPower = ConstFeeder(0)
 		super().__init__(nameid, currentPower,
-				maxPower=maxPower, minPower=0, marginPower=marginPower)
+				maxPower=maxPower, minPower=ConstFeeder(0), marginPower=marginPower)
 		self.moduleModel = moduleModel
 		self.inverterModel = inverterModel
 		self.tilt = tilt
@@ -135,6 +142,9 @@ class Battery(InOutNode):
 	"""
 	This represent battery.
 	"""
+	__slots__ = ("isControlable", "isModulable", "capacity", "currentLevel", "lowLevel",
+		"highLevel", "targetLevel", "efficiencyIn", "efficiencyOut")
+
 	# pylint: disable=too-many-arguments
 	def __init__(self, nameid, capacity, currentPower, *, maxPowerIn=None,
 			maxPowerOut=None, efficiencyIn:float=0.95, efficiencyOut:float=0.95,
@@ -144,7 +154,8 @@ class Battery(InOutNode):
 			maxPowerIn = ConstFeeder(2300) # a standard electrical outlet
 		if maxPowerOut is None:
 			maxPowerOut = ConstFeeder(-1*maxPowerIn.getValue())
-		super().__init__(nameid, currentPower, maxPower=maxPowerIn, minPower=maxPowerOut, marginPower=0)
+		super().__init__(nameid, currentPower, maxPower=maxPowerIn, minPower=maxPowerOut,
+			marginPower=ConstFeeder(0))
 		self.isControlable = True
 		self.isModulable = False
 		self.capacity = capacity
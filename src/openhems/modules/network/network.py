@@ -4,13 +4,15 @@ It is used to know devices and to switch on/off them.
 """
 
 from typing import Final
+import asyncio
 import copy
 from openhems.modules.util.notification_manager import NotificationManager
+from .feeder import SourceFeeder
 from .node import Node
-from .outnode import OutNode, Switch
-from .inoutnode import (
-	InOutNode, PublicPowerGrid, SolarPanel, Battery
-)
+from .inoutnode import Battery
+from .node_registry import NodeRegistry
+from .snapshot import NetworkSnapshot
+from .power_history import PowerHistory
 from .homestate_updater import HomeStateUpdater
 
 POWER_MARGIN: Final[int] = 10 # Margin of power consumption for security
@@ -38,13 +40,15 @@ class Network:
 
 	def __init__(self, logger, networkUpdater, nodesConf, server=None):
 		self.networkUpdater: HomeStateUpdater = None
-		self.nodes = []
-		self.notificationManager = None
-		self._filteredNodesCache = {} # List of nodes by categories
 		self.logger = logger
+		self._registry = NodeRegistry(logger) # Nodes with indexes by type, strategy and id
+		self.nodes = self._registry.nodes
+		self.notificationManager = None
 		self._loopNb = 0 # used for cache (if loopNb didn't move, get from cache)
-		self._loopNbMarginPowerOn = -1
-		self._marginPowerOn = -1
+		self._snapshot:NetworkSnapshot = None # Nodes values of cycle _loopNb
+		self._powerHistory = PowerHistory() # Nodes current power of last cycles
+		self._historyLoopNb = -1
+		self._anticipateLoad = False
 		self.server = server
 		self.addNetworkUpdater(networkUpdater, nodesConf)
 
@@ -89,68 +93,103 @@ class Network:
 		Add a node.
 		"""
 		elem.network = self
-		self.nodes.append(elem)
-		self._filteredNodesCache = {}
-		return elem
+		self._snapshot = None
+		return self._registry.add(elem)
 
-	def getCurrentPower(self, filterId="inout"):
+	def removeNode(self, elem: Node) -> bool:
 		"""
-		Get current power consumption by all network.
+		Remove a node.
+		return: False if the node was not in the network.
 		"""
-		globalPower = 0
-		for elem in self.getAll(filterId):
-			globalPower += elem.getCurrentPower()
-		return globalPower
+		self._snapshot = None
+		return self._registry.remove(elem)
 
-	def _getAll(self, filterId, elemFilter=None):
+	def reprioritiseNode(self, elem: Node) -> bool:
 		"""
-		Return Out nodes, filtered by strategy=strategyId if set.
-		!!! WARNING !!! filterId and elemFilter must be bijectiv (one-to-one)
+		Update nodes order after a node priority changed.
 		"""
-		out = self._filteredNodesCache.get(filterId, None)
-		if out is None:
-			if elemFilter is None:
-				filters = {
-					"inout" : (lambda x: isinstance(x, InOutNode)),
-					"out" : (lambda x: isinstance(x, OutNode)),
-					"switch" : (lambda x: isinstance(x, Switch)),
-					"publicpowergrid" : (lambda x: isinstance(x, PublicPowerGrid)),
-					"battery" : (lambda x: isinstance(x, Battery)),
-					"solarpanel" : (lambda x: isinstance(x, SolarPanel)),
-				}
-				elemFilter = filters.get(filterId, None)
-			if elemFilter is not None:
-				out = list(filter(elemFilter, self.nodes))
-				if filterId=="switch":
-					out.sort(
-						reverse=True, key=lambda x:x.getPriority()
-					)
-			elif filterId=="":
-				out = self.nodes
-			else:
-				self.logger.error("Network.getAll() : unknown filterId '%s'",
-					 filterId)
-				out = None
-			self._filteredNodesCache[filterId] = out
-		return out
+		self._snapshot = None
+		return self._registry.reprioritise(elem)
 
-	def getAll(self, filterId):
+	def getNode(self, nodeId):
+		"""
+		Return the node with this id, None if there is not.
+		"""
+		return self._registry.get(nodeId)
+
+	def getNodesVersion(self):
 		"""
-		Same as private _getAll() except that we can't set custom elemFilter
-		 to avoid incoherence between elemFilter AND filterId
+		Return a number incremented each time a node is added or removed.
 		"""
-		return self._getAll(filterId)
+		return self._registry.version
 
-	def _sumNodesValues(self, filterId, defaultFilter, function):
+	def getSnapshot(self) -> NetworkSnapshot:
 		"""
-		Sum all values from nodes (filtered by filterId).
+		Return nodes values of the current cycle (Built by updateStates()).
+		"""
+		if self._snapshot is None or self._snapshot.cycleId!=self._loopNb:
+			self._snapshot = NetworkSnapshot(self.nodes, self._loopNb)
+			if self._historyLoopNb!=self._loopNb:
+				self._powerHistory.add(self._snapshot.ids, self._snapshot.currentPower)
+				self._historyLoopNb = self._loopNb
+		return self._snapshot
+
+	def getPowerHistory(self) -> PowerHistory:
+		"""
+		Return nodes current power of last cycles.
+		"""
+		return self._powerHistory
+
+	def setLoadAnticipation(self, anticipate:bool):
+		"""
+		If set, getMarginPowerOn() substract the consumption increase
+		 expected before next cycle (See getLoadRise()).
+		"""
+		self._anticipateLoad = anticipate
+
+	def getLoadRise(self):
+		"""
+		Return the consumption increase expected before next cycle on InOutNode
+		 (Solar panels excepted as there max power follow there current power).
+		"""
+		snapshot = self.getSnapshot()
+		if self._powerHistory.ids!=snapshot.ids:
+			return 0 # Nodes changed during the cycle
+		_, expected, _ = self._powerHistory.estimateNextPower()
+		mask = snapshot.getMask("inout") & ~snapshot.getMask("solarpanel")
+		rise = expected[mask] - snapshot.currentPower[mask]
+		return float(rise[rise>0].sum())
+
+	def _getMask(self, filterId, defaultFilter="inout"):
+		"""
+		Return the snapshot mask of nodes for filterId.
 		"""
 		if filterId is None:
 			filterId = defaultFilter
-		globalPower= 0
-		for elem in self._getAll(filterId):
-			globalPower += function(elem)
-		return globalPower
+		mask = self.getSnapshot().getMask(filterId)
+		if mask is None:
+			self.logger.error("Network.getAll() : unknown filterId '%s'",
+				 filterId)
+			mask = []
+		return mask
+
+	def getCurrentPower(self, filterId="inout"):
+		"""
+		Get current power consumption by all network.
+		"""
+		return self.getSnapshot().getCurrentPower(self._getMask(filterId))
+
+	def getAll(self, filterId):
+		"""
+		Return nodes of a category ("inout", "out", "switch" sorted by priority,
+		 "publicpowergrid", "battery", "solarpanel" or "" for all).
+		!!! WARNING !!! Returned list is an index of the network : do not modify it.
+		"""
+		out = self._registry.getAll(filterId)
+		if out is None:
+			self.logger.error("Network.getAll() : unknown filterId '%s'",
+				 filterId)
+		return out
 
 	def getMaxPowerProduction(self, filterId=None):
 		"""
@@ -159,7 +198,7 @@ class Network:
 		- For solar panel, max-power = current-power.
 		- For public power grid, it's usually a constant.
 		"""
-		return self._sumNodesValues(filterId, "inout", (lambda x: x.getMaxPower()))
+		return self.getSnapshot().getMaxPower(self._getMask(filterId))
 
 	def getMaxPowerConsumption(self):
 		"""
@@ -168,45 +207,28 @@ class Network:
 		- Add global power consumption
 		- Add nodes maxPower and substract there currentPower (count in global power)
 		"""
-		globalPower = self.getCurrentPower()
-		for elem in self.getAll("out"):
-			if elem.isOn():
-				globalPower += elem.getMaxPower() - elem.getCurrentPower()
-		return globalPower
+		return self.getSnapshot().getMaxPowerConsumption()
 
 	def getMinPower(self, filterId=None):
 		"""
 		Get current minimum power consumption possible.
 		0 mean, we can't give back power to network grid.
 		"""
-		return self._sumNodesValues(filterId, "inout", (lambda x: x.getMinPower()))
+		return self.getSnapshot().getMinPower(self._getMask(filterId))
 
 	def getMarginPower(self, filterId=None):
 		"""
 		Return margin power
 		(Power to keep before considering extrem value)
 		"""
-		if filterId is None:
-			filterId = "inout"
-		vals = [x.getMarginPower() for x in self.getAll(filterId)]
-		return 0 if not vals else max(vals)
+		return self.getSnapshot().getMarginPower(self._getMask(filterId))
 
 	def getMarginPowerOn(self):
 		"""
 		Get how many power we can add safely
 		"""
-		if self._loopNbMarginPowerOn != self._loopNb:
-			# The maximum production before black-out
-			maxPowerP = self.getMaxPowerProduction()
-			# The consumption if every switched on devices consume at max capability
-			currentPower = self.getCurrentPower()
-			maxPowerC = self.getMaxPowerConsumption()
-			marginPower = self.getMarginPower()
-			marginA = maxPowerP-(currentPower+marginPower)
-			marginB = maxPowerP-maxPowerC # Maybe is it too safe?
-			self._marginPowerOn = min(marginA, marginB)
-			self._loopNbMarginPowerOn = self._loopNb
-		return self._marginPowerOn
+		loadRise = self.getLoadRise() if self._anticipateLoad else 0
+		return self.getSnapshot().getMarginPowerOn(loadRise)
 
 	def getMarginPowerOff(self):
 		"""
@@ -255,6 +277,99 @@ class Network:
 		"""
 		self._loopNb += 1
 		self.networkUpdater.updateNetwork()
+		self.networkUpdater.invalidateFeeders(self.networkUpdater.getChangedIds())
+		self.getSnapshot()
+
+	def updateSafetyStates(self):
+		"""
+		Refresh only current power of InOutNode (Grid, solar panels...)
+		 for the fast safety loop, and switches states (Changed by strategies since the loop).
+		 The snapshot of the cycle is updated with new values.
+		return: True if a value changed.
+		"""
+		nodes = self.getAll("inout")
+		entityIds = []
+		for node in nodes:
+			feeder = node.getFeeder("currentPower")
+			if isinstance(feeder, SourceFeeder):
+				entityIds.append(feeder.nameid)
+		changedIds = self.networkUpdater.refreshEntities(entityIds)
+		if changedIds:
+			self.networkUpdater.invalidateFeeders(changedIds, newCycle=False)
+		else:
+			nodes = []
+		snapshot = self.getSnapshot()
+		outNodes = self.getAll("out")
+		isOnChanged = any(snapshot.isOn[snapshot.index[node.id]]!=node.isOn()
+			for node in outNodes)
+		if not changedIds and not isOnChanged:
+			return False
+		self._snapshot = snapshot.refresh(nodes, outNodes)
+		return True
+
+	async def updateStatesAsync(self):
+		"""
+		Asyncio variant of updateStates()
+		"""
+		self._loopNb += 1
+		await self.networkUpdater.updateNetworkAsync()
+		self.networkUpdater.invalidateFeeders(self.networkUpdater.getChangedIds())
+		self.getSnapshot()
+
+	async def flushSwitchesAsync(self):
+		"""
+		Asyncio variant of flushSwitches()
+		"""
+		return await self.networkUpdater.flushSwitchQueueAsync()
+
+	def deferNotifications(self):
+		"""
+		Keep notifications until flushNotificationsAsync()
+		"""
+		self.notificationManager.defer()
+
+	async def flushNotificationsAsync(self):
+		"""
+		Send kept notifications concurrently.
+		"""
+		messages = self.notificationManager.popDeferred()
+		await asyncio.gather(*[self.networkUpdater.notifyAsync(m) for m in messages])
+
+	def getContracts(self):
+		"""
+		Return contracts of public power grids.
+		"""
+		return [node.getContract() for node in self.getAll("publicpowergrid")
+			if node.getContract() is not None]
+
+	def getChangedEntities(self):
+		"""
+		Return the set of entities ids whose value changed this cycle,
+		 so callers can skip work when nothing they use changed.
+		 None if unknown : then consider all may have changed.
+		"""
+		return self.networkUpdater.getChangedIds()
+
+	def getStaleness(self):
+		"""
+		Return how old (in seconds) are the nodes values
+		 (When the network updater fail to refresh them, last known values are used).
+		 None if they never have been updated.
+		"""
+		return self.networkUpdater.getStaleness()
+
+	def queueSwitches(self):
+		"""
+		Collect nodes switch commands until flushSwitches()
+		"""
+		self.networkUpdater.openSwitchQueue()
+
+	def flushSwitches(self):
+		"""
+		Send collected nodes switch commands.
+		return: list of nodes witch failed to switch
+		"""
+		return self.networkUpdater.flushSwitchQueue()
 
 	def isGridSourceOn(self):
 		"""
@@ -281,19 +396,7 @@ class Network:
 		"""
 		Return list of nodes for a strategy
 		"""
-		# self.logger.debug("getNodesForStrategy(%s)", strategyId)
-		key = "strategy_"+strategyId
-		nodes = self._filteredNodesCache.get(key, None)
-		if nodes is None:
-			# self.logger.debug("getNodesForStrategy() : generate cache")
-			nodes = []
-			for node in self.getAll("switch"):
-				strategy = node.getStrategyId()
-				if strategy is None or strategy==strategyId:
-					nodes.append(node)
-			self._filteredNodesCache[key] = nodes
-			# self.logger.debug("getNodesForStrategy(%s) = %s", strategyId, nodes)
-		return nodes
+		return self._registry.getForStrategy(strategyId)
 
 	def getHoursRanges(self):
 		"""
@@ -338,6 +441,26 @@ class Network:
 		"""
 		return self.server.getTime()
 
+	def getLoopTimings(self):
+		"""
+		Return rolling statistics of each server loop phase.
+		"""
+		if self.server is None:
+			return {}
+		return self.server.getLoopTimings()
+
+	def getLatencies(self):
+		"""
+		Return latency statistics of each endpoint of the network updater.
+		"""
+		return self.networkUpdater.getLatencies()
+
+	def listEntities(self, refresh=False):
+		"""
+		Return a list of all entities ids available for nodes.
+		"""
+		return self.networkUpdater.listEntities(refresh)
+
 	def listComponents(self):
 		"""
 		Return a list of all components in the network.
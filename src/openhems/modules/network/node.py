@@ -3,13 +3,13 @@ Represent device of home network
 """
 
 import dataclasses
+import datetime
 import logging
 from enum import Enum
 from typing import Final
-import threading
-from collections import OrderedDict # , deque
+from collections import OrderedDict
 from openhems.modules.util import CastUtililty, ConfigurationException
-from .feeder import Feeder
+from .feeder import Feeder, SourceFeeder, StateFeeder
 
 CYCLE_HISTORY: Final[int] = 10 # Number of cycle we keep history
 logger = logging.getLogger(__name__)
@@ -52,16 +52,19 @@ class ApplianceConstraints():
 	"""
 	Appliance constraints : Constraints to always chek when the appliance is on
 	or before switching on/off.
+	Checks are done when the node power or state change, or when a duration is reached
+	 (See registerTimers()).
 	"""
 	def __init__(self, configuration:dict):
 		self.minPower = configuration.get('minPower', None)
 		self.minPowerDelay = configuration.get('minPowerDelay', None)
-		self._minPowerDuration = 0
+		self._minPowerSince = None # Time since currentPower<minPower
 		self.maxPower = configuration.get('maxPower', None)
 		# durations are in seconds
 		self.durationConstraint = DurationConstraint(configuration)
-		self._duration = 0
+		self._since = None # Time of last switch
 		self._isOn = None # Feeder to test if switch is on.
+		self._scheduler = None
 		self.node = None
 
 	def setNode(self, node):
@@ -70,14 +73,61 @@ class ApplianceConstraints():
 		"""
 		self.node = node
 
-	def check(self, time:int) -> bool:
+	def registerTimers(self, scheduler):
 		"""
-		:return: max power of the appliance
+		Ask the server DeadlineScheduler to wake up when node power/state change.
+		"""
+		self._scheduler = scheduler
+		if self.minPower is not None or self.maxPower is not None:
+			scheduler.wakeOnChange(self, self.node.getFeeder("currentPower"))
+		isOnFeeder = self.node.getFeeder("isOn")
+		if isOnFeeder is not None:
+			scheduler.wakeOnChange(self, isOnFeeder)
+		scheduler.wakeSoon(self)
+
+	def getDuration(self, now=None):
+		"""
+		Return duration (seconds) since last switch (0 if unknown).
+		"""
+		if now is None and self._scheduler is not None:
+			now = self._scheduler.getTime()
+		if now is None or self._since is None:
+			return 0
+		return (now-self._since).total_seconds()
+
+	def wakeUp(self, now):
+		"""
+		Called by the DeadlineScheduler : check constraints.
+		"""
+		if self._since is None:
+			self._since = now
+		self.check(now)
+
+	def _wakeAt(self, deadlines):
+		if self._scheduler is not None:
+			deadlines = [d for d in deadlines if d is not None]
+			self._scheduler.wakeAt(self, min(deadlines) if deadlines else None)
+
+	def _addSeconds(self, since, seconds):
+		if since is None or seconds is None:
+			return None
+		return since + datetime.timedelta(seconds=seconds)
+
+	def check(self, now) -> bool:
+		"""
+		Check constraints and set the next time they should be checked.
 		"""
 		# logger.debug("ApplianceConstraints.check(%s)", self.node.id)
 		# TODO : need a warning on HA network.notify()?
 		message = f"For node {self.node.name} : "
-		self._isOn = self.node.isOn()
+		isOn = self.node.isOn()
+		if self._isOn is not None and isOn!=self._isOn: # Switched outside OpenHEMS
+			self._since = now
+			self._minPowerSince = None
+		self._isOn = isOn
+		duration = self.getDuration(now)
+		maxDuration = self.durationConstraint.maxOn if isOn else self.durationConstraint.maxOff
+		deadlines = [self._addSeconds(self._since, maxDuration)]
 		if self._isOn and (self.minPower is not None or self.maxPower is not None):
 			logger.debug("Check power constraints for node %s witch is on ", self.node.name)
 			currentPower = self.node.getCurrentPower()
@@ -85,66 +135,70 @@ class ApplianceConstraints():
 				logger.error("Unable to get currentPower (None) for node %s.", self.node.name)
 			else:
 				if self.minPower is not None and currentPower<self.minPower:
-					self._minPowerDuration += time
-					if self.minPowerDelay is None or self._minPowerDuration>=self.minPowerDelay:
-						message += ("Offending minPower (%s) < currentPower (%s) during more than %s seconds.",
-				  			self.minPower, currentPower, self.minPowerDelay)
+					if self._minPowerSince is None:
+						self._minPowerSince = now
+					lowDuration = (now-self._minPowerSince).total_seconds()
+					if self.minPowerDelay is None or lowDuration>=self.minPowerDelay:
+						message += (f"Offending minPower ({self.minPower}) > currentPower "
+							f"({currentPower}) during more than {self.minPowerDelay} seconds.")
 						# self.node.switchOn(False) # Maybe is just starting, if switch off,
 						# we may offend minDurationOn
+						self._wakeAt(deadlines)
 						raise ConstraintsException(message, ConstraintsType.MIN_POWER)
 					logger.debug("Current power (%s) < minPower (%s) for %s seconds, need %s seconds for alert",
-						currentPower, self.minPower, self._minPowerDuration, self.minPowerDelay)
+						currentPower, self.minPower, lowDuration, self.minPowerDelay)
+					deadlines.append(self._addSeconds(self._minPowerSince, self.minPowerDelay))
 				else:
-					self._minPowerDuration = 0
+					self._minPowerSince = None
 					# logger.debug("No minPower pb")
 				if self.maxPower is not None and currentPower>self.maxPower:
 					message += f"Offending maxPower ({self.maxPower}) < currentPower ({currentPower})"
 					self.node.switchOn(False)
+					self._wakeAt([now]) # Check again next time if the switch failed
 					raise ConstraintsException(message, ConstraintsType.MAX_POWER)
 		if self._isOn:
 			# logger.debug("Check duration constraints for node %s witch is on", self.node.name)
-			if self.durationConstraint.maxOn is not None and self._duration>self.durationConstraint.maxOn:
+			if maxDuration is not None and duration>=maxDuration:
 				message += ("Offending maxDurationOn "
-					f"({self.durationConstraint.maxOn}) < currentDuration ({self._duration})")
+					f"({maxDuration}) < currentDuration ({duration})")
 				self.node.switchOn(False)
+				self._wakeAt([now]) # Check again next time if the switch failed
 				raise ConstraintsException(message, ConstraintsType.MAX_DURATION_ON)
 		else:
 			# logger.debug("Check duration constraints for node %s witch is off", self.node.name)
-			if self.durationConstraint.maxOff is not None and self._duration>self.durationConstraint.maxOff:
+			if maxDuration is not None and duration>=maxDuration:
 				message += ("Offending maxDurationOff "
-					f"({self.durationConstraint.maxOff}) < currentDuration ({self._duration})")
+					f"({maxDuration}) < currentDuration ({duration})")
 				self.node.switchOn(True)
+				self._wakeAt([now]) # Check again next time if the switch failed
 				raise ConstraintsException(message, ConstraintsType.MAX_DURATION_OFF)
+		self._wakeAt(deadlines)
 		return True
 
 	def switch(self, on):
 		"""
 		Check durations constraints and reset durations
 		"""
+		duration = self.getDuration()
 		if self._isOn:
 			if (self.durationConstraint.minOn is not None \
-				and self._duration<self.durationConstraint.minOn and not on):
+				and duration<self.durationConstraint.minOn and not on):
 				message = ("Offending minDurationOn "
-					f"({self.durationConstraint.minOn}) > currentDuration ({self._duration}).")
+					f"({self.durationConstraint.minOn}) > currentDuration ({duration}).")
 				raise ConstraintsException(message, ConstraintsType.MIN_DURATION_ON)
 		else:
 			if (self.durationConstraint.minOff is not None \
-					and self._duration<self.durationConstraint.minOff and on):
+					and duration<self.durationConstraint.minOff and on):
 				message = ("Offending minDurationOff "
-					f"({self.durationConstraint.minOff}) > currentDuration ({self._duration}).")
+					f"({self.durationConstraint.minOff}) > currentDuration ({duration}).")
 				raise ConstraintsException(message, ConstraintsType.MIN_DURATION_OFF)
 		self._isOn = on
-		self._duration = 0
-		self._minPowerDuration = 0
+		self._minPowerSince = None
+		if self._scheduler is not None:
+			self._since = self._scheduler.getTime()
+			self._scheduler.wakeSoon(self) # Deadlines changed
 		return True
 
-	def decrementTime(self, time:int):
-		"""
-		Decrease time of schedule and return remaining time.
-		"""
-		self._duration += time
-		self.check(time)
-
 	def __str__(self):
 		retValue = "ApplianceConstraints("
 		sep =""
@@ -176,17 +230,22 @@ class OnNodeManager:
 	"""
 	Manage node on state
 	"""
+	__slots__ = ("_node", "_isOn", "_wasOn", "_wasOnCycleId", "_pending")
+
 	def __init__(self, node, feeder):
 		self._node = node
 		self._isOn:Feeder = feeder
 		self._wasOn:bool = False # Used to detect change of state
 		self._wasOnCycleId:int = -1
+		self._pending = None # Wanted state of a queued switch command not sent yet.
 
 	def getValue(self):
 		"""
 		Return if node is on or off.
 		Detect if .
 		"""
+		if self._pending is not None:
+			return self._pending
 		retValue = self._isOn.getValue()
 		if retValue!=self._wasOn and self._wasOnCycleId!=self._node.network.getCycleId():
 			logger.debug(
@@ -204,6 +263,12 @@ class OnNodeManager:
 		"""
 		self._isOn.setValue(value)
 
+	def getFeeder(self):
+		"""
+		Return the feeder giving on/off state.
+		"""
+		return self._isOn
+
 	def switchOn(self, connect:bool):
 		"""
 		Switch on/off the node.
@@ -211,10 +276,18 @@ class OnNodeManager:
 		self._wasOn = connect
 		self._wasOnCycleId = self._node.network.getCycleId()
 
+	def setPending(self, connect):
+		"""
+		Set the wanted state of a queued switch command (None when sent or dropped).
+		"""
+		self._pending = connect
+
 class PowerControler:
 	"""
 	Manage node power control
 	"""
+	__slots__ = ("_feeder", "_values", "_node")
+
 	def __init__(self, feeder, values=None, node=None):
 		self._feeder:Feeder = feeder
 		self._values = values # dict of urrentPower from asked controlled power (level).
@@ -315,8 +388,11 @@ class PowerControler:
 
 class Node:
 	"""
-	Represent device of home network
+	Represent device of home network.
+	Slot-based, as simulations can hold thousands of nodes.
 	"""
+	__slots__ = ("id", "name", "network", "_powerController", "_currentPower", "_maxPower",
+		"_isOn", "_isActivate", "_constraints", "lock")
 	MAXNUM_CONTROLED_POWER_VALUES = 256
 	def setId(self, haId):
 		"""
@@ -337,12 +413,10 @@ class Node:
 		self._currentPower:Feeder = currentPower
 		self._maxPower:Feeder = maxPower
 		self._isOn:OnNodeManager = OnNodeManager(self, isOnFeeder) if isOnFeeder is not None else None
-		# To try predict power. Useless today.
-		# self._previousPower = deque()
 		# Security
 		self._isActivate = True # Can inactivate node for security reasons.
 		self._constraints = None
-		self.lock = threading.Lock() # Used to avoid concurrency pb on schedule and constraints
+		self.lock = None # Created only by nodes with a schedule (See Switch)
 		try: # Test if currentPower is well configured
 			self.getCurrentPower()
 		except TypeError as e:
@@ -355,6 +429,8 @@ class Node:
 		"""
 		if sourceType=="currentPower":
 			return self._currentPower
+		if sourceType=="isOn" and self._isOn is not None:
+			return self._isOn.getFeeder()
 		return None
 
 	def getTime(self):
@@ -363,15 +439,6 @@ class Node:
 		"""
 		return self.network.getTime()
 
-	# def _setCurrentPower(self, currentPower):
-	# 	"""
-	# 	Set current power.
-	# 	"""
-	# 	if len(self._previousPower)>=CYCLE_HISTORY:
-	# 		self._previousPower.popleft()
-	# 	self._previousPower.append(self._currentPower)
-	# 	self._currentPower = currentPower
-
 	def getCurrentPower(self):
 		"""
 		Get current power 
@@ -394,36 +461,17 @@ class Node:
 		"""
 		return self._maxPower.getValue()
 
-	# def _estimateNextPower(self):
-	# 	"""
-	# 	Estimate what could be the next value of currentPower if there is no change
-	#
-	# 	This function would like to know if there is a constant
-	# 	 growing/decreasing value or a random one or oscilating one...
-	# 	:return list[int]: [minValue, bestBet, maxValue]
-	# 	"""
-	# 	p0 = self._currentPower
-	# 	maxi = len(self._previousPower)
-	# 	summ = 0
-	# 	lastDiff = 0
-	# 	maxDiff = 0
-	# 	for i in reversed(range(0, maxi)):
-	# 		p1 = self._previousPower[i]
-	# 		diff = p1-p0
-	# 		if i==maxi:
-	# 			lastDiff = diff
-	# 		maxDiff = max(maxDiff, abs(diff))
-	# 		summ += diff
-	# 		p0 = p1
-	# 	avgDiff = summ/maxi
-	# 	if avgDiff>0 and lastDiff>2*avgDiff \
-	# 			or avgDiff<0 and lastDiff<2*avgDiff:
-	# 		curDiff = lastDiff
-	# 	else:
-	# 		curDiff = avgDiff
-	# 	return [self._currentPower-abs(maxDiff),\
-	# 		self._currentPower+curDiff,\
-	# 		self._currentPower+abs(maxDiff)]
+	def estimateNextPower(self):
+		"""
+		Estimate what could be the next value of currentPower if there is no change
+		 (From the network power history).
+		:return list[int]: [minValue, bestBet, maxValue]
+		"""
+		estimate = self.network.getPowerHistory().getEstimate(self.id)
+		if estimate is None:
+			currentPower = self.getCurrentPower()
+			return [currentPower, currentPower, currentPower]
+		return estimate
 
 	def isControlledPower(self):
 		"""
@@ -504,7 +552,7 @@ class Node:
 					logger.warning("Cancel switch %s '%s' due to constraints : %s",
 						"on" if connect else "off", self.id, e.message)
 					return not connect
-			ok = self.network.networkUpdater.switchOn(connect, self)
+			ok = self.network.networkUpdater.queueSwitchOn(connect, self)
 			if ok==connect:
 				self._isOn.switchOn(ok)
 			if ok and register is not None:
@@ -513,6 +561,24 @@ class Node:
 		logger.warning("Try to switchOn/Off a not switchable device : %s", self.id)
 		return connect # Consider node is always on network
 
+	def setSwitchResult(self, isOn:bool):
+		"""
+		Set the real state after a queued switch command was sent.
+		"""
+		if self._isOn is not None:
+			self._isOn.setPending(None)
+			if isinstance(self._isOn.getFeeder(), (SourceFeeder, StateFeeder)):
+				self._isOn.setValue(isOn)
+			self._isOn.switchOn(isOn)
+
+	def setPendingSwitch(self, isOn):
+		"""
+		Set the wanted state of a queued switch command (None if dropped).
+		 Until it is sent, isOn() return this wanted state.
+		"""
+		if self._isOn is not None:
+			self._isOn.setPending(isOn)
+
 	def getConstraints(self):
 		"""
 		Return schedule
@@ -0,0 +1,150 @@
+"""
+Registry of the network nodes, with indexes kept up to date
+ when nodes are added, removed or reprioritised.
+"""
+
+import bisect
+from .outnode import OutNode, Switch
+from .inoutnode import (
+	InOutNode, PublicPowerGrid, SolarPanel, Battery
+)
+
+# Type indexes maintained by NodeRegistry
+TYPE_FILTERS = {
+	"inout" : InOutNode,
+	"out" : OutNode,
+	"switch" : Switch,
+	"publicpowergrid" : PublicPowerGrid,
+	"battery" : Battery,
+	"solarpanel" : SolarPanel,
+}
+
+class PriorityIndex:
+	"""
+	List of switchs sorted by decreasing priority.
+	 For equal priority, nodes keep their insertion order.
+	"""
+	def __init__(self):
+		self.nodes = []
+		self._keys = [] # -priority of each node, sorted ascending
+
+	def add(self, node):
+		"""
+		Insert node at it's place according to it's priority.
+		"""
+		key = -node.getPriority()
+		pos = bisect.bisect_right(self._keys, key)
+		self._keys.insert(pos, key)
+		self.nodes.insert(pos, node)
+
+	def remove(self, node):
+		"""
+		Remove node (Compared by identity, as it's priority may have changed).
+		return: False if node was not in the list.
+		"""
+		for pos, elem in enumerate(self.nodes):
+			if elem is node:
+				del self._keys[pos]
+				del self.nodes[pos]
+				return True
+		return False
+
+class NodeRegistry:
+	"""
+	Keep network nodes with indexes :
+	- by type (see TYPE_FILTERS), switchs are sorted by priority
+	- switchs by strategy (Switch without strategy are for all strategies)
+	- by id
+	"""
+	def __init__(self, logger):
+		self.logger = logger
+		self.nodes = []
+		self._byId = {}
+		self._byType = {filterId:[] for filterId in TYPE_FILTERS}
+		self._switchs = PriorityIndex()
+		self._byType["switch"] = self._switchs.nodes
+		self._byStrategy = {} # PriorityIndex built on first request of each strategy
+		self.version = 0 # Incremented on each add/remove
+
+	def add(self, node):
+		"""
+		Add a node to registry and indexes.
+		"""
+		if node.id in self._byId:
+			self.logger.warning("NodeRegistry.add() : duplicated node id '%s'.", node.id)
+		self.nodes.append(node)
+		self.version += 1
+		self._byId[node.id] = node
+		for filterId, nodeType in TYPE_FILTERS.items():
+			if isinstance(node, nodeType) and filterId!="switch":
+				self._byType[filterId].append(node)
+		if isinstance(node, Switch):
+			self._switchs.add(node)
+			for strategyId, index in self._byStrategy.items():
+				if self._isForStrategy(node, strategyId):
+					index.add(node)
+		return node
+
+	def remove(self, node):
+		"""
+		Remove a node from registry and indexes.
+		return: False if the node was not registered.
+		"""
+		if self._byId.get(node.id, None) is not node:
+			return False
+		del self._byId[node.id]
+		self.nodes.remove(node)
+		self.version += 1
+		for filterId, nodeType in TYPE_FILTERS.items():
+			if isinstance(node, nodeType) and filterId!="switch":
+				self._byType[filterId].remove(node)
+		if isinstance(node, Switch):
+			self._switchs.remove(node)
+			for index in self._byStrategy.values():
+				index.remove(node)
+		return True
+
+	def reprioritise(self, node):
+		"""
+		Move a switch whose priority changed to it's new place.
+		return: False if the node was not registered.
+		"""
+		if self._byId.get(node.id, None) is not node:
+			return False
+		for index in [self._switchs] + list(self._byStrategy.values()):
+			if index.remove(node):
+				index.add(node)
+		return True
+
+	def get(self, nodeId, default=None):
+		"""
+		Return the node with this id.
+		"""
+		return self._byId.get(nodeId, default)
+
+	def getAll(self, filterId):
+		"""
+		Return nodes of a type (See TYPE_FILTERS), all nodes if filterId is "".
+		 None if filterId is unknown.
+		"""
+		if filterId=="":
+			return self.nodes
+		return self._byType.get(filterId, None)
+
+	def getForStrategy(self, strategyId):
+		"""
+		Return switchs (sorted by priority) managed by a strategy.
+		"""
+		index = self._byStrategy.get(strategyId, None)
+		if index is None:
+			index = PriorityIndex()
+			for node in self._switchs.nodes:
+				if self._isForStrategy(node, strategyId):
+					index.add(node)
+			self._byStrategy[strategyId] = index
+		return index.nodes
+
+	@staticmethod
+	def _isForStrategy(node, strategyId):
+		nodeStrategyId = node.getStrategyId()
+		return nodeStrategyId is None or nodeStrategyId==strategyId
@@ -3,28 +3,34 @@ Represent appliance of home network: Devices consumming electricity.
 """
 
 import logging
+import threading
 from openhems.modules.network.schedule import OpenHEMSSchedule
 from openhems.modules.util import ConfigurationException
-from .feeder import Feeder, FakeSwitchFeeder
+from .feeder import DerivedFeeder, FakeSwitchFeeder
 from .node import Node
 
 logger = logging.getLogger(__name__)
 
-class GuessIsOnFeeder(Feeder):
+class GuessIsOnFeeder(DerivedFeeder):
 	"""
 	Guess if node is on with currentPower. Usefull for not home-automationable devices.
 	We can just add a connected plug.
+	It is computed again only on new cycle or when the node currentPower changed.
 	"""
+	__slots__ = ("_value", "_nbCycleWithoutPower", "_lastCycleId", "nbCycleWithoutPowerForOff",
+		"_input")
+
 	def __init__(self, source, nbCycleWithoutPowerForOff=1):
 		"""
 		:param source: The node source of power with network.getCycleId() and getCurrentPower().
 		:param nbCycleWithoutPowerForOff:
 			number of cycle without power before we consider the device is off
 		"""
-		super().__init__(source)
+		super().__init__(False)
 		self._value = source
 		self._nbCycleWithoutPower = 0
 		self._lastCycleId = -1
+		self._input = None # currentPower feeder we depend on
 		# Number of cycle without power before we consider the device is off
 		self.nbCycleWithoutPowerForOff = nbCycleWithoutPowerForOff
 
@@ -32,13 +38,24 @@ class GuessIsOnFeeder(Feeder):
 		"""
 		Return True if the device is on (consuming power).
 		"""
+		currentPower = self._value.getFeeder("currentPower")
+		if currentPower is not self._input:
+			self._input = currentPower
+			currentPower.addDependent(self)
+			self._dirty = True
+		if self._lastCycleId!=self._value.network.getCycleId():
+			self._dirty = True
+		return super().getValue()
+
+	def compute(self):
+		cycleId = self._value.network.getCycleId()
+		newCycle = self._lastCycleId!=cycleId
+		self._lastCycleId = cycleId
 		if self._value.getCurrentPower()>0:
 			self._nbCycleWithoutPower = 0
 			return True
-		cycleId = self._value.network.getCycleId()
-		if self._lastCycleId!=cycleId:
+		if newCycle:
 			self._nbCycleWithoutPower += 1
-			self._lastCycleId=cycleId
 		return self._nbCycleWithoutPower<self.nbCycleWithoutPowerForOff
 
 	def __str__(self):
@@ -55,6 +72,8 @@ class OutNode(Node):
 	This is usefull for appliances not switchable by home automation but wich can consum a lot.
 	This is to take care of their max consumption in OpenHEMSServer.check() to avoid over-load.
 	"""
+	__slots__ = ()
+
 	def __init__(self, nameId, currentPower, maxPower, *, network=None, nbCycleWithoutPowerForOff=0):
 		isOn = GuessIsOnFeeder(self, nbCycleWithoutPowerForOff)
 		super().__init__(nameId, currentPower, maxPower, network=network, isOnFeeder=isOn)
@@ -88,11 +107,14 @@ class Switch(OutNode):
 	Electricity consumer (like washing-machine, water-heater)
 	wich can be switch on/off.
 	"""
+	__slots__ = ("schedule", "strategyId", "_priority")
+
 	def __init__(self, node, isOnFeeder=None, *, strategyId=None, priority=50):
 		if isOnFeeder is None:
 			raise ConfigurationException("Declare a Switch() but without seting isOn.")
 		super(OutNode, self).__init__(node.name, node._currentPower, node._maxPower,
 								isOnFeeder=isOnFeeder, network=node.network)
+		self.lock = threading.Lock() # Used to avoid concurrency pb on schedule
 		self.schedule = OpenHEMSSchedule(self.id, self.name, self)
 		if strategyId is None:
 			strategyId = self.network.getDefaultStrategy().id
@@ -104,7 +126,7 @@ class Switch(OutNode):
 		:sourceType: Availables are "isOn", "currentPower"
 		"""
 		if sourceType=="isOn":
-			return self._isOn
+			return self._isOn.getFeeder()
 		return super().getFeeder(sourceType)
 
 	def isSwitchable(self):
@@ -123,6 +145,14 @@ class Switch(OutNode):
 		"""
 		return self._priority
 
+	def setPriority(self, priority:int):
+		"""
+		Change the level of priority (Keep network switchs order up to date).
+		"""
+		self._priority = priority
+		if self.network is not None:
+			self.network.reprioritiseNode(self)
+
 	def getSchedule(self):
 		"""
 		Return schedule
@@ -0,0 +1,91 @@
+"""
+History of the nodes current power on last cycles,
+ to estimate what could be the next values.
+"""
+
+import numpy as np
+from .node import CYCLE_HISTORY
+
+class PowerHistory:
+	"""
+	Ring buffer of the last nodes current power (One row per cycle, one column per node).
+	 The buffer is preallocated, and columns are remapped only when nodes change.
+	"""
+	def __init__(self, size=CYCLE_HISTORY):
+		self.size = size
+		self.ids = ()
+		self._index = {}
+		self._buffer = np.zeros((size, 0))
+		self._pos = 0 # Next row to write
+		self._count = 0 # Number of rows written (<= size)
+
+	def _remap(self, ids):
+		"""
+		Keep history of nodes still present when the nodes list changed.
+		return: columns of new nodes.
+		"""
+		buffer = np.zeros((self.size, len(ids)))
+		newCols = []
+		for col, nodeId in enumerate(ids):
+			oldCol = self._index.get(nodeId, None)
+			if oldCol is None:
+				newCols.append(col)
+			else:
+				buffer[:, col] = self._buffer[:, oldCol]
+		self._buffer = buffer
+		self.ids = tuple(ids)
+		self._index = {nodeId:col for col, nodeId in enumerate(self.ids)}
+		return newCols
+
+	def add(self, ids, values):
+		"""
+		Add current power of nodes (values are ordered like ids).
+		 A new node history is considered flat (filled with it's first value).
+		"""
+		newCols = []
+		if tuple(ids)!=self.ids:
+			newCols = self._remap(ids)
+		self._buffer[self._pos] = values
+		if newCols:
+			self._buffer[:, newCols] = self._buffer[self._pos, newCols]
+		self._pos = (self._pos+1) % self.size
+		self._count = min(self._count+1, self.size)
+
+	def getSamples(self):
+		"""
+		Return samples from the oldest to the last (2-D array: cycles x nodes).
+		"""
+		rows = (self._pos - self._count + np.arange(self._count)) % self.size
+		return self._buffer[rows]
+
+	def estimateNextPower(self):
+		"""
+		Estimate what could be the next value of currentPower of all nodes if there is no change.
+		 It try to know if there is a constant growing/decreasing value,
+		 or a random one or oscilating one...
+		:return: (minimum, bestBet, maximum) arrays ordered like ids.
+		"""
+		samples = self.getSamples()
+		if self._count==0:
+			empty = np.zeros(len(self.ids))
+			return empty, empty, empty
+		current = samples[-1]
+		if self._count<2:
+			return current, current, current
+		diffs = np.diff(samples, axis=0)
+		maxDiff = np.abs(diffs).max(axis=0)
+		avgDiff = diffs.mean(axis=0)
+		lastDiff = diffs[-1]
+		trend = ((avgDiff>0) & (lastDiff>2*avgDiff)) | ((avgDiff<0) & (lastDiff<2*avgDiff))
+		curDiff = np.where(trend, lastDiff, avgDiff)
+		return current-maxDiff, current+curDiff, current+maxDiff
+
+	def getEstimate(self, nodeId):
+		"""
+		Return [minimum, bestBet, maximum] estimates of next currentPower of a node.
+		 None if the node has no history.
+		"""
+		col = self._index.get(nodeId, None)
+		if col is None:
+			return None
+		return [float(values[col]) for values in self.estimateNextPower()]
@@ -24,6 +24,7 @@ class OpenHEMSSchedule:
         self.duration:int = duration
         self.logger = logging.getLogger(__name__)
         self.strategy_cache = {}
+        self.version = 0 # Incremented on each set_schedule() to wake up strategies
         self._condition = None
         self.node = node
         self.lock = node.lock if node is not None and node.lock is not None else threading.Lock()
@@ -89,11 +90,12 @@ class OpenHEMSSchedule:
         if timeout is not None and not isinstance(timeout, datetime.datetime):
             timeout = CastUtililty.toTypeDatetime(timeout)
         if not isinstance(duration, int):
-            timeout = CastUtililty.toTypeInt(duration)
+            duration = CastUtililty.toTypeInt(duration)
         with self.lock:
             self.duration = duration
             self.timeout = timeout
             self.strategy_cache = {}
+            self.version += 1
 
     def get_strategy_cache(self, strategy_id):
         """
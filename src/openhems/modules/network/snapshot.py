@@ -0,0 +1,119 @@
+"""
+Immutable struct-of-arrays view of the network nodes values for one cycle.
+ All network aggregates are computed from it with NumPy.
+"""
+
+import copy
+import numpy as np
+from .outnode import OutNode, Switch
+from .inoutnode import InOutNode
+from .node_registry import TYPE_FILTERS
+
+def _readOnly(values, dtype=float):
+	array = np.array(values, dtype=dtype)
+	array.flags.writeable = False
+	return array
+
+class NetworkSnapshot:
+	"""
+	Values of all nodes read once per cycle, indexed by node position
+	 (Same order as Network.getAll("")).
+	Arrays: currentPower, maxPower, minPower, marginPower, isOn, priority.
+	 minPower/marginPower are 0 for OutNode, isOn is False for InOutNode
+	 and priority is -1 for not switchable nodes.
+	"""
+	__slots__ = ("cycleId", "ids", "index", "currentPower", "maxPower", "minPower",
+		"marginPower", "isOn", "priority", "_masks")
+
+	def __init__(self, nodes, cycleId=-1):
+		self.cycleId = cycleId
+		self.ids = tuple(node.id for node in nodes)
+		self.index = {nodeId:i for i, nodeId in enumerate(self.ids)}
+		self.currentPower = _readOnly([node.getCurrentPower() for node in nodes])
+		self.maxPower = _readOnly([node.getMaxPower() for node in nodes])
+		self.minPower = _readOnly([node.getMinPower() if isinstance(node, InOutNode) else 0
+			for node in nodes])
+		self.marginPower = _readOnly([node.getMarginPower() if isinstance(node, InOutNode) else 0
+			for node in nodes])
+		self.isOn = _readOnly([isinstance(node, OutNode) and node.isOn() for node in nodes],
+			dtype=bool)
+		self.priority = _readOnly([node.getPriority() if isinstance(node, Switch) else -1
+			for node in nodes], dtype=int)
+		self._masks = {"": _readOnly([True]*len(nodes), dtype=bool)}
+		for filterId, nodeType in TYPE_FILTERS.items():
+			self._masks[filterId] = _readOnly([isinstance(node, nodeType) for node in nodes],
+				dtype=bool)
+
+	def getMask(self, filterId):
+		"""
+		Return boolean array of nodes in category filterId (See Network.getAll()).
+		 None if filterId is unknown.
+		"""
+		return self._masks.get(filterId, None)
+
+	def getCurrentPower(self, mask):
+		"""
+		Sum of current power of masked nodes.
+		"""
+		return float(self.currentPower[mask].sum())
+
+	def getMaxPower(self, mask):
+		"""
+		Sum of max power of masked nodes.
+		"""
+		return float(self.maxPower[mask].sum())
+
+	def getMinPower(self, mask):
+		"""
+		Sum of min power of masked nodes.
+		"""
+		return float(self.minPower[mask].sum())
+
+	def getMarginPower(self, mask):
+		"""
+		Max of margin power of masked nodes (0 if there is no node).
+		"""
+		values = self.marginPower[mask]
+		return float(values.max()) if values.size else 0
+
+	def getMaxPowerConsumption(self):
+		"""
+		Global consumption if all switched on devices consume at there max.
+		"""
+		out = self._masks["out"] & self.isOn
+		return (self.getCurrentPower(self._masks["inout"])
+			+ float((self.maxPower[out] - self.currentPower[out]).sum()))
+
+	def getMarginPowerOn(self, loadRise=0):
+		"""
+		How many power we can add safely.
+		:loadRise: Consumption increase expected before next cycle.
+		"""
+		inout = self._masks["inout"]
+		# The maximum production before black-out
+		maxPowerP = self.getMaxPower(inout)
+		marginA = maxPowerP-(self.getCurrentPower(inout)+loadRise+self.getMarginPower(inout))
+		# The consumption if every switched on devices consume at max capability
+		marginB = maxPowerP-self.getMaxPowerConsumption() # Maybe is it too safe?
+		return min(marginA, marginB)
+
+	def refresh(self, nodes, outNodes=()):
+		"""
+		Return a copy with currentPower of nodes and isOn of outNodes read again.
+		 Other arrays and masks are shared (Used by the fast safety loop).
+		"""
+		snapshot = copy.copy(self)
+		currentPower = self.currentPower.copy()
+		for node in nodes:
+			currentPower[self.index[node.id]] = node.getCurrentPower()
+		currentPower.flags.writeable = False
+		snapshot.currentPower = currentPower
+		isOn = self.isOn.copy()
+		for node in outNodes:
+			isOn[self.index[node.id]] = node.isOn()
+		isOn.flags.writeable = False
+		snapshot.isOn = isOn
+		return snapshot
+
+	def __len__(self):
+		return len(self.ids)
@@ -11,3 +11,7 @@ from .notification_manager import NotificationManager, MessageHistory
 from .project_configuration import ProjectConfiguration
 from .recorder import Recorder
 from .logging import getLogger, filer, get_log_file_path
+from .circuit_breaker import CircuitBreaker, CircuitState
+from .loop_timings import LoopTimings
+from .deadline_scheduler import DeadlineScheduler
+from .clock import Clock, VirtualClock, getClock, setClock
@@ -5,9 +5,13 @@ Usefull function for standard usages
 import json
 from datetime import datetime, timedelta
 import re
+from .clock import getClock
 
 REGEXP_TIME = re.compile("^([0-9]{1,2})(h|:)([0-9]{1,2})((m|:)[0-9]{2}(s?))?")
-REGEXP_FLOAT = re.compile("^[0-9]+(.[0-9]*)??$")
+REGEXP_FLOAT = re.compile("^-?[0-9]+(.[0-9]*)??$")
+# Home-Assistant states for an entity without value
+UNAVAILABLE_STATES = frozenset(["unavailable", "unknown"])
+TRUE_STATES = frozenset(["on", "true", "1", "vrai"])
 
 
 class CastException(Exception):
@@ -100,7 +104,7 @@ class CastUtililty:
 				m = int(vals[3])
 				s = 0 # TODO : extract
 				if nowtime is None:
-					nowtime = datetime.now()
+					nowtime = getClock().now()
 				retValue = nowtime.replace(hour=h, minute=m, second=s)
 				if nowtime>retValue:
 					retValue = retValue + timedelta(days=1)
@@ -146,6 +150,54 @@ class CastUtililty:
 			raise CastException("Impossible to cat "+str(value)+" to type dict.", 0)
 		return retValue
 
+	@staticmethod
+	def strToInt(value:str):
+		"""
+		Convert a string to integer, without type checks.
+		"""
+		if value.isdigit():
+			return int(value)
+		try:
+			return int(float(value))
+		except (ValueError, OverflowError) as e: # OverflowError on "inf"
+			raise CastException("Incorect string value for int: '"+value+"'", 0) from e
+
+	@staticmethod
+	def strToFloat(value:str):
+		"""
+		Convert a string to float, without type checks.
+		"""
+		try:
+			return float(value)
+		except ValueError as e:
+			raise CastException("Incorect string value for float: '"+value+"'", 0) from e
+
+	@staticmethod
+	def getCaster(destType):
+		"""
+		Return a function doing like toType(destType, value).
+		 It is resolved once (at entity registration) to avoid the type name
+		 comparisons on each value. Strings (Home-Assistant states)
+		 take a fast path and "unavailable"/"unknown" are checked first.
+		"""
+		if destType is None:
+			return lambda value: value
+		casts = CAST_FUNCTIONS.get(destType, None)
+		if casts is None:
+			raise CastException(".getCaster("+str(destType)+") : Unknwon type", 0)
+		toTypeFunc, strFunc, unavailableFunc = casts
+		def caster(value):
+			if value.__class__ is str:
+				if value in UNAVAILABLE_STATES:
+					return unavailableFunc(value)
+				if value=="None":
+					return None
+				return strFunc(value)
+			if value is None:
+				return None
+			return toTypeFunc(value)
+		return caster
+
 	@staticmethod
 	def toType(destType, value):
 		"""
@@ -175,3 +227,18 @@ class CastUtililty:
 		else:
 			raise CastException(".toType("+str(destType)+","+str(value)+") : Unknwon type", 0)
 		return retValue
+
+def _raiseUnavailable(value):
+	raise CastException("'"+value+"'", CastException.UNAVAILABLE)
+
+# destType => (cast function, fast cast function for str, cast for unavailable states)
+CAST_FUNCTIONS = {
+	"int": (CastUtililty.toTypeInt, CastUtililty.strToInt, _raiseUnavailable),
+	"float": (CastUtililty.toTypeFloat, CastUtililty.strToFloat, _raiseUnavailable),
+	"bool": (CastUtililty.toTypeBool, lambda value: value.lower() in TRUE_STATES,
+		lambda value: False),
+	"str": (CastUtililty.toTypeStr, lambda value: value, lambda value: value),
+	"list": (CastUtililty.toTypeList, CastUtililty.toTypeList, _raiseUnavailable),
+	"datetime": (CastUtililty.toTypeDatetime, CastUtililty.toTypeDatetime, _raiseUnavailable),
+	"dict": (CastUtililty.toTypeDict, CastUtililty.toTypeDict, _raiseUnavailable)
+}
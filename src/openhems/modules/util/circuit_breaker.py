@@ -0,0 +1,72 @@
+"""
+Circuit breaker to stop calling a failing service for a while,
+ without blocking the caller (No sleep).
+"""
+
+import time
+from enum import Enum
+
+class CircuitState(Enum):
+	"""
+	States of a circuit breaker.
+	"""
+	CLOSED = 1 # Calls are allowed
+	OPEN = 2 # Calls are refused until retry time
+	HALF_OPEN = 3 # One trial call is allowed
+
+class CircuitBreaker:
+	"""
+	After failureThreshold consecutive failures, the circuit is open:
+	 calls are refused until a retry time. Then one trial call is allowed (half-open):
+	 on success the circuit is closed, on failure it is open again with a doubled delay.
+	:clock: function returning current time in seconds (Usefull for tests).
+	"""
+	def __init__(self, *, failureThreshold=1, retryDelay=2, maxRetryDelay=64, clock=None):
+		self.failureThreshold = failureThreshold
+		self.minRetryDelay = retryDelay
+		self.maxRetryDelay = maxRetryDelay
+		self.clock = time.monotonic if clock is None else clock
+		self.state = CircuitState.CLOSED
+		self.retryDelay = retryDelay
+		self.retryAt = 0
+		self.failures = 0
+
+	def allow(self) -> bool:
+		"""
+		Return True if a call can be done now.
+		"""
+		if self.state==CircuitState.CLOSED:
+			return True
+		if self.state==CircuitState.OPEN and self.clock()>=self.retryAt:
+			self.state = CircuitState.HALF_OPEN
+			return True
+		return False
+
+	def success(self):
+		"""
+		Record a successful call.
+		"""
+		self.state = CircuitState.CLOSED
+		self.failures = 0
+		self.retryDelay = max(self.retryDelay/2, self.minRetryDelay)
+
+	def failure(self):
+		"""
+		Record a failed call.
+		"""
+		self.failures += 1
+		if self.state==CircuitState.HALF_OPEN or self.failures>=self.failureThreshold:
+			self.state = CircuitState.OPEN
+			self.retryAt = self.clock() + self.retryDelay
+			self.retryDelay = min(self.retryDelay*2, self.maxRetryDelay)
+
+	def getRetryIn(self):
+		"""
+		Return seconds before next allowed call (0 if allowed).
+		"""
+		if self.state==CircuitState.OPEN:
+			return max(self.retryAt - self.clock(), 0)
+		return 0
+
+	def __str__(self):
+		return f"CircuitBreaker({self.state.name}, retryIn={self.getRetryIn():.1f})"
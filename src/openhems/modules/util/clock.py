@@ -0,0 +1,97 @@
+"""
+Clock used everywhere we need current time.
+On simulation (or tests) a VirtualClock replace the system one
+ so time move only when we decide it (Without real sleeps).
+"""
+
+import time
+import asyncio
+import datetime
+
+class Clock:
+	"""
+	System clock : real time and real sleeps.
+	"""
+
+	def now(self) -> datetime.datetime:
+		"""
+		Return current datetime.
+		"""
+		return datetime.datetime.now()
+
+	def time(self) -> float:
+		"""
+		Return current timestamp in seconds (Like time.time()).
+		"""
+		return time.time()
+
+	def sleep(self, duration:float):
+		"""
+		Wait duration seconds.
+		"""
+		time.sleep(duration)
+
+	async def sleepAsync(self, duration:float):
+		"""
+		Asyncio variant of sleep().
+		"""
+		await asyncio.sleep(duration)
+
+class VirtualClock(Clock):
+	"""
+	Fake clock for simulation : time is set or advanced explicitly,
+	 sleeps just advance time.
+	"""
+
+	def __init__(self, start:datetime.datetime=None):
+		if start is None:
+			start = datetime.datetime.now().replace(microsecond=0)
+		self._now = start
+
+	def now(self) -> datetime.datetime:
+		return self._now
+
+	def time(self) -> float:
+		return self._now.timestamp()
+
+	def setTime(self, now:datetime.datetime):
+		"""
+		Jump to a datetime.
+		"""
+		self._now = now
+
+	def advance(self, duration:float):
+		"""
+		Move forward of duration seconds.
+		"""
+		self._now += datetime.timedelta(seconds=duration)
+		return self._now
+
+	def sleep(self, duration:float):
+		if duration>0:
+			self.advance(duration)
+
+	async def sleepAsync(self, duration:float):
+		self.sleep(duration)
+		await asyncio.sleep(0)
+
+	def __str__(self):
+		return f"VirtualClock({self._now})"
+
+_clock = Clock()
+
+def getClock() -> Clock:
+	"""
+	Return the clock in use.
+	"""
+	return _clock
+
+def setClock(clock:Clock=None) -> Clock:
+	"""
+	Set the clock in use (None for the system clock).
+	return: The previous one (To restore it).
+	"""
+	global _clock # pylint: disable=global-statement
+	previous = _clock
+	_clock = Clock() if clock is None else clock
+	return previous
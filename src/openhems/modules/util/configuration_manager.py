@@ -4,6 +4,7 @@ Let allow get configuration by key, init with a default value.
 """
 
 import os
+import copy
 from pathlib import Path
 import datetime
 import shutil
@@ -379,6 +380,16 @@ class ConfigurationManager():
 			self.logger.error(traceback.format_exc())
 			shutil.copyfile(backupFile, yamlConfFilepath)
 
+	def copy(self):
+		"""
+		Return an independant copy of this configuration without parsing YAML files again.
+		"""
+		other = copy.copy(self)
+		other._conf = copy.deepcopy(self._conf) # pylint: disable=protected-access
+		other._cache = {} # pylint: disable=protected-access
+		other.filepaths = list(self.filepaths)
+		return other
+
 	def __str__(self):
 		retValue = "ConfigurationManager(\n"
 		retValue += "  filepaths = " + str(self.filepaths) + ",\n"
@@ -0,0 +1,135 @@
+"""
+Timers of the server : components are woken up only when something is due
+ (a deadline is reached or an input changed) instead of on each loop.
+"""
+
+import heapq
+import itertools
+
+class _ChangeWatcher:
+	"""
+	Feeder dependent waking up a client when the feeder is invalidated.
+	"""
+	__slots__ = ("_scheduler", "_client")
+
+	def __init__(self, scheduler, client):
+		self._scheduler = scheduler
+		self._client = client
+
+	def invalidate(self):
+		"""
+		Called by the feeder when it's value may have changed.
+		"""
+		self._scheduler.wakeSoon(self._client)
+
+class DeadlineScheduler:
+	"""
+	Min-heap of deadlines. A client is any object with a wakeUp(now) method.
+	 A client has at most one deadline : it ask for the next one in wakeUp().
+	Clients can also be woken up when a feeder change (For exemple a SourceFeeder
+	 is invalidated when it's Home-Assistant entity change).
+	"""
+	def __init__(self):
+		self._heap = [] # (deadline, seq, client)
+		self._deadlines = {} # id(client) -> (deadline, seq) : other heap entries are obsolete
+		self._soon = {} # id(client) -> client to wake up on next run
+		self._seq = itertools.count()
+		self._now = None
+
+	def setTime(self, now):
+		"""
+		Set current time (Can be fake on simulation/tests mode).
+		"""
+		self._now = now
+
+	def getTime(self):
+		"""
+		Return current time (Last one set or run).
+		"""
+		return self._now
+
+	def wakeAt(self, client, deadline):
+		"""
+		Set the deadline of a client (Replace the previous one). None to cancel it.
+		"""
+		if deadline is None:
+			self._deadlines.pop(id(client), None)
+			return
+		seq = next(self._seq)
+		self._deadlines[id(client)] = (deadline, seq)
+		heapq.heappush(self._heap, (deadline, seq, client))
+
+	def wakeSoon(self, client):
+		"""
+		Wake up a client on next run, whatever is it's deadline.
+		"""
+		self._soon[id(client)] = client
+
+	def wakeOnChange(self, client, feeder):
+		"""
+		Wake up a client on next run after the feeder changed.
+		"""
+		feeder.addDependent(_ChangeWatcher(self, client))
+
+	def remove(self, client):
+		"""
+		Forget deadline and pending wake up of a client
+		 (Change watchers stay but are harmless).
+		"""
+		self._deadlines.pop(id(client), None)
+		self._soon.pop(id(client), None)
+
+	def getNextDeadline(self):
+		"""
+		Return the nearest deadline, None if there is not.
+		"""
+		while self._heap:
+			deadline, seq, client = self._heap[0]
+			if self._deadlines.get(id(client), None)==(deadline, seq):
+				return deadline
+			heapq.heappop(self._heap) # obsolete entry
+		return None
+
+	def popDue(self, now):
+		"""
+		Return clients to wake up at 'now' (In deadline order, then the ones woken by a change).
+		"""
+		due = {}
+		while self._heap and self._heap[0][0]<=now:
+			deadline, seq, client = heapq.heappop(self._heap)
+			if self._deadlines.get(id(client), None)==(deadline, seq):
+				del self._deadlines[id(client)]
+				due[id(client)] = client
+		due.update(self._soon)
+		self._soon = {}
+		return list(due.values())
+
+	def runDue(self, now, onError=None):
+		"""
+		Call wakeUp(now) on due clients.
+		:param onError: function(client, exception) called if a client raise an exception,
+		 if None (Or if onError raise it) the exception is raised once all due clients
+		 are woken up, and the failing client is woken up again on next run.
+		return: Number of woken up clients.
+		"""
+		self._now = now
+		clients = self.popDue(now)
+		error = None
+		for client in clients:
+			try:
+				try:
+					client.wakeUp(now)
+				except Exception as e: # pylint: disable=broad-exception-caught
+					if onError is None:
+						raise
+					onError(client, e)
+			except Exception as e: # pylint: disable=broad-exception-caught
+				self.wakeAt(client, now)
+				if error is None:
+					error = e
+		if error is not None:
+			raise error
+		return len(clients)
+
+	def __len__(self):
+		return len(self._deadlines) + len(self._soon)
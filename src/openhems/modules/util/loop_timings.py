@@ -0,0 +1,60 @@
+"""
+Rolling timings of the server loop phases,
+ to know what is eating the cycle budget (Home-Assistant I/O, strategies...).
+"""
+
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+
+class LoopTimings:
+	"""
+	Keep the last durations (seconds) of each named phase
+	 and give min/mean/p95/max on them.
+	:window: Number of last durations kept per phase.
+	:clock: function returning current time in seconds (Usefull for tests).
+	"""
+	def __init__(self, window=100, clock=None):
+		self.window = window
+		self.clock = time.perf_counter if clock is None else clock
+		self.durations = {}
+
+	@contextmanager
+	def measure(self, phase):
+		"""
+		Context manager adding the duration of the with block to phase.
+		"""
+		start = self.clock()
+		try:
+			yield
+		finally:
+			self.add(phase, self.clock()-start)
+
+	def add(self, phase, duration):
+		"""
+		Add a duration to phase.
+		"""
+		durations = self.durations.get(phase, None)
+		if durations is None:
+			durations = deque(maxlen=self.window)
+			self.durations[phase] = durations
+		durations.append(duration)
+
+	def getStats(self):
+		"""
+		Return per phase statistics on last durations (in seconds).
+		 It's called from the socket thread while the loop adds durations : work on copies.
+		"""
+		stats = {}
+		for phase, durations in list(self.durations.items()):
+			values = list(durations)
+			last = values[-1]
+			values.sort()
+			count = len(values)
+			stats[phase] = {
+				"count":count, "last":last, "min":values[0],
+				"mean":sum(values)/count, "p95":values[math.ceil(0.95*count)-1],
+				"max":values[-1]
+			}
+		return stats
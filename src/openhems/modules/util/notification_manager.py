@@ -7,6 +7,7 @@ import datetime
 import dataclasses
 import logging
 from itertools import islice
+from .clock import getClock
 # import traceback
 
 @dataclasses.dataclass
@@ -71,7 +72,7 @@ class MessageHistory:
 			message = self.getMessage()
 		else:
 			if now is None:
-				now = datetime.datetime.now()
+				now = getClock().now()
 			if self.logs[0].date+datetime.timedelta(days=1)<now:
 				histo = now - self.PURGE_HISTO_IN_DAY
 				self.purge(histo)
@@ -115,7 +116,7 @@ class MessageHistory:
 		Called when a new message occured:
 		 Decide if we display it or not now
 		"""
-		now = datetime.datetime.now()
+		now = getClock().now()
 		self.logs.append( MessageLog(now, 1, 1) )
 		size = len(self.logs)
 		if size==1: # Case first message
@@ -142,8 +143,9 @@ class NotificationManager:
 		self.history = {}
 		self.timers = {}
 		self.sortedTimers = {}
-		self.nextPurgeDate =  datetime.datetime.now() \
+		self.nextPurgeDate =  getClock().now() \
 			 + MessageHistory.PURGE_HISTO_IN_DAY
+		self._deferred = None # Messages to send later (on popDeferred())
 		if logger is None:
 			self.logger = logging.getLogger(__file__)
 		else:
@@ -158,11 +160,30 @@ class NotificationManager:
 		# for line in traceback.format_stack(): print(line)
 		if timer is None:
 			self.logger.info("NotificationManager : notify on dashboard '%s'", message)
-			self.networkUpdater.notify(message)
+			if self._deferred is None:
+				self.networkUpdater.notify(message)
+			else:
+				self._deferred.append(message)
 		else:
 			self.timers[message] = timer
 			self.sortedTimers = None
 
+	def defer(self):
+		"""
+		Keep notifications to send instead of sending them
+		 (Until popDeferred()).
+		"""
+		if self._deferred is None:
+			self._deferred = []
+
+	def popDeferred(self):
+		"""
+		Return kept notifications and stop keeping them.
+		"""
+		messages = self._deferred if self._deferred is not None else []
+		self._deferred = None
+		return messages
+
 	def loop(self, now=None):
 		"""
 		This function is call at each server loop and purge message in stack
@@ -170,7 +191,7 @@ class NotificationManager:
 		 The stack was fill by self.setTimer()
 		"""
 		if now is None:
-			now = datetime.datetime.now()
+			now = getClock().now()
 		# Refresh sortedTimers (A cache to improve next step)
 		if self.sortedTimers is None and len(self.timers)>0:
 			self.sortedTimers = sorted(self.timers.items(), key=lambda x: x[1])
@@ -5,6 +5,7 @@ Custom and specific time management for OpenHEMS
 import sqlite3
 import datetime
 import logging
+from .clock import getClock
 
 logger = logging.getLogger(__name__)
 
@@ -124,7 +125,7 @@ class Recorder():
 			return # deviceId/stepType are not set
 		self.connect()
 		if now is None:
-			now = datetime.datetime.now()
+			now = getClock().now()
 		record = (self.deviceId, self.stepType, self._stepId, now, value)
 		logger.debug("Register : %s", record)
 		self._cursor.execute(
@@ -3,11 +3,11 @@ Custom and specific time management for OpenHEMS
 """
 
 import re
-import time
 import logging
 from datetime import datetime, timedelta
 from .cast_utility import CastUtililty, CastException
 from .configuration_manager import ConfigurationException
+from .clock import getClock
 
 logger = logging.getLogger(__name__)
 
@@ -129,7 +129,7 @@ class HoursRanges:
 		self.ranges = []
 		self.minCost = 0
 		self.setHoursRangesList(hoursRangesList, defaultCost, outRangeCost)
-		self.rangeEnd = datetime.now()
+		self.rangeEnd = getClock().now()
 		self.timeout = timeout
 		self.timeStart = timeStart
 		self._timeoutCallBack = timeoutCallBack
@@ -243,7 +243,7 @@ class HoursRanges:
 		Get next range (end time) and cost
 		"""
 		if nowDatetime is None:
-			nowDatetime = datetime.now()
+			nowDatetime = getClock().now()
 		now = Time(nowDatetime)
 		nextTime = now.time+Time.MIDNIGHT
 		for hoursRange in self.ranges:
@@ -259,7 +259,7 @@ class HoursRanges:
 		 and set end time of this range
 		"""
 		if nowDatetime is None:
-			nowDatetime = datetime.now()
+			nowDatetime = getClock().now()
 		# Check range validity of this hoursRange
 		if ( (self.timeStart is not None and nowDatetime<self.timeStart)
 				or (self.timeout is not None and self.timeout<nowDatetime)):
@@ -310,7 +310,7 @@ class HoursRanges:
 		time2wait = self.getTime2NextRange(now)
 		logger.info("sleepUntillNextRange() : sleep(%d min, until %s)",\
 			round((time2wait+TIME_MARGIN_IN_S)/60), str(self.rangeEnd))
-		time.sleep(time2wait+TIME_MARGIN_IN_S)
+		getClock().sleep(time2wait+TIME_MARGIN_IN_S)
 
 	def __iter__(self):
 		self._index = 0
@@ -142,7 +142,8 @@ def save_basic_config(
 @st.cache_data(ttl=3600)
 def get_ha_entities() -> list:
     """ Get Home-Assistant entities list via UnixSocketServer."""
-    return OpenhemsHTTPServer.get_socket_client().list_components()
+    entities = OpenhemsHTTPServer.get_socket_client().list_entities(refresh=True)
+    return entities if isinstance(entities, list) else [] # On error, a dict is returned
 
 def select_ha_entity(search_term: str) -> list:
     """Fonction de recherche passée à st_searchbox."""
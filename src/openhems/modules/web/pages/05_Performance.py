@@ -0,0 +1,62 @@
+"""
+Performance page for OpenHEMS web interface:
+* Display durations of each core loop phase (Home-Assistant I/O, strategies...)
+* Display latencies of each Home-Assistant endpoint
+"""
+#pylint: disable=invalid-name
+
+import sys
+from pathlib import Path
+import streamlit as st # pylint: disable=E0401
+import pandas as pd
+
+# pylint: disable=wrong-import-position
+ROOT_PATH = Path(__file__).parents[4]
+sys.path.append(str(ROOT_PATH))
+from openhems.modules.web import OpenhemsHTTPServer
+
+def timings2dataframe(timings:dict):
+    """
+    Convert loop timings (seconds) to a pandas DataFrame (milliseconds)
+    """
+    data = []
+    for phase, stats in timings.items():
+        row = {"Phase": phase, "Count": stats["count"]}
+        for key in ["last", "min", "mean", "p95", "max"]:
+            row[key.capitalize()+" (ms)"] = round(stats[key]*1000, 1)
+        data.append(row)
+    return pd.DataFrame(data)
+
+def latencies2dataframe(latencies:dict):
+    """
+    Convert endpoints latencies (seconds) to a pandas DataFrame (milliseconds)
+    """
+    data = []
+    for endpoint, stats in latencies.items():
+        row = {"Endpoint": endpoint, "Count": stats["count"]}
+        for key in ["min", "mean", "max"]:
+            row[key.capitalize()+" (ms)"] = round(stats[key]*1000, 1)
+        data.append(row)
+    return pd.DataFrame(data)
+
+def performance_page():
+    """
+    Display the loop timings page.
+    """
+    st.title("Performances de la boucle")
+    timings = OpenhemsHTTPServer.get_socket_client().get_timings()
+    if timings is None:
+        st.warning("Erreur lors de la récupération des durées de la boucle.")
+        return
+    if len(timings)==0:
+        st.info("Aucune boucle exécutée pour le moment.")
+        return
+    st.dataframe(timings2dataframe(timings), hide_index=True)
+    latencies = OpenhemsHTTPServer.get_socket_client().get_latencies()
+    if latencies:
+        st.subheader("Latences de Home-Assistant")
+        st.dataframe(latencies2dataframe(latencies), hide_index=True)
+    if st.button("🔄 Rafraîchir"):
+        st.rerun()
+
+performance_page()
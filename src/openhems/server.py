@@ -3,6 +3,9 @@
 This is the server thread witch aim to centralize information and take right deccisions
 """
 import time
+import heapq
+import functools
+import asyncio
 import datetime
 import logging
 from openhems.modules.energy_strategy import (
@@ -10,7 +13,8 @@ from openhems.modules.energy_strategy import (
 )
 from openhems.modules.network import HomeStateUpdaterException
 from openhems.modules.util import (
-	CastUtililty, ConfigurationManager, ConfigurationException, CastException
+	CastUtililty, ConfigurationManager, ConfigurationException, CastException,
+	LoopTimings, DeadlineScheduler, getClock
 )
 from openhems.modules.network import (
 	FeedbackSwitch, ConstraintsException
@@ -20,23 +24,45 @@ class OpenHEMSServer:
 	"""
 	This is the server thread witch aim to centralize information
 	 and take right deccisions to optimize consumption
+	Each strategy is called only when it is due (See _runStrategies()),
+	 the server loop when the first one is due and at least each server.loopDelay.
 	"""
+	MIN_LOOP_DELAY = 1 # Minimum seconds between 2 loops
 
 	def __init__(self, mylogger, network, serverConf:ConfigurationManager, allowSleep=False) -> None:
 		self.logger = mylogger
 		self.network = network
 		self.network.server = self
 		self._loopDelay = serverConf.get("server.loopDelay")
+		# Max duration for each I/O task of loopAsync() (seconds)
+		self._ioTimeout = serverConf.get("server.ioTimeout", defaultValue=10)
+		# Last I/O task of each kind (See _awaitIO())
+		self._ioTasks = {}
+		# Interval of the fast safety loop between 2 loops (seconds, 0 to disable)
+		self._safetyLoopDelay = serverConf.get("server.safetyLoopDelay", defaultValue=0)
+		self._lastSafetyCheck = None # time.perf_counter() of last margin power check
+		# Substract expected load rise (from power history) to margin power
+		self.network.setLoadAnticipation(
+			serverConf.get("server.anticipateLoad", "bool", defaultValue=False))
 		self.strategies = []
 		self._cycleId = -1 # used for cache (if loopNb didn't move, get from cache)
 		self._allowSleep = allowSleep
 		self._inOverLoadMode = False # in over load mode, we have node deactivate for safety
 		self._now = None # Current timestamp: Can be fake on simulation/tests mode.
-		# "Nodes" to call decrementTime() to manage their time/constraints
 		self.warningMessages = []
+		# "Nodes" to call decrementTime() on each loop (See registerDecrementTime())
 		self._decrementTimeCallbacks = {}
-		self._initDecrementTimeCallbacks()
+		# Deadlines of "nodes" to wake up only when something is due (time/constraints)
+		self.scheduler = DeadlineScheduler()
+		# Rolling durations of each loop phase
+		self.timings = LoopTimings()
+		self._initTimers()
 		self._initStrategies(mylogger, serverConf)
+		# Next run of each strategy : (time, order, strategy), all are due on first loop
+		self._strategiesQueue = [(datetime.datetime.min, order, strategy)
+			for order, strategy in enumerate(self.strategies)]
+		self._strategiesLastRun = {} # order -> last run time
+		self._schedulesVersion = None # To wake up strategies when a schedule change
 
 	def _initStrategies(self, mylogger, serverConf):
 		"""
@@ -95,18 +121,19 @@ class OpenHEMSServer:
 		"""
 		return self.warningMessages + self.network.getWarningMessages()
 
-	def _initDecrementTimeCallbacks(self):
+	def _initTimers(self):
 		"""
-		Initialize the decrement time callbacks with node we can't initialize before.
+		Register on the scheduler nodes we can't initialize before.
 		"""
 		for node in self.network.getAll("switch"):
 			if isinstance(node, FeedbackSwitch):
-				# We need to always check min/max sensor value
-				self.registerDecrementTime(node)
+				# Check min/max sensor value when it change or at range end
+				node.registerTimers(self.scheduler)
 			constraints = node.getConstraints()
 			if constraints is not None:
-				# We need to always check specific contraints like min/maxPower, maxDurationOn/Off
-				self.registerDecrementTime(constraints)
+				# Check specific contraints like min/maxPower, maxDurationOn/Off
+				# when node power/state change or a duration is reached
+				constraints.registerTimers(self.scheduler)
 
 
 	def getSchedule(self):
@@ -125,7 +152,8 @@ class OpenHEMSServer:
 
 	def registerDecrementTime(self, node, register:bool=True):
 		"""
-		Register a node witch will decrement time.
+		Register a node witch will decrement time on each loop.
+		Kept for compatibility, prefer self.scheduler to wake up only when due.
 		"""
 		if register:
 			self.logger.debug("Register decrement time for node '%s'", node)
@@ -134,6 +162,12 @@ class OpenHEMSServer:
 			self.logger.debug("Unregister decrement time for node '%s'", node)
 			self._decrementTimeCallbacks.pop(id(node))
 
+	def getLoopTimings(self):
+		"""
+		Return rolling statistics (min/mean/p95/max in seconds) of each loop phase.
+		"""
+		return self.timings.getStats()
+
 	def getNetwork(self):
 		"""
 		Return network.
@@ -152,31 +186,40 @@ class OpenHEMSServer:
 		"""
 		return self._cycleId
 
+	def _onConstraintError(self, node, e):
+		"""
+		Log and notify a constraint error, other errors are raised.
+		"""
+		if not isinstance(e, ConstraintsException):
+			raise e
+		self.logger.error("Constraint error on '%s' : %s", node, e.message)
+		if self.logger.isEnabledFor(logging.DEBUG):
+			self.logger.exception(e)
+		self.network.notify(
+			f"Constraint error: {e.message}"
+		)
+
 	def decrementTime(self, duration):
 		"""
-		Decrement time from all objects neither the type (Thanks Python ;) )
+		Wake up due nodes of the scheduler,
+		 then decrement time from all registered objects neither the type (Thanks Python ;) )
 		"""
 		self.logger.debug("decrementTime(%s)", duration)
+		self.scheduler.runDue(self._now, self._onConstraintError)
 		for node in list(self._decrementTimeCallbacks.values()):
 			self.logger.debug(" - for '%s'", node)
 			try:
 				node.decrementTime(duration)
 			except ConstraintsException as e:
-				self.logger.error("Constraint error : %s", e.message)
-				if self.logger.isEnabledFor(logging.DEBUG):
-					self.logger.exception(e)
-				self.network.notify(
-					f"Constraint error: {e.message}"
-				)
+				self._onConstraintError(node, e)
 
 	def _disableDevicesDue2OverLoad(self,marginPowerOn):
 		"""
 		Disable devices due to over-load.
 		This is called by the network when margin power is negative.
 		"""
-		elems = self.network.getAll("switch")
-		elems.sort( # start from the less priority
-			key=lambda x:x.getPriority()
+		elems = sorted( # start from the less priority
+			self.network.getAll("switch"), key=lambda x:x.getPriority()
 		)
 		for elem in elems:
 			if marginPowerOn<0 and elem.isSwitchable() and elem.isOn():
@@ -194,6 +237,14 @@ class OpenHEMSServer:
 		For safety, Avoid over-load, check margin power.
 		If margin power is used, we switch off devices
 		"""
+		now = time.perf_counter()
+		if self._lastSafetyCheck is not None:
+			# Bound of the time to shed a consumption surge (without I/O latency)
+			self.timings.add("safety.interval", now-self._lastSafetyCheck)
+		self._lastSafetyCheck = now
+		staleness = self.network.getStaleness()
+		if staleness is not None and staleness>self._loopDelay:
+			self.logger.warning("Check margin power with values %d seconds old.", staleness)
 		marginPowerOn = self.network.getMarginPowerOn()
 		self.logger.debug("Security margin power:%s",marginPowerOn)
 		if marginPowerOn<0: # Need to switch off (deactivate) some nodes
@@ -216,13 +267,12 @@ class OpenHEMSServer:
 		return marginPowerOn
 
 
-	def loop(self, now=None):
+	def _startLoop(self, now):
 		"""
-		It's the content of each loop.
-		If loop delay=0, we consider that we never sleep (For test or reactivity).
+		Start a new cycle and return duration since last one (seconds).
 		"""
 		if now is None:
-			now = datetime.datetime.now()
+			now = getClock().now()
 		if self._now is None:
 			loopDelay = 0
 		else:
@@ -230,19 +280,265 @@ class OpenHEMSServer:
 			loopDelay = loopDelay.total_seconds()
 		self._cycleId += 1
 		self._now = now
+		self.scheduler.setTime(now)
+		return loopDelay
+
+	def _getNextRun(self, time2wait):
+		"""
+		Return when to call again a strategy which returned time2wait.
+		 0 (or a boolean for old strategies) mean on next loop.
+		"""
+		if isinstance(time2wait, bool) or time2wait is None or time2wait<=0:
+			return self._now
+		return self._now + datetime.timedelta(seconds=time2wait)
+
+	def _getSchedulesVersion(self):
+		"""
+		Return a value changing when a schedule is set or elapsed.
+		"""
+		version = 0
+		nbScheduled = 0
+		for node in self.network.getAll("switch"):
+			schedule = node.getSchedule()
+			version += schedule.version
+			if schedule.duration is not None and schedule.duration>0:
+				nbScheduled += 1
+		return (version, nbScheduled)
+
+	def _popDueStrategies(self):
+		"""
+		Return (order, strategy) of strategies to run now, in configuration order.
+		 All are due when a schedule is set or elapsed.
+		"""
+		schedulesVersion = self._getSchedulesVersion()
+		if schedulesVersion!=self._schedulesVersion:
+			self._schedulesVersion = schedulesVersion
+			due = [(order, strategy) for _, order, strategy in self._strategiesQueue]
+			self._strategiesQueue = []
+		else:
+			due = []
+			while self._strategiesQueue and self._strategiesQueue[0][0]<=self._now:
+				_, order, strategy = heapq.heappop(self._strategiesQueue)
+				due.append((order, strategy))
+		return sorted(due, key=lambda x:x[0])
+
+	def getStrategiesNextRun(self):
+		"""
+		Return next run time of each strategy by strategy id.
+		"""
+		return {strategy.strategyId:nextRun for nextRun, _, strategy in self._strategiesQueue}
+
+	def _runStrategies(self, loopDelay):
+		"""
+		Check safety then let due strategies update network.
+		Return the time to wait before next loop : server.loopDelay
+		 or less if a strategy is due before.
+		"""
+		with self.timings.measure("check"):
+			self.check()
+		with self.timings.measure("decrementTime"):
+			self.decrementTime(loopDelay)
+		for order, strategy in self._popDueStrategies():
+			lastRun = self._strategiesLastRun.get(order, None)
+			cycleDuration = loopDelay if lastRun is None else (self._now-lastRun).total_seconds()
+			self._strategiesLastRun[order] = self._now
+			nextRun = self._now # On error, try again on next loop
+			try:
+				with self.timings.measure("strategy."+strategy.strategyId):
+					t = strategy.updateNetwork(cycleDuration, self._now)
+				nextRun = self._getNextRun(t)
+			except Exception as e: # pylint: disable=broad-exception-caught
+				# Do not stop other strategies
+				self._onLoopError(e)
+			heapq.heappush(self._strategiesQueue, (nextRun, order, strategy))
+		return min([self._loopDelay] + [(nextRun-self._now).total_seconds()
+			for nextRun, _, _ in self._strategiesQueue if nextRun>self._now])
+
+	def loop(self, now=None):
+		"""
+		It's the content of each loop.
+		If loop delay=0, we consider that we never sleep (For test or reactivity).
+		Return the time to wait before next loop.
+		"""
+		loopDelay = self._startLoop(now)
 		# self.logger.debug("OpenHEMSServer.loop(%s)", now)
-		self.network.updateStates()
-		self.check()
-		self.decrementTime(loopDelay)
-		time2wait = 86400
-		for strategy in self.strategies:
-			t = strategy.updateNetwork(loopDelay, now)
-			time2wait = min(t, time2wait)
+		with self.timings.measure("loop"):
+			with self.timings.measure("updateStates"):
+				self.network.updateStates()
+			# Switch commands are sent grouped at the end of the cycle.
+			self.network.queueSwitches()
+			try:
+				time2wait = self._runStrategies(loopDelay)
+			finally:
+				with self.timings.measure("flushSwitches"):
+					self.network.flushSwitches()
 		if self._allowSleep and time2wait > 0:
 			self.logger.info("Loop sleep(%d min)", round(time2wait/60))
-			time.sleep(time2wait)
+			self._sleep(time2wait)
+			return 0
+		return time2wait
+
+	def safetyLoop(self):
+		"""
+		Fast loop between 2 loops : refresh only grid power and check margin power
+		 (Switch off devices on over-load). It share the snapshot of the current loop.
+		"""
+		with self.timings.measure("safety"):
+			with self.timings.measure("safety.updateStates"):
+				self.network.updateSafetyStates()
+			self.network.queueSwitches()
+			try:
+				with self.timings.measure("safety.check"):
+					self.check()
+			finally:
+				self.network.flushSwitches()
+
+	def _sleep(self, duration):
+		"""
+		Sleep duration seconds, running safetyLoop() each server.safetyLoopDelay seconds.
+		"""
+		clock = getClock()
+		end = clock.time() + duration
+		while True:
+			remaining = end - clock.time()
+			if remaining<=0:
+				return
+			if self._safetyLoopDelay<=0 or remaining<=self._safetyLoopDelay:
+				clock.sleep(remaining)
+				return
+			clock.sleep(self._safetyLoopDelay)
+			try:
+				self.safetyLoop()
+			except Exception as e: # pylint: disable=broad-exception-caught
+				self._onLoopError(e)
+
+	async def _sleepAsync(self, duration):
+		"""
+		Asyncio variant of _sleep().
+		"""
+		clock = getClock()
+		end = clock.time() + duration
+		while True:
+			remaining = end - clock.time()
+			if remaining<=0:
+				return
+			if self._safetyLoopDelay<=0 or remaining<=self._safetyLoopDelay:
+				await clock.sleepAsync(remaining)
+				return
+			await clock.sleepAsync(self._safetyLoopDelay)
+			try:
+				await self._awaitIO("safety", functools.partial(asyncio.to_thread, self.safetyLoop),
+					"network")
+			except Exception as e: # pylint: disable=broad-exception-caught
+				self._onLoopError(e)
+
+	def _isIOBusy(self, kind):
+		"""
+		Return True if the last I/O task of this kind is still running.
+		"""
+		task = self._ioTasks.get(kind, None)
+		return task is not None and not task.done()
+
+	async def _awaitIO(self, name, factory, kind=None):
+		"""
+		Await an I/O task, created by factory(), no more than self._ioTimeout seconds.
+		On timeout, the cycle continue without it's result (last values are kept).
+		 The task keep running (A worker thread can't be stopped), so no other task
+		 of the same kind is started until it ends : they would race on the same states.
+		:kind: Tasks sharing states, default is name.
+		"""
+		kind = name if kind is None else kind
+		if self._isIOBusy(kind):
+			self.logger.warning("OpenHEMSServer : skip '%s', previous '%s' task is still running.",
+				name, kind)
+			return None
+		task = asyncio.ensure_future(factory())
+		# Retrieve exceptions of a task ending after timeout (Avoid "never retrieved" warnings)
+		task.add_done_callback(lambda t: t.cancelled() or t.exception())
+		self._ioTasks[kind] = task
+		try:
+			return await asyncio.wait_for(asyncio.shield(task), self._ioTimeout)
+		except TimeoutError:
+			self.logger.error("OpenHEMSServer : '%s' last more than %s seconds, "
+				"continue without waiting it.", name, self._ioTimeout)
+			return None
+
+	async def loopAsync(self, now=None):
+		"""
+		Asyncio variant of loop(): states refresh and tariffs lookups
+		 run concurrently, then switch commands and notifications are sent concurrently.
+		Each I/O task is limited to server.ioTimeout seconds.
+		 The cycle is skipped while a network task of a previous one is still running.
+		Return the time to wait before next loop.
+		"""
+		if self._isIOBusy("network"):
+			self.logger.warning("OpenHEMSServer : skip loop, previous network task is still running.")
+			return self.MIN_LOOP_DELAY
+		loopDelay = self._startLoop(now)
+		with self.timings.measure("loop"):
+			with self.timings.measure("updateStates"):
+				await asyncio.gather(
+					self._awaitIO("updateStates", self.network.updateStatesAsync, "network"),
+					*[self._awaitIO("contract",
+						functools.partial(asyncio.to_thread, contract.refresh, self._now),
+						f"contract.{i}")
+						for i, contract in enumerate(self.network.getContracts())]
+				)
+			self.network.queueSwitches()
+			self.network.deferNotifications()
+			try:
+				time2wait = self._runStrategies(loopDelay)
+			finally:
+				with self.timings.measure("flushSwitches"):
+					await asyncio.gather(
+						self._awaitIO("switch", self.network.flushSwitchesAsync, "network"),
+						self._awaitIO("notify", self.network.flushNotificationsAsync)
+					)
+		return time2wait
+
+	def _onLoopError(self, e):
+		"""
+		Log (and notify) an error occured during a loop.
+		"""
+		if isinstance(e, HomeStateUpdaterException):
+			# at least HomeStateUpdaterException, CastException, HomeStateUpdaterException
+			self.logger.error("Fail update network : %s", e)
+			if self.logger.isEnabledFor(logging.DEBUG):
+				self.logger.exception(e)
+			if e.code == CastException.UNAVAILABLE:
+				self.network.notify(
+					"Could you solve that problem? It seam we can't get information from "
+					+ e.message
+				)
+			self.network.notify("Fail update network : "+e.message)
+		elif isinstance(e, ConstraintsException):
+			self.logger.error("Constraint error : %s", e.message)
+			if self.logger.isEnabledFor(logging.DEBUG):
+				self.logger.exception(e)
+			self.network.notify(
+				f"Constraint error : {e.message}"
+			)
+		else:
+			self.logger.error("Fail update network : %s", str(e))
+			if self.logger.isEnabledFor(logging.DEBUG):
+				self.logger.exception(e)
+
+	def _getNextLoop(self, nextloop, loopDelay, time2wait=None):
+		"""
+		Return (seconds to sleep, next loop time)
+		:time2wait: Seconds before a strategy is due, to loop before nextloop if needed.
+		"""
+		t = getClock().time()
+		if time2wait is not None and t+time2wait<nextloop:
+			nextloop = t + max(time2wait, self.MIN_LOOP_DELAY)
+		if t<nextloop:
+			self.logger.debug("OpenHEMSServer.run() : sleep(%.2f min)", (nextloop-t)/60)
+			return (nextloop-t, nextloop + loopDelay)
+		if t>nextloop:
+			self.logger.warning("OpenHomeEnergyManagement::run() "
+				": missing time for loop : %d seconds", (nextloop-t))
+		return (0, t + loopDelay)
 
-	# pylint: disable=too-many-branches
 	def run(self, loopDelay=0):
 		"""
 		Run an infinite loop
@@ -252,40 +548,33 @@ class OpenHEMSServer:
 		"""
 		if loopDelay==0:
 			loopDelay = self._loopDelay
-		nextloop = time.time() + loopDelay
+		nextloop = getClock().time() + loopDelay
 		while True:
-			# pylint: disable=broad-exception-caught, too-many-branches
+			# pylint: disable=broad-exception-caught
 			# self.network.notify("OpenHEMS is running")
+			time2wait = None
 			try:
-				self.loop()
-			except HomeStateUpdaterException as e:
-				# at least HomeStateUpdaterException, CastException, HomeStateUpdaterException
-				self.logger.error("Fail update network : %s", e)
-				if self.logger.isEnabledFor(logging.DEBUG):
-					self.logger.exception(e)
-				if e.code == CastException.UNAVAILABLE:
-					self.network.notify(
-						"Could you solve that problem? It seam we can't get information from "
-						+ e.message
-					)
-				self.network.notify("Fail update network : "+e.message)
-			except ConstraintsException as e:
-				self.logger.error("Constraint error : %s", e.message)
-				if self.logger.isEnabledFor(logging.DEBUG):
-					self.logger.exception(e)
-				self.network.notify(
-					f"Constraint error : {e.message}"
-				)
+				time2wait = self.loop()
+			except Exception as e:
+				self._onLoopError(e)
+			sleepDuration, nextloop = self._getNextLoop(nextloop, loopDelay, time2wait)
+			if sleepDuration>0:
+				self._sleep(sleepDuration)
+
+	async def runAsync(self, loopDelay=0):
+		"""
+		Asyncio variant of run() using loopAsync()
+		"""
+		if loopDelay==0:
+			loopDelay = self._loopDelay
+		nextloop = getClock().time() + loopDelay
+		while True:
+			# pylint: disable=broad-exception-caught
+			time2wait = None
+			try:
+				time2wait = await self.loopAsync()
 			except Exception as e:
-				self.logger.error("Fail update network : %s", str(e))
-				if self.logger.isEnabledFor(logging.DEBUG):
-					self.logger.exception(e)
-			t = time.time()
-			if t<nextloop:
-				self.logger.debug("OpenHEMSServer.run() : sleep(%.2f min)", (nextloop-t)/60)
-				time.sleep(nextloop-t)
-				t = time.time()
-			elif t>nextloop:
-				self.logger.warning("OpenHomeEnergyManagement::run() "
-					": missing time for loop : %d seconds", (nextloop-t))
-			nextloop = t + loopDelay
+				self._onLoopError(e)
+			sleepDuration, nextloop = self._getNextLoop(nextloop, loopDelay, time2wait)
+			if sleepDuration>0:
+				await self._sleepAsync(sleepDuration)
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Accelerated and deterministic simulation of an OpenHEMS server.
+The server run on a FakeNetwork with a virtual clock : cycles follow each other
+ as fast as the CPU allow (No sleeps). It's usefull to evaluate strategies changes.
+"""
+
+import sys
+import csv
+import random
+import logging
+import argparse
+import datetime
+import dataclasses
+from pathlib import Path
+
+openhemsPath = Path(__file__).parents[1]
+sys.path.append(str(openhemsPath))
+# pylint: disable=wrong-import-position
+from openhems.modules.network import Network
+from openhems.modules.network.driver.fake_network import FakeNetwork
+from openhems.modules.util import (
+	ConfigurationManager, ConfigurationException, VirtualClock, setClock,
+	DATETIME_PRINT_FORMAT
+)
+from openhems.server import OpenHEMSServer
+
+@dataclasses.dataclass
+class SimulationCycle:
+	"""
+	What happened during a simulated cycle.
+	"""
+	time: datetime.datetime
+	gridPower: float # W, negative when selling
+	solarPower: float # W produced by solar panels
+	consumption: float # W consumed by devices
+	price: float # Price of a kWh from the grid
+	cost: float # Cost of the cycle (negative if we earn money)
+	decisions: dict # switch id -> isOn, for switches changed by the cycle
+	isOn: dict # switch id -> isOn after the cycle
+
+@dataclasses.dataclass
+class EnergyStats:
+	"""
+	Energy totals (kWh) of a simulation.
+	"""
+	bought: float = 0.0 # kWh bought from the grid
+	sold: float = 0.0 # kWh sold to the grid
+	solar: float = 0.0 # kWh produced by solar panels
+	selfConsumed: float = 0.0 # kWh produced by solar panels and consumed
+
+	def add(self, cycle:SimulationCycle, step:float):
+		"""
+		Add energies of a cycle of step seconds.
+		"""
+		gridEnergy = cycle.gridPower * step / 3600000
+		if gridEnergy>=0:
+			self.bought += gridEnergy
+		else:
+			self.sold -= gridEnergy
+		self.solar += cycle.solarPower * step / 3600000
+		self.selfConsumed += min(cycle.solarPower, cycle.consumption) * step / 3600000
+
+	def getSelfConsumptionRatio(self):
+		"""
+		Return the part of solar production consumed (in [0, 1]), None without production.
+		"""
+		if self.solar<=0:
+			return None
+		return self.selfConsumed / self.solar
+
+@dataclasses.dataclass
+class SimulationResult:
+	"""
+	Energy and cost totals of a simulation.
+	"""
+	start: datetime.datetime
+	end: datetime.datetime = None
+	cycles: int = 0
+	energy: EnergyStats = dataclasses.field(default_factory=EnergyStats)
+	cost: float = 0.0 # Cost of bought energy minus sold energy
+	switches: int = 0 # Number of switch on/off decisions
+	nodesEnergy: dict = dataclasses.field(default_factory=dict) # node id -> kWh
+	nodesOnTime: dict = dataclasses.field(default_factory=dict) # node id -> seconds
+
+	def add(self, cycle:SimulationCycle, step:float, nodesPower:dict):
+		"""
+		Add a cycle of step seconds to totals.
+		"""
+		self.cycles += 1
+		self.end = cycle.time
+		self.energy.add(cycle, step)
+		self.cost += cycle.cost
+		self.switches += len(cycle.decisions)
+		for nodeId, power in nodesPower.items():
+			self.nodesEnergy[nodeId] = self.nodesEnergy.get(nodeId, 0.0) + power * step / 3600000
+		for nodeId, isOn in cycle.isOn.items():
+			if isOn:
+				self.nodesOnTime[nodeId] = self.nodesOnTime.get(nodeId, 0) + step
+
+	def getSelfConsumptionRatio(self):
+		"""
+		Return the part of solar production consumed (in [0, 1]), None without production.
+		"""
+		return self.energy.getSelfConsumptionRatio()
+
+	def __str__(self):
+		lines = [
+			f"Simulation from {self.start.strftime(DATETIME_PRINT_FORMAT)}"
+			f" to {self.end.strftime(DATETIME_PRINT_FORMAT) if self.end else '-'}"
+			f" : {self.cycles} cycles",
+			f" Grid : {self.energy.bought:.3f} kWh bought, {self.energy.sold:.3f} kWh sold",
+			f" Cost : {self.cost:.2f}, {self.switches} switches"
+		]
+		ratio = self.getSelfConsumptionRatio()
+		if ratio is not None:
+			lines.append(f" Solar : {self.energy.solar:.3f} kWh, {100*ratio:.1f}% self-consumed")
+		for nodeId, energy in self.nodesEnergy.items():
+			onTime = self.nodesOnTime.get(nodeId, 0) / 3600
+			lines.append(f" - {nodeId} : {energy:.3f} kWh, {onTime:.1f} h on")
+		return "\n".join(lines)
+
+class Simulator:
+	"""
+	Run an OpenHEMS server on a virtual clock, cycle after cycle of 'step' seconds.
+	The virtual clock is the one used everywhere (See getClock()) until close().
+	Usage:
+		with Simulator.fromConfiguration("openhems.yaml", start=datetime(2025, 1, 1)) as sim:
+			print(sim.run(days=365))
+	"""
+	def __init__(self, clock:VirtualClock, server:OpenHEMSServer, step:int=60):
+		self.clock = clock
+		self.server = server
+		self.network = server.getNetwork()
+		self.step = step
+		self._previousClock = None
+		self._dailySchedules = {} # node id -> (duration, timeout)
+
+	@staticmethod
+	def loadConfiguration(yamlConfFilepath):
+		"""
+		Return the ConfigurationManager of a YAML configuration file.
+		"""
+		configurator = ConfigurationManager(logging.getLogger(__name__))
+		configurator.addYamlConfig(Path(yamlConfFilepath))
+		configurator.completeWithDefaults()
+		return configurator
+
+	@staticmethod
+	def fromConfiguration(yamlConfFilepath, **kwargs):
+		"""
+		Create a simulator from a YAML configuration file (See fromConfigurator()).
+		"""
+		return Simulator.fromConfigurator(Simulator.loadConfiguration(yamlConfFilepath), **kwargs)
+
+	@staticmethod
+	def fromConfigurator(configurator:ConfigurationManager, *, start=None, step=60, seed=0):
+		"""
+		Create a simulator from a configuration (server.network must be 'fake').
+		The virtual clock is set before creating the server as it use current time on init.
+		"""
+		logger = logging.getLogger(__name__)
+		if configurator.get("server.network")!="fake":
+			raise ConfigurationException("Simulation need server.network='fake' : "
+				f"'{configurator.get('server.network')}' would act on real devices.")
+		if start is None:
+			start = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+		clock = VirtualClock(start)
+		previousClock = setClock(clock)
+		try:
+			random.seed(seed)
+			networkUpdater = FakeNetwork(configurator)
+			networkUpdater.seed(seed)
+			network = Network(logger, networkUpdater, configurator.get("network.nodes"))
+			server = OpenHEMSServer(logger, network, configurator)
+		except Exception:
+			setClock(previousClock)
+			raise
+		simulator = Simulator(clock, server, step)
+		simulator._previousClock = previousClock # pylint: disable=protected-access
+		return simulator
+
+	def close(self):
+		"""
+		Give back the previous clock.
+		"""
+		if self._previousClock is not None:
+			setClock(self._previousClock)
+			self._previousClock = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def addDailySchedule(self, nodeId, duration:int, timeout:str=None):
+		"""
+		Schedule a node each day at midnight (Like a user would do on the web UI).
+		:param timeout: Time like "7h00" until witch duration should be elapsed.
+		"""
+		if self.network.getNode(nodeId) is None:
+			raise ConfigurationException(f"Simulation : no node '{nodeId}' to schedule.")
+		self._dailySchedules[nodeId] = (duration, timeout)
+
+	def _setDailySchedules(self):
+		"""
+		Set schedules added with addDailySchedule().
+		"""
+		for nodeId, (duration, timeout) in self._dailySchedules.items():
+			self.network.getNode(nodeId).getSchedule().set_schedule(duration, timeout)
+
+	def cycles(self, end:datetime.datetime):
+		"""
+		Run cycles until end and yield a SimulationCycle for each one.
+		"""
+		isOn = {node.id:node.isOn() for node in self.network.getAll("switch")}
+		now = self.clock.now()
+		day = None
+		while now<end:
+			if now.date()!=day:
+				day = now.date()
+				self._setDailySchedules()
+			self.server.loop(now)
+			yield self._getCycle(now, isOn)
+			now = self.clock.advance(self.step)
+
+	def _getCycle(self, now:datetime.datetime, isOn:dict):
+		"""
+		Return the SimulationCycle of the loop done at now.
+		:param isOn: switch id -> isOn before the loop, updated with the new states.
+		"""
+		# Power after the cycle decisions (Not the one of the loop snapshot)
+		gridPower = sum(node.getCurrentPower() for node in self.network.getAll("publicpowergrid"))
+		if gridPower>=0:
+			price = self.network.getPrice(now)
+		else:
+			price = self.network.getSellPrice(now)
+		decisions = {}
+		for node in self.network.getAll("switch"):
+			nodeIsOn = node.isOn()
+			if nodeIsOn!=isOn.get(node.id):
+				decisions[node.id] = nodeIsOn
+			isOn[node.id] = nodeIsOn
+		return SimulationCycle(now, gridPower,
+			sum(node.getCurrentPower() for node in self.network.getAll("solarpanel")),
+			sum(node.getCurrentPower() for node in self.network.getAll("out")),
+			price, gridPower * self.step / 3600000 * price, decisions, dict(isOn))
+
+	def run(self, end:datetime.datetime=None, *, days:float=None, onCycle=None):
+		"""
+		Run the simulation until end (or during days) and return a SimulationResult.
+		:param onCycle: function(SimulationCycle) called after each cycle.
+		"""
+		if end is None:
+			end = self.clock.now() + datetime.timedelta(days=1 if days is None else days)
+		result = SimulationResult(self.clock.now())
+		nodes = self.network.getAll("out")
+		for cycle in self.cycles(end):
+			result.add(cycle, self.step, {node.id:node.getCurrentPower() for node in nodes})
+			if onCycle is not None:
+				onCycle(cycle)
+		return result
+
+class CsvCycleWriter:
+	"""
+	Write each SimulationCycle as a CSV line (To use as onCycle).
+	"""
+	def __init__(self, fileobj, switchesIds):
+		self.switchesIds = list(switchesIds)
+		self.writer = csv.writer(fileobj)
+		self.writer.writerow(["time", "gridPower", "price", "cost"] + self.switchesIds)
+
+	def __call__(self, cycle:SimulationCycle):
+		self.writer.writerow(
+			[cycle.time.strftime(DATETIME_PRINT_FORMAT), cycle.gridPower, cycle.price, cycle.cost]
+			+ [int(cycle.isOn[nodeId]) for nodeId in self.switchesIds])
+
+def parseSchedule(value:str):
+	"""
+	Parse a daily schedule like 'car=7200@7h00' to (nodeId, duration, timeout).
+	"""
+	nodeId, _, value = value.partition("=")
+	duration, _, timeout = value.partition("@")
+	try:
+		return (nodeId, int(duration), timeout if timeout else None)
+	except ValueError as e:
+		raise argparse.ArgumentTypeError(
+			f"Invalid schedule '{value}' : expected nodeId=durationInSeconds[@timeout]") from e
+
+def addSimulationArguments(parser:argparse.ArgumentParser, days:float):
+	"""
+	Add options of a simulation to a commandline parser :
+	 -s/--start, -d/--days (days is the default), --step, --seed and --schedule.
+	"""
+	parser.add_argument('-s', '--start', type=datetime.datetime.fromisoformat, default=None,
+		help='Start date (ISO format).')
+	parser.add_argument('-d', '--days', type=float, default=days,
+		help='Number of days to simulate.')
+	parser.add_argument('--step', type=int, default=60,
+		help='Cycle duration in seconds.')
+	parser.add_argument('--seed', type=int, default=0,
+		help='Seed of random values.')
+	parser.add_argument('--schedule', type=parseSchedule, action='append', default=[],
+		help="Daily schedule of a node : 'nodeId=durationInSeconds[@timeout]'.")
+
+def main():
+	"""
+	Simulate OpenHEMS on a period. Parse commandline:
+	* -c/--conf : The YAML configuration file (with server.network = fake)
+	* -s/--start : Start date (YYYY-MM-DD), default is today
+	* -d/--days : Number of days to simulate (default 365)
+	* --step : Cycle duration in seconds (default 60)
+	* --seed : Seed of random values
+	* --schedule : Daily schedule of a node like 'car=7200@7h00' (Can be repeated)
+	* -o/--csv : CSV file to write each cycle
+	"""
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-c', '--conf', type=str, required=True,
+		help='File path to YAML configuration file.')
+	addSimulationArguments(parser, days=365)
+	parser.add_argument('-o', '--csv', type=str, default='',
+		help='CSV file to write each cycle.')
+	args = parser.parse_args()
+	with Simulator.fromConfiguration(args.conf, start=args.start,
+			step=args.step, seed=args.seed) as simulator:
+		for nodeId, duration, timeout in args.schedule:
+			simulator.addDailySchedule(nodeId, duration, timeout)
+		if args.csv:
+			with open(args.csv, "w", encoding="utf-8", newline="") as fileobj:
+				writer = CsvCycleWriter(fileobj, [n.id for n in simulator.network.getAll("switch")])
+				result = simulator.run(days=args.days, onCycle=writer)
+		else:
+			result = simulator.run(days=args.days)
+	print(result)
+
+if __name__ == "__main__":
+	main()
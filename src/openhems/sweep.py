@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Run simulations (See simulator.py) for each combination of a parameters grid
+ on all CPU cores, and aggregate results in one table.
+Usefull to tune strategies parameters (annealing initial_temp, nosell ratio...).
+"""
+
+import os
+import sys
+import csv
+import copy
+import argparse
+import datetime
+import itertools
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import yaml
+
+openhemsPath = Path(__file__).parents[1]
+sys.path.append(str(openhemsPath))
+# pylint: disable=wrong-import-position
+from openhems.modules.util import ConfigurationManager, ConfigurationException
+from openhems.simulator import Simulator, addSimulationArguments
+
+# Keys to set a parameter of a list element (server.strategies / network.nodes) by it's id
+LIST_KEYS = {
+	"strategy": "server.strategies",
+	"node": "network.nodes"
+}
+
+def setParameter(configurator:ConfigurationManager, key:str, value):
+	"""
+	Set a parameter in a configuration. Key can be a configuration key (server.loopDelay)
+	 or 'strategy.<id>.<param>' or 'node.<id>.<param>'.
+	"""
+	keys = key.split(".", 2)
+	listKey = LIST_KEYS.get(keys[0])
+	if listKey is None or len(keys)<3:
+		configurator.add(key, value)
+		return
+	_, elemId, param = keys
+	elems = copy.deepcopy(configurator.get(listKey))
+	for i, elem in enumerate(elems):
+		if elem.get("id", elem.get("class", f"node_{i}"))==elemId:
+			elem[param] = value
+			configurator.add(listKey, elems)
+			return
+	raise ConfigurationException(f"Sweep : no '{elemId}' in {listKey} to set '{param}'.")
+
+def getCombinations(grid:dict):
+	"""
+	Return the list of all parameters combinations (dict key -> value) of the grid.
+	"""
+	keys = list(grid.keys())
+	return [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+
+# Configuration loaded once per worker process
+_BASE_CONFIGURATOR = None
+
+def _initWorker(yamlConfFilepath):
+	"""
+	Load the base configuration once for all runs of the worker.
+	"""
+	global _BASE_CONFIGURATOR # pylint: disable=global-statement
+	_BASE_CONFIGURATOR = Simulator.loadConfiguration(yamlConfFilepath)
+
+def runScenario(parameters:dict, options:dict):
+	"""
+	Run a simulation with the base configuration overloaded by parameters.
+	Return a dict of parameters and results.
+	"""
+	configurator = _BASE_CONFIGURATOR.copy()
+	for key, value in parameters.items():
+		setParameter(configurator, key, value)
+	with Simulator.fromConfigurator(configurator, start=options["start"],
+			step=options["step"], seed=options["seed"]) as simulator:
+		for nodeId, (duration, timeout) in options["schedules"].items():
+			simulator.addDailySchedule(nodeId, duration, timeout)
+		result = simulator.run(days=options["days"])
+	ratio = result.getSelfConsumptionRatio()
+	row = dict(parameters)
+	row.update({
+		"cost": round(result.cost, 4),
+		"gridEnergy": round(result.energy.bought, 3),
+		"soldEnergy": round(result.energy.sold, 3),
+		"selfConsumption": None if ratio is None else round(ratio, 4),
+		"switches": result.switches
+	})
+	return row
+
+def sweep(yamlConfFilepath, grid:dict, *, start=None, days=1, step=60, seed=0,
+		schedules=None, maxWorkers=None):
+	"""
+	Run a simulation for each combination of the grid (dict key -> list of values)
+	 in a process pool. Return a list of dict (parameters and results), in grid order.
+	"""
+	if start is None:
+		start = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+	options = {"start": start, "days": days, "step": step, "seed": seed,
+		"schedules": {} if schedules is None else schedules}
+	combinations = getCombinations(grid)
+	if maxWorkers is None:
+		maxWorkers = os.cpu_count() or 1
+	maxWorkers = max(1, min(maxWorkers, len(combinations)))
+	with ProcessPoolExecutor(max_workers=maxWorkers,
+			initializer=_initWorker, initargs=(str(yamlConfFilepath),)) as executor:
+		return list(executor.map(runScenario, combinations, itertools.repeat(options)))
+
+def formatTable(rows:list):
+	"""
+	Return rows (list of dict) as a text table.
+	"""
+	if not rows:
+		return ""
+	columns = list(rows[0].keys())
+	lines = [[str(c) for c in columns]] + [[str(row[c]) for c in columns] for row in rows]
+	widths = [max(len(line[i]) for line in lines) for i in range(len(columns))]
+	return "\n".join(" | ".join(v.rjust(w) for v, w in zip(line, widths)) for line in lines)
+
+def parseParameter(value:str):
+	"""
+	Parse a grid parameter like 'strategy.annealing.initial_temp=100,1000'.
+	"""
+	key, sep, values = value.partition("=")
+	if sep=="" or values=="":
+		raise argparse.ArgumentTypeError(f"Invalid parameter '{value}' : expected key=v1,v2...")
+	return key.strip(), [yaml.safe_load(v.strip()) for v in values.split(",")]
+
+def main():
+	"""
+	Simulate OpenHEMS for each combination of parameters. Parse commandline:
+	* -c/--conf : The base YAML configuration file (with server.network = fake)
+	* -p/--param : A parameter and it's values like 'node.car.nbCycleWithoutPowerForOff=1,3'
+	 (Can be repeated)
+	* -s/--start, -d/--days, --step, --seed, --schedule : See openhems/simulator.py
+	* -j/--jobs : Number of processes (default is the number of CPU)
+	* -o/--csv : CSV file to write the table
+	"""
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-c', '--conf', type=str, required=True,
+		help='File path to base YAML configuration file.')
+	parser.add_argument('-p', '--param', type=parseParameter, action='append', default=[],
+		help="Parameter values : 'key=v1,v2' where key can be 'strategy.<id>.<param>', "
+			"'node.<id>.<param>' or a configuration key.")
+	addSimulationArguments(parser, days=7)
+	parser.add_argument('-j', '--jobs', type=int, default=None,
+		help='Number of processes.')
+	parser.add_argument('-o', '--csv', type=str, default='',
+		help='CSV file to write the table.')
+	args = parser.parse_args()
+	schedules = {nodeId:(duration, timeout) for nodeId, duration, timeout in args.schedule}
+	rows = sweep(args.conf, dict(args.param), start=args.start, days=args.days,
+		step=args.step, seed=args.seed, schedules=schedules, maxWorkers=args.jobs)
+	if args.csv:
+		with open(args.csv, "w", encoding="utf-8", newline="") as fileobj:
+			writer = csv.DictWriter(fileobj, fieldnames=list(rows[0].keys()))
+			writer.writeheader()
+			writer.writerows(rows)
+	print(formatTable(rows))
+
+if __name__ == "__main__":
+	main()
@@ -12,5 +12,8 @@ class UnixSocketAction(Enum):
     GET_SCHEDULE = "get_schedule"
     UPDATE_SCHEDULE = "update_schedule"
     LIST_COMPONENTS = "list_components"
+    LIST_ENTITIES = "list_entities"
+    GET_TIMINGS = "get_timings"
+    GET_LATENCIES = "get_latencies"
 
 SOCKET_PATH = "/tmp/openhems.sock"
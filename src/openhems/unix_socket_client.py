@@ -36,9 +36,14 @@ class UnixSocketClient:
             sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
             sock.connect(self.socket_path)
             sock.send(json.dumps(request).encode('utf-8'))
-            response = sock.recv(8192).decode('utf-8')
+            response = b""
+            while True: # Server close connection after response
+                chunk = sock.recv(8192)
+                if not chunk:
+                    break
+                response += chunk
             sock.close()
-            return json.loads(response)
+            return json.loads(response.decode('utf-8'))
         except (json.JSONDecodeError, ConnectionResetError,
                 BrokenPipeError, AttributeError) as e:
             st.error(f"Erreur de communication avec le core : {e}")
@@ -81,3 +86,24 @@ class UnixSocketClient:
              UnixSocketAction.LIST_COMPONENTS
         )
         return resp
+
+    def list_entities(self, refresh=False):
+        """
+        For the client, to ask the list of existing Home-Assistant entities ids.
+        :refresh: Ask core to reload it's entities catalog from Home-Assistant.
+        """
+        return self.send_request(
+             UnixSocketAction.LIST_ENTITIES, {"refresh": refresh}
+        )
+
+    def get_timings(self):
+        """
+        For the client, to ask rolling statistics (seconds) of each core loop phase.
+        """
+        return self.send_request(UnixSocketAction.GET_TIMINGS)
+
+    def get_latencies(self):
+        """
+        For the client, to ask latency statistics (seconds) of each Home-Assistant endpoint.
+        """
+        return self.send_request(UnixSocketAction.GET_LATENCIES)
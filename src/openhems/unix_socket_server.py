@@ -14,7 +14,10 @@ import json
 sys.path.append(os.path.dirname(__file__))
 # pylint: disable=wrong-import-position
 from openhems.modules.network.schedule import OpenHEMSSchedule # pylint: disable=E0401
-from openhems.modules.network.homestate_updater import HomeStateUpdater
+from openhems.modules.network.homestate_updater import (
+    HomeStateUpdater, HomeStateUpdaterException
+)
+from openhems.modules.util.configuration_manager import ConfigurationException
 from openhems.unix_socket_action import UnixSocketAction, SOCKET_PATH
 from openhems.modules.util.json import json_default
 # from openhems.modules.web.web_streamlit import get_logger
@@ -61,6 +64,21 @@ class UnixSocketServer:
             # threading.Thread(target=self._handle_client, args=(conn,), daemon=True).start()
             self._handle_client(conn)
 
+    def _list_entities(self, refresh):
+        """
+        Return entities ids, the cached ones if the refresh fails.
+        """
+        try:
+            return self.home_state_updater.listEntities(refresh)
+        except (HomeStateUpdaterException, ConfigurationException) as e:
+            if not refresh:
+                raise
+            self.logger.warning(
+                "UnixSocketServer._list_entities() : "
+                "Fail to refresh entities (%s), use cached ones.", e
+            )
+            return self.home_state_updater.listEntities(False)
+
     def _handle_client(self, conn):
         try:
             data = conn.recv(4096).decode('utf-8')
@@ -94,7 +112,17 @@ class UnixSocketServer:
                 )
                 response = json.dumps(components)
                 conn.send(response.encode('utf-8'))
-        except (json.JSONDecodeError, ConnectionResetError, BrokenPipeError, AttributeError) as e:
+            elif action == UnixSocketAction.LIST_ENTITIES.value:
+                entities = self._list_entities(request.get("refresh", False))
+                conn.sendall(json.dumps(entities).encode('utf-8'))
+            elif action == UnixSocketAction.GET_TIMINGS.value:
+                timings = self.home_state_updater.getLoopTimings()
+                conn.sendall(json.dumps(timings).encode('utf-8'))
+            elif action == UnixSocketAction.GET_LATENCIES.value:
+                latencies = self.home_state_updater.getLatencies()
+                conn.sendall(json.dumps(latencies).encode('utf-8'))
+        except (json.JSONDecodeError, ConnectionResetError, BrokenPipeError, AttributeError,
+                HomeStateUpdaterException, ConfigurationException) as e:
             print("Error handling socket request:", e, file=sys.stderr)
             conn.send(json.dumps({"error": str(e)}).encode('utf-8'))
         finally:
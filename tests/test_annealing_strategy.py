@@ -3,16 +3,50 @@
 Test AnnealingStrategy class, 
 """
 import sys
+import copy
+import time
+import random
+import itertools
 import unittest
+from unittest import mock
 from pathlib import Path
 import logging
+import numpy as np
 
 # pylint: disable=wrong-import-position, import-error
 sys.path.append(str(Path(__file__).parents[0]))
 import utils
+from openhems.modules.energy_strategy.optimization_algorithm import (
+    OptimizationAlgorithm, Algorithme
+)
 
 logger = logging.getLogger(__name__)
 
+def newAlgorithm(algo, powerStep=150, state=True, **kwargs):
+    """
+    Return an OptimizationAlgorithm ready to run on 4 devices with solar surplus.
+     The last device can take any power by powerStep up to 3000W.
+    Random generators are seeded, so runs are reproducible.
+    """
+    # pylint: disable=protected-access
+    random.seed(0)
+    np.random.seed(0)
+    algorithm = OptimizationAlgorithm(logger=logger, algo=algo, **kwargs)
+    algorithm._equipments = [
+        OptimizationAlgorithm.Node(powerMax=p, powerValues=values, currentPower=0,
+            requestedPower=0, name=f"node_{i}", state=state, isUsable=True,
+            isWaiting=False, canChangePower=True)
+        for i, (p, values) in enumerate([
+            (300, {0: 0, 1: 300}), (2000, {0: 0, 1: 2000}), (1200, {0: 0, 1: 1200}),
+            (3000, {i: powerStep*i for i in range(3000//powerStep+1)})
+        ])
+    ]
+    algorithm.prices = OptimizationAlgorithm.Prices(0.25, 0.15, 0.05, 0.3)
+    algorithm._netConsumption = -1000
+    algorithm.solarProduction = 1600
+    algorithm._powerMatrix, algorithm._powerCounts = algorithm.getPowerMatrix()
+    return algorithm
+
 class TestAnnealingStrategy(utils.TestStrategy):
     """
     Try test simulated annealing strategy
@@ -34,6 +68,160 @@ class TestAnnealingStrategy(utils.TestStrategy):
         self.loop()
         # self.check_values(nodes_ids, [0, 0, 800], margin_power=3100)
 
+    def test_genetic_fitness_benchmark(self):
+        """
+        Compare population scoring : one NumPy pass against one evalTarget3() per individual.
+         Same values are expected. Report durations for 200 generations of 50 individuals.
+        """
+        # pylint: disable=protected-access
+        algo = newAlgorithm(Algorithme.GENETIC, powerStep=30, state=False)
+        algo._powerTable = algo.getGeneticPowerTable()
+        rng = np.random.default_rng(0)
+        populations = [rng.integers(0, OptimizationAlgorithm.GENETIC_MODULO+1, (50, 4)).astype(float)
+            for _ in range(200)]
+        start = time.perf_counter()
+        scalar = [np.array([OptimizationAlgorithm.evalTarget3(algo, tuple(x)) for x in population])
+            for population in populations]
+        scalarDuration = time.perf_counter()-start
+        start = time.perf_counter()
+        vector = [OptimizationAlgorithm.evalPopulation(algo, population) for population in populations]
+        vectorDuration = time.perf_counter()-start
+        logger.info("GA fitness of 200x50 individuals : %.2f ms one by one, %.2f ms vectorised",
+            1000*scalarDuration, 1000*vectorDuration)
+        for expected, value in zip(scalar, vector):
+            np.testing.assert_allclose(value, expected)
+
+    def test_dynamic_programming(self):
+        """
+        Dynamic programming should find the true optimum (brute force), always the same.
+         Report its duration against genetic algorithm.
+        """
+        # pylint: disable=protected-access
+        algo = newAlgorithm(Algorithme.DYNAMIC_PROGRAMMING)
+        expected = min(algo.evalTarget3CB(sum(powers)) for powers in itertools.product(
+            *[node.powerValues.values() for node in algo._equipments]))
+        start = time.perf_counter()
+        best = algo.dynamicProgramming()
+        dpDuration = time.perf_counter()-start
+        self.assertAlmostEqual(best.target, expected)
+        powers = [node.requestedPower for node in best.solution]
+        self.assertAlmostEqual(algo.evalTarget3CB(sum(powers)), expected)
+        self.assertEqual([node.state for node in best.solution], [p>0 for p in powers])
+        for _ in range(3):
+            self.assertEqual(
+                [n.requestedPower for n in newAlgorithm(Algorithme.DYNAMIC_PROGRAMMING)
+                    .dynamicProgramming().solution], powers)
+        # Unusable devices keep their power
+        unusable = newAlgorithm(Algorithme.DYNAMIC_PROGRAMMING)
+        node = unusable._equipments[3]
+        node.isUsable = False
+        node.currentPower = node.requestedPower = 2400
+        node = [n for n in unusable.dynamicProgramming().solution if not n.isUsable][0]
+        self.assertEqual(node.requestedPower, 2400)
+        self.assertTrue(node.state)
+        algo = newAlgorithm(Algorithme.GENETIC)
+        start = time.perf_counter()
+        algo.geneticAlgorithm()
+        gaDuration = time.perf_counter()-start
+        logger.info("Optimization : %.2f ms dynamic programming, %.2f ms genetic",
+            1000*dpDuration, 1000*gaDuration)
+
+    def test_annealing_benchmark(self):
+        """
+        Simulated annealing moves on indexes of power values : report the duration of
+         an iteration against a deepcopy of nodes and an evalTarget() per iteration.
+        """
+        # pylint: disable=protected-access
+        iterations = 20000
+        algo = newAlgorithm(Algorithme.SIMULATED_ANNEAALING_SOLAROPTIMIZER,
+            initialTemp=1000, minTemp=0.001, coolingFactor=0.9995,
+            maxIterationNumber=iterations)
+        expected = min(algo.evalTargetCB(sum(powers)) for powers in itertools.product(
+            *[node.powerValues.values() for node in algo._equipments]))
+        algo.evalTargetCB.cache_clear()
+        start = time.perf_counter()
+        best = algo.coreSimulatedAnnealing()
+        duration = (time.perf_counter()-start) / iterations
+        self.assertAlmostEqual(best.target, expected)
+        self.assertAlmostEqual(algo.evalTargetCB(
+            OptimizationAlgorithm.devicesConsumption(best.solution)), expected)
+        baselineIterations = 2000
+        start = time.perf_counter()
+        for _ in range(baselineIterations):
+            algo.evalTarget(copy.deepcopy(algo._equipments))
+        baselineDuration = (time.perf_counter()-start) / baselineIterations
+        logger.info("Annealing iteration : %.2f us, %.2f us with deepcopy of nodes",
+            1e6*duration, 1e6*baselineDuration)
+
+    def test_time_budget(self):
+        """
+        Each algorithm should stop at maxTime with the best solution found so far and stats.
+        """
+        # pylint: disable=protected-access
+        maxTime = 0.05
+        for algo, maxIterationNumber in [
+                (Algorithme.SIMULATED_ANNEAALING_SOLAROPTIMIZER, 10**8),
+                (Algorithme.GENETIC, 1000), (Algorithme.BASIN_HOPPING_SCIPY, 1000),
+                (Algorithme.DYNAMIC_PROGRAMMING, 1000)]:
+            algorithm = newAlgorithm(algo, coolingFactor=1.0,
+                maxIterationNumber=maxIterationNumber, maxTime=maxTime)
+            algorithm.stats = OptimizationAlgorithm.Stats()
+            algorithm._startTime = time.perf_counter()
+            best = {
+                Algorithme.SIMULATED_ANNEAALING_SOLAROPTIMIZER: algorithm.coreSimulatedAnnealing,
+                Algorithme.GENETIC: algorithm.geneticAlgorithm,
+                Algorithme.BASIN_HOPPING_SCIPY: algorithm.bassinhopping,
+                Algorithme.DYNAMIC_PROGRAMMING: algorithm.dynamicProgramming
+            }[algo]()
+            duration = time.perf_counter()-algorithm._startTime
+            stats = algorithm.stats
+            logger.info("%s : %d iterations in %.2f ms, %d improvements, timeout=%s",
+                algo.name, stats.iterations, 1000*duration, len(stats.improvements), stats.timeout)
+            self.assertLess(duration, 10*maxTime) # Loose, as the machine may be loaded
+            self.assertGreater(stats.iterations, 0)
+            targets = [target for _, _, target in stats.improvements]
+            self.assertEqual(targets, sorted(targets, reverse=True))
+            self.assertAlmostEqual(best.target, targets[-1])
+            if algo!=Algorithme.DYNAMIC_PROGRAMMING: # Faster than maxTime
+                self.assertTrue(stats.timeout)
+
+    def test_warm_start(self):
+        """
+        Same inputs should skip evaluation, and the last best solution should
+         be in the initial population of the genetic algorithm.
+        """
+        # pylint: disable=protected-access
+        configFile = utils.ROOT_PATH / "tests/data/openhems_fake4tests_annealing.yaml"
+        self.init(configFile)
+        strategy = self.app.server.strategies[0]
+        strategy.eval()
+        cacheHits = strategy.getCacheHits()
+        solution = [node.requestedPower for node in strategy._bestSolution]
+        strategy.eval()
+        self.assertEqual(strategy.getCacheHits(), cacheHits+1)
+        self.assertEqual([node.requestedPower for node in strategy._bestSolution], solution)
+        # On inputs change, genes of the last solution are the first individual of the population
+        algo = strategy._algo
+        algo._lastInputs = None
+        firstIndividuals = []
+        gaRun = OptimizationAlgorithm.ParamGA.run
+        def run(ga, *args):
+            if not firstIndividuals:
+                firstIndividuals.append(list(ga.chrom2x(ga.Chrom)[0]))
+            return gaRun(ga, *args)
+        with mock.patch.object(OptimizationAlgorithm.ParamGA, "run", run):
+            strategy.eval()
+        genes = [int(np.flatnonzero(algo._powerTable[i]==power)[0])
+            for i, power in enumerate(solution)]
+        self.assertEqual(firstIndividuals[0], genes)
+        # Warm start does not change the measured consumption of devices
+        algo.algo = Algorithme.SIMULATED_ANNEAALING_SOLAROPTIMIZER
+        car = self.get_network().getNode("car")
+        car.switchOn(not car.isOn())
+        strategy.eval()
+        self.assertEqual(algo._totalPowerOfInitialEquipments,
+            sum(node.getCurrentPower() for node in strategy.getNodes() if node.isOn()))
+
     # pylint: disable=invalid-name
     def test_xxx(self):
         """
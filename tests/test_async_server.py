@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Check OpenHEMSServer.loopAsync() : asyncio variant of the server loop.
+"""
+
+import sys
+import time
+import asyncio
+import unittest
+from unittest import mock
+from datetime import datetime
+from pathlib import Path
+# pylint: disable=wrong-import-position
+# pylint: disable=import-error
+sys.path.append(str(Path(__file__).parents[0]))
+import utils
+from utils.fake_homeassistant import FakeHomeAssistantHttp, SAMPLE_STATES, get_server
+
+class TestAsyncServerFake(utils.TestStrategy):
+    """
+    Check loopAsync() give same results than loop() with FakeNetwork.
+    """
+
+    def test_offpeak(self):
+        """
+        Same scenario than TestOffpeakStrategy.test_run_server() first steps.
+        """
+        configFile = utils.ROOT_PATH / "tests/data/openhems_fake4tests_generic.yaml"
+        now = datetime(2025, 4, 10, hour=5, minute=30, second=0)
+        self.init(configFile, now=now)
+        nodesIds = ["pump", "car", "machine"]
+        self.set_nodes_values(nodesIds,
+            scheduled_durations=[3600, 3600, 3600],
+            scheduled_timeout=[
+                datetime(2025, 4, 10, 8, 0, 0),
+                datetime(2025, 4, 10, 23, 0, 0),
+                None
+            ]
+        )
+        asyncio.run(self.app.server.loopAsync(datetime(2025, 4, 10, 5, 30, 1)))
+        self.check_values(nodesIds, [280, 1800, 0], margin_power=2100)
+        asyncio.run(self.app.server.loopAsync(datetime(2025, 4, 10, 5, 30, 3)))
+        self.check_values(nodesIds, [280, 1800, 0], margin_power=20)
+
+class TestAsyncServerHomeAssistant(unittest.TestCase):
+    """
+    Check slow Home-Assistant calls do not stretch the whole loop.
+    """
+
+    def setUp(self):
+        self.ha = FakeHomeAssistantHttp(SAMPLE_STATES)
+        self.server = get_server(self.ha, **{"server.ioTimeout": 0.5})
+        self.network = self.server.getNetwork()
+        asyncio.run(self.server.loopAsync(datetime(2025, 4, 10, 12, 0, 0)))
+        self.nodes = {node.id: node for node in self.network.getAll("switch")}
+
+    def tearDown(self):
+        self.ha.shutdown()
+
+    def test_slow_states(self):
+        """
+        Test a slow states refresh is abandoned after server.ioTimeout,
+         and the loop continue with last known values.
+        """
+        self.ha.delays["/template"] = 2
+        async def cycle():
+            start = time.perf_counter()
+            await self.server.loopAsync(datetime(2025, 4, 10, 12, 0, 10))
+            return time.perf_counter()-start
+        self.assertLess(asyncio.run(cycle()), 1.5)
+        self.assertTrue(self.nodes["pump"].isOn())
+        self.assertEqual(self.network.getCurrentPower(), 500)
+
+    def test_slow_states_still_running(self):
+        """
+        Test no cycle starts while the states refresh of a previous one is still running
+         (It would race on the same states).
+        """
+        self.ha.delays["/template"] = 1.5
+        async def cycles():
+            await self.server.loopAsync(datetime(2025, 4, 10, 12, 0, 10)) # Timeout
+            nb_calls = self.ha.nb_calls()
+            time2wait = await self.server.loopAsync(datetime(2025, 4, 10, 12, 0, 11))
+            self.assertEqual(time2wait, self.server.MIN_LOOP_DELAY) # Skipped
+            self.assertEqual(self.ha.nb_calls(), nb_calls)
+            del self.ha.delays["/template"]
+            await asyncio.sleep(1.5)
+            await self.server.loopAsync(datetime(2025, 4, 10, 12, 0, 13))
+            self.assertGreater(self.ha.nb_calls("/template"), 1)
+        asyncio.run(cycles())
+
+    def test_slow_safety_loop(self):
+        """
+        Test a slow safety loop is not started again while it is still running.
+        """
+        calls = []
+        def safety_loop():
+            calls.append(time.perf_counter())
+            time.sleep(0.8)
+        # pylint: disable=protected-access
+        self.server._safetyLoopDelay = 0.2
+        with mock.patch.object(self.server, "safetyLoop", safety_loop):
+            asyncio.run(self.server._sleepAsync(1.1)) # Safety at 0.2s, skipped at 0.9s
+        self.assertEqual(len(calls), 1)
+
+    def test_concurrent_commands(self):
+        """
+        Test switch commands and notifications are sent concurrently.
+        """
+        self.ha.delays["/services/switch/turn_on"] = 0.4
+        self.ha.delays["/services/notify/persistent_notification"] = 0.4
+        async def cycle():
+            self.network.queueSwitches()
+            self.network.deferNotifications()
+            self.nodes["car"].switchOn(True)
+            self.network.notify("Hello")
+            await asyncio.gather(self.network.flushSwitchesAsync(),
+                self.network.flushNotificationsAsync())
+        start = time.perf_counter()
+        asyncio.run(cycle())
+        self.assertLess(time.perf_counter()-start, 0.75)
+        self.assertEqual(self.ha.states["switch.car"].state, "on")
+        self.assertEqual(self.ha.nb_calls("/services/notify/persistent_notification"), 1)
+
+if __name__ == '__main__':
+    unittest.main()
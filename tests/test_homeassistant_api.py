@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Check openhems.modules.network.driver.home_assistant_api.HomeAssistantAPI
+ against a local stand-in of Home-Assistant REST API.
+"""
+
+import sys
+import json
+import socket
+import unittest
+import logging
+from pathlib import Path
+# pylint: disable=wrong-import-position
+# pylint: disable=import-error
+sys.path.append(str(Path(__file__).parents[0]))
+from utils import ROOT_PATH
+from utils.fake_homeassistant import FakeHomeAssistantHttp
+sys.path.append(str(ROOT_PATH / "src"))
+from openhems.modules.network.driver.home_assistant_api import HomeAssistantAPI
+from openhems.modules.util import ConfigurationManager
+from openhems.unix_socket_server import UnixSocketServer
+
+logger = logging.getLogger(__name__)
+
+STATES = {
+    "sensor.grid_power": 1200,
+    "switch.pump": "off",
+    "sensor.not_registered": 12,
+    "light.kitchen": "on"
+}
+
+def socket_request(server, request):
+    """
+    Return the answer of the unix socket server to a request.
+    """
+    client, conn = socket.socketpair()
+    client.sendall(json.dumps(request).encode())
+    server._handle_client(conn) # pylint: disable=protected-access
+    response = b""
+    while chunk := client.recv(8192):
+        response += chunk
+    client.close()
+    return json.loads(response.decode())
+
+class TestHomeAssistantAPI(unittest.TestCase):
+    """
+    Check Home-Assistant REST updater.
+    """
+
+    def setUp(self):
+        self.ha = FakeHomeAssistantHttp(STATES)
+
+    def tearDown(self):
+        self.ha.shutdown()
+
+    def get_updater(self, states_fetch="template"):
+        """
+        Return a HomeAssistantAPI connected to the stand-in.
+        """
+        conf = ConfigurationManager(logger)
+        conf.add("api.url", self.ha.url)
+        conf.add("api.long_lived_token", self.ha.token)
+        conf.add("api.states_fetch", states_fetch)
+        updater = HomeAssistantAPI(conf)
+        updater.registerEntity("sensor.grid_power", "int")
+        updater.registerEntity("switch.pump", "bool")
+        return updater
+
+    def test_filtered_states(self):
+        """
+        Test only registered entities are fetched, with one template call.
+        """
+        updater = self.get_updater()
+        states = updater.getFilteredStates()
+        self.assertEqual(sorted(s["entity_id"] for s in states),
+            ["sensor.grid_power", "switch.pump"])
+        self.assertTrue(updater.updateNetwork())
+        self.assertEqual(self.ha.nb_calls("/states"), 0)
+        self.assertEqual(self.ha.nb_calls("/template"), 2)
+        self.assertEqual(updater.getEntityValue("sensor.grid_power"), 1200)
+        self.assertFalse(updater.getEntityValue("switch.pump"))
+        self.assertEqual(updater.cachedIds["switch.pump"][2],
+            self.ha.states["switch.pump"].last_changed.isoformat())
+
+    def test_all_states(self):
+        """
+        Test unfiltered "/states" fetch mode stay available.
+        """
+        updater = self.get_updater("all")
+        self.assertTrue(updater.updateNetwork())
+        self.assertEqual(self.ha.nb_calls("/states"), 1)
+        self.assertEqual(self.ha.nb_calls("/template"), 0)
+        self.assertEqual(updater.getEntityValue("sensor.grid_power"), 1200)
+
+    def test_template_fallback(self):
+        """
+        Test we fall back on "/states" if template rendering fail, without notification.
+         A refused template (Old Home-Assistant...) is not tried again.
+        """
+        updater = self.get_updater()
+        self.ha.errors["/template"] = 500
+        self.assertTrue(updater.updateNetwork())
+        self.assertEqual(self.ha.nb_calls("/states"), 1)
+        self.assertEqual(updater.getEntityValue("sensor.grid_power"), 1200)
+        self.assertTrue(updater.breaker.allow()) # Fallback succeeded : breaker still closed
+        self.ha.errors["/template"] = 400
+        self.assertTrue(updater.updateNetwork())
+        self.assertEqual(self.ha.nb_calls("/template"), 2) # Tried again after a server error
+        self.assertEqual(self.ha.nb_calls("/states"), 2)
+        self.assertTrue(updater.updateNetwork())
+        self.assertEqual(self.ha.nb_calls("/template"), 2)
+        self.assertEqual(self.ha.nb_calls("/states"), 3)
+        self.assertEqual([path for path, _ in self.ha.posts if path.startswith("/services/notify")],
+            [])
+
+    def test_changed_entities(self):
+        """
+        Test only entities whose last_changed moved are casted and logged again.
+        """
+        updater = self.get_updater()
+        self.assertTrue(updater.updateNetwork())
+        self.assertEqual(updater.getChangedIds(), {"sensor.grid_power", "switch.pump"})
+        with self.assertNoLogs(updater.logger, logging.INFO):
+            self.assertTrue(updater.updateNetwork())
+        self.assertEqual(updater.getChangedIds(), set())
+        self.ha.set_state("sensor.grid_power", 800)
+        self.assertTrue(updater.updateNetwork())
+        self.assertEqual(updater.getChangedIds(), {"sensor.grid_power"})
+        self.assertEqual(updater.getEntityValue("sensor.grid_power"), 800)
+
+    def test_entity_catalog(self):
+        """
+        Test the compact entities catalog and its refresh on demand.
+        """
+        self.ha.states["sensor.grid_power"].attributes = {
+            "device_class": "power", "friendly_name": "Grid"}
+        updater = self.get_updater()
+        updater.initNetwork(None)
+        self.assertEqual(self.ha.nb_calls("/states"), 0)
+        catalog = updater.catalog
+        self.assertEqual(len(catalog), len(STATES))
+        self.assertIn("light.kitchen", catalog)
+        self.assertEqual(catalog.getDomain("light.kitchen"), "light")
+        self.assertEqual(catalog.getDeviceClass("sensor.grid_power"), "power")
+        self.assertIsNone(catalog.getDeviceClass("switch.pump"))
+        self.assertIs(catalog.getDomain("sensor.grid_power"),
+            catalog.getDomain("sensor.not_registered"))
+        self.assertEqual(catalog.getIds(domain="sensor"),
+            ["sensor.grid_power", "sensor.not_registered"])
+        self.assertEqual(catalog.getIds(deviceClass="power"), ["sensor.grid_power"])
+        self.ha.set_state("switch.new", "off")
+        self.assertNotIn("switch.new", updater.listEntities())
+        self.assertIn("switch.new", updater.listEntities(refresh=True))
+        updater = self.get_updater("all")
+        self.assertIn("switch.new", updater.listEntities())
+        # A template failure fall back on "/states" without opening the breaker
+        self.ha.set_state("switch.other", "off")
+        updater = self.get_updater()
+        self.ha.errors["/template"] = 503
+        self.assertIn("switch.other", updater.listEntities())
+        self.assertTrue(updater.breaker.allow())
+        self.assertEqual([path for path, _ in self.ha.posts if path.startswith("/services/notify")],
+            [])
+        del self.ha.errors["/template"]
+        self.assertEqual(updater.catalog.getDeviceClass("sensor.grid_power"), "power")
+
+    def test_list_entities_error(self):
+        """
+        Test the socket server answers cached entities, or an error,
+         when Home-Assistant fails to refresh them.
+        """
+        def list_entities(server):
+            return socket_request(server, {"action": "list_entities", "refresh": True})
+        server = UnixSocketServer({}, self.get_updater(), logger=logger)
+        self.assertIn("light.kitchen", list_entities(server))
+        self.ha.set_state("switch.new", "off")
+        self.ha.errors["/template"] = 503
+        self.ha.errors["/states"] = 503
+        entities = list_entities(server)
+        self.assertIn("light.kitchen", entities)
+        self.assertNotIn("switch.new", entities)
+        server = UnixSocketServer({}, self.get_updater(), logger=logger)
+        self.assertIn("error", list_entities(server)) # No cached entities
+
+    def test_keep_alive(self):
+        """
+        Test polling, switching and notify share one kept-alive connection,
+         and latency counters are kept per endpoint.
+        """
+        updater = self.get_updater()
+        for _ in range(3):
+            updater.updateNetwork()
+        updater.callAPI("/services/switch/turn_on", {"entity_id": "switch.pump"})
+        updater.notify("Hello")
+        self.assertEqual(updater.getEntityValue("light.kitchen"), "on")
+        self.assertEqual(len(self.ha.clients), 1)
+        latencies = updater.getLatencies()
+        self.assertEqual(latencies["/template"]["count"], 3)
+        self.assertEqual(latencies["/services/switch/turn_on"]["count"], 1)
+        self.assertEqual(latencies["/states/<entity_id>"]["count"], 1)
+        for stats in latencies.values():
+            self.assertTrue(0 <= stats["min"] <= stats["mean"] <= stats["max"])
+        server = UnixSocketServer({}, updater, logger=logger)
+        self.assertEqual(socket_request(server, {"action": "get_latencies"}), latencies)
+
+    def test_circuit_breaker(self):
+        """
+        Test Home-Assistant is not called for a while after server errors,
+         without blocking, and last known values are served with their age.
+        """
+        updater = self.get_updater()
+        now = [100]
+        updater.breaker.clock = lambda: now[0]
+        self.assertTrue(updater.updateNetwork())
+        self.assertEqual(updater.getStaleness(), 0)
+        self.ha.set_state("sensor.grid_power", 800)
+        self.assertTrue(updater.updateNetwork())
+        self.assertEqual(updater.getChangedIds(), {"sensor.grid_power"})
+        self.ha.errors["/template"] = 503
+        self.ha.errors["/states"] = 503
+        now[0] = 130
+        self.assertFalse(updater.updateNetwork())
+        self.assertEqual(updater.getChangedIds(), set())
+        nb_calls = self.ha.nb_calls()
+        now[0] = 131
+        self.assertFalse(updater.updateNetwork()) # Circuit open: no call
+        self.assertEqual(self.ha.nb_calls(), nb_calls)
+        self.assertEqual(updater.getEntityValue("sensor.grid_power"), 800)
+        self.assertEqual(updater.getStaleness(), 31)
+        del self.ha.errors["/template"]
+        del self.ha.errors["/states"]
+        now[0] = 133 # After retry delay : trial call
+        self.assertTrue(updater.updateNetwork())
+        self.assertEqual(updater.getStaleness(), 0)
+
+    def test_unauthorized(self):
+        """
+        Test a wrong token slows down calls like server errors, with one notification.
+        """
+        updater = self.get_updater()
+        self.assertTrue(updater.updateNetwork())
+        self.ha.token = "other-token"
+        self.assertFalse(updater.updateNetwork())
+        self.assertFalse(updater.breaker.allow())
+        nb_calls = self.ha.nb_calls()
+        self.assertFalse(updater.updateNetwork()) # Circuit open: no call
+        self.assertEqual(self.ha.nb_calls(), nb_calls)
+        self.assertEqual(self.ha.nb_calls("/services/notify/persistent_notification"), 1)
+        self.assertEqual(updater.statesFetch, "template") # Template is not refused
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Check openhems.modules.network.driver.home_assistant_websocket.HomeAssistantWebSocket
+ against a local stand-in of Home-Assistant WebSocket API.
+"""
+
+import sys
+import copy
+import time
+import json
+import queue
+import threading
+import unittest
+import logging
+from pathlib import Path
+from websockets.sync.server import serve
+# pylint: disable=wrong-import-position
+# pylint: disable=import-error
+ROOT_PATH = Path(__file__).parents[1]
+sys.path.append(str(ROOT_PATH / "src"))
+from openhems.modules.network.driver.home_assistant_websocket import HomeAssistantWebSocket
+from openhems.modules.util import ConfigurationManager
+
+logger = logging.getLogger(__name__)
+
+TOKEN = "secret-token"
+STATES = {
+    "sensor.grid_power": {"s": "1200", "a": {"unit_of_measurement": "W"}, "lc": 1.0},
+    "switch.pump": {"s": "off", "a": {}, "lc": 1.0},
+    "sensor.not_registered": {"s": "12", "a": {}, "lc": 1.0}
+}
+
+class FakeHomeAssistant:
+    """
+    Minimal Home-Assistant WebSocket API : auth + subscribe_entities.
+    """
+    def __init__(self):
+        self.events = queue.Queue()
+        self.subscribed = []
+        self.states = copy.deepcopy(STATES)
+        self.server = serve(self.handler, "127.0.0.1", 0)
+        self.port = self.server.socket.getsockname()[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def handler(self, ws):
+        """
+        Handle one client connection.
+        """
+        ws.send(json.dumps({"type": "auth_required"}))
+        msg = json.loads(ws.recv())
+        if msg.get("access_token") != TOKEN:
+            ws.send(json.dumps({"type": "auth_invalid"}))
+            return
+        ws.send(json.dumps({"type": "auth_ok"}))
+        msg = json.loads(ws.recv())
+        assert msg["type"] == "subscribe_entities"
+        subId = msg["id"]
+        self.subscribed.extend(msg["entity_ids"])
+        ws.send(json.dumps({"id": subId, "type": "result", "success": True}))
+        added = {k: v for k, v in self.states.items() if k in msg["entity_ids"]}
+        ws.send(json.dumps({"id": subId, "type": "event", "event": {"a": added}}))
+        while True:
+            event = self.events.get()
+            if event is None:
+                return
+            ws.send(json.dumps({"id": subId, "type": "event", "event": event}))
+
+    def shutdown(self):
+        """
+        Stop server.
+        """
+        self.events.put(None)
+        self.server.shutdown()
+
+
+class TestHomeAssistantWebSocket(unittest.TestCase):
+    """
+    Check push-based Home-Assistant updater.
+    """
+
+    def setUp(self):
+        self.ha = FakeHomeAssistant()
+        conf = ConfigurationManager(logger)
+        conf.add("api.url", f"http://127.0.0.1:{self.ha.port}/api")
+        conf.add("api.long_lived_token", TOKEN)
+        self.updater = HomeAssistantWebSocket(conf)
+        def noHttp(url, data=None):
+            raise AssertionError(f"Unexpected HTTP call {url} {data}")
+        self.updater.callAPI = noHttp
+
+    def tearDown(self):
+        self.updater.stop()
+        self.ha.shutdown()
+
+    def test_websocket_url(self):
+        """
+        Test deduction of WebSocket URL from REST URL.
+        """
+        self.assertEqual(HomeAssistantWebSocket.getWebSocketUrl("http://ha:8123/api"),
+            "ws://ha:8123/api/websocket")
+        self.assertEqual(HomeAssistantWebSocket.getWebSocketUrl("https://ha.org/api/"),
+            "wss://ha.org/api/websocket")
+        self.assertEqual(HomeAssistantWebSocket.getWebSocketUrl("http://supervisor/core/api"),
+            "ws://supervisor/core/websocket")
+
+    def test_subscribe_entities(self):
+        """
+        Test values are pushed in cache without any HTTP call.
+        """
+        self.updater.registerEntity("sensor.grid_power", "int")
+        self.updater.registerEntity("switch.pump", "bool")
+        self.assertTrue(self.updater.updateNetwork())
+        self.assertEqual(sorted(self.ha.subscribed), ["sensor.grid_power", "switch.pump"])
+        self.assertEqual(self.updater.getEntityValue("sensor.grid_power"), 1200)
+        self.assertFalse(self.updater.getEntityValue("switch.pump"))
+        self.assertNotIn("sensor.not_registered", self.updater.cachedIds)
+
+        self.updater.cachedIds["switch.pump"][0] = None
+        self.updater._received.clear() # pylint: disable=protected-access
+        self.ha.events.put({"c": {"switch.pump": {"+": {"s": "on", "lc": 2.0}}}})
+        self.assertTrue(self.updater.updateNetwork())
+        self.assertTrue(self.updater.getEntityValue("switch.pump"))
+        self.assertEqual(self.updater.getEntityValue("sensor.grid_power"), 1200)
+        self.assertEqual(self.updater.getChangedIds(), {"switch.pump"})
+
+    def test_reconnect(self):
+        """
+        Test updates missed while disconnected are not considered as received.
+        """
+        # pylint: disable=protected-access
+        self.updater.RECONNECT_DELAY = 0.2
+        self.updater.registerEntity("sensor.grid_power", "int")
+        self.assertTrue(self.updater.updateNetwork())
+        self.ha.events.put(None) # Close the connection
+        self.ha.states["sensor.grid_power"] = {"s": "800", "a": {}, "lc": 2.0}
+        deadline = time.monotonic()+5
+        while self.updater.isConnected() and time.monotonic()<deadline:
+            time.sleep(0.01)
+        self.assertFalse(self.updater._received.is_set())
+        self.assertTrue(self.updater._received.wait(5)) # Reconnected
+        self.assertTrue(self.updater.updateNetwork())
+        self.assertEqual(self.updater.getEntityValue("sensor.grid_power"), 800)
+        self.assertEqual(self.updater.getChangedIds(), {"sensor.grid_power"})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Check Network nodes indexes (by type, priority, strategy and id)
+ are kept up to date when nodes are added, removed or reprioritised,
+ and aggregates computed from the per-cycle snapshot.
+Check feeders are computed again only when an input changed.
+"""
+
+import sys
+import gc
+import logging
+import tracemalloc
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+from pathlib import Path
+# pylint: disable=wrong-import-position
+# pylint: disable=import-error
+sys.path.append(str(Path(__file__).parents[0]))
+import utils
+from openhems.main import OpenHEMSApplication
+from openhems.modules.util import ConfigurationManager, DeadlineScheduler
+from openhems.modules.network import (
+    Network, SumFeeder, ApplianceConstraints, ConstraintsException
+)
+from openhems.modules.network.power_history import PowerHistory
+from openhems.modules.network.driver.fake_network import FakeNetwork
+
+class TestNetwork(unittest.TestCase):
+    """
+    Check Network nodes registry with FakeNetwork.
+    """
+
+    def setUp(self):
+        app = OpenHEMSApplication(utils.ROOT_PATH / "tests/data/openhems_fake4tests_solarnosell.yaml")
+        self.server = app.server
+        self.network = app.server.getNetwork()
+
+    def ids(self, filter_id):
+        """
+        Return ids of network nodes of a category.
+        """
+        return [node.id for node in self.network.getAll(filter_id)]
+
+    def test_indexes(self):
+        """
+        Test nodes are indexed by type, priority, strategy and id.
+        """
+        self.assertEqual(self.ids(""), ["linky", "solarpanel", "car", "machine", "pump"])
+        self.assertEqual(self.ids("publicpowergrid"), ["linky"])
+        self.assertEqual(self.ids("inout"), ["linky", "solarpanel"])
+        self.assertEqual(self.ids("out"), ["car", "machine", "pump"])
+        self.assertEqual(self.ids("switch"), ["pump", "car", "machine"])
+        self.assertEqual([node.id for node in self.network.getNodesForStrategy("solarnosell")],
+            ["pump", "car", "machine"])
+        self.assertEqual(self.network.getNodesForStrategy("other"), [])
+        self.assertEqual(self.network.getNode("car").id, "car")
+        self.assertIsNone(self.network.getNode("unknown"))
+
+    def test_update_indexes(self):
+        """
+        Test indexes follow nodes removal and priority changes.
+        """
+        car = self.network.getNode("car")
+        car.setPriority(70)
+        self.assertEqual(self.ids("switch"), ["car", "pump", "machine"])
+        self.assertEqual([node.id for node in self.network.getNodesForStrategy("solarnosell")],
+            ["car", "pump", "machine"])
+        self.assertTrue(self.network.removeNode(car))
+        self.assertFalse(self.network.removeNode(car))
+        self.assertIsNone(self.network.getNode("car"))
+        self.assertEqual(self.ids("out"), ["machine", "pump"])
+        self.assertEqual([node.id for node in self.network.getNodesForStrategy("solarnosell")],
+            ["pump", "machine"])
+        self.network.addNode(car)
+        self.assertEqual(self.ids("switch"), ["car", "pump", "machine"])
+        self.assertEqual(self.network.getNode("car"), car)
+
+    def test_snapshot(self):
+        """
+        Test aggregates are computed from one read-only snapshot per cycle.
+        """
+        self.network.updateStates()
+        snapshot = self.network.getSnapshot()
+        self.assertIs(self.network.getSnapshot(), snapshot)
+        self.assertEqual(snapshot.ids, ("linky", "solarpanel", "car", "machine", "pump"))
+        self.assertEqual(list(snapshot.priority), [-1, -1, 50, 40, 60])
+        with self.assertRaises(ValueError):
+            snapshot.currentPower[0] = 0
+        self.assertEqual(self.network.getMaxPowerProduction(), 3100+600)
+        self.assertEqual(self.network.getMarginPower(), 1000)
+        self.assertEqual(self.network.getMinPower("publicpowergrid"), 0)
+        current = self.network.getCurrentPower()
+        self.assertEqual(self.network.getCurrentPower("solarpanel"), 600)
+        self.assertEqual(self.network.getMarginPowerOn(), 3700-(current+1000))
+        self.network.updateStates()
+        self.assertIsNot(self.network.getSnapshot(), snapshot)
+
+    def test_power_history(self):
+        """
+        Test ring buffer of nodes power and next power estimates.
+        """
+        history = PowerHistory(size=4)
+        for power in [100, 200, 300, 300, 300, 700]: # Rising, and ring buffer wrap
+            history.add(("a", "b"), [power, 50])
+        self.assertEqual(list(history.getSamples()[:, 0]), [300, 300, 300, 700])
+        # Last step is greater than twice the average : consider it as the trend
+        self.assertEqual(history.getEstimate("a"), [300, 1100, 1100])
+        self.assertEqual(history.getEstimate("b"), [50, 50, 50])
+        history.add(("b", "c"), [60, 10]) # Nodes changed
+        self.assertEqual(history.getEstimate("c"), [10, 10, 10])
+        self.assertIsNone(history.getEstimate("a"))
+        self.assertEqual(list(history.getSamples()[:, 0]), [50, 50, 50, 60])
+
+    def test_load_anticipation(self):
+        """
+        Test margin power is reduced by the expected load rise.
+        """
+        self.network.updateStates()
+        self.assertEqual(self.network.getNode("car").estimateNextPower(), [0, 0, 0])
+        for node_id in ["pump", "car"]: # Rising consumption
+            self.network.getNode(node_id).switchOn(True)
+            self.network.updateStates()
+        self.assertEqual(self.network.getCurrentPower("publicpowergrid"), 2080)
+        margin = self.network.getMarginPowerOn()
+        rise = self.network.getLoadRise()
+        self.assertEqual(rise, (280+1800)/2) # Average step
+        self.network.setLoadAnticipation(True)
+        self.assertEqual(self.network.getMarginPowerOn(), margin-rise)
+
+    def test_feeders_invalidation(self):
+        """
+        Test derived feeders are computed again only after an input changed.
+        """
+        grid = self.network.getNode("linky").getFeeder("currentPower")
+        car = self.network.getNode("car")
+        with mock.patch.object(SumFeeder, "compute", autospec=True,
+                side_effect=SumFeeder.compute) as compute:
+            self.network.updateStates()
+            self.assertEqual(grid.getValue(), 0)
+            self.assertEqual(grid.getValue(), 0)
+            self.assertEqual(compute.call_count, 1)
+            car.switchOn(True) # Input changed : invalidate the sum
+            self.assertEqual(grid.getValue(), 1800)
+            self.assertEqual(grid.getValue(), 1800)
+            self.assertEqual(compute.call_count, 2)
+            self.network.removeNode(car) # Nodes changed
+            self.assertEqual(grid.getValue(), 0)
+            self.assertEqual(compute.call_count, 3)
+
+    def test_safety_loop(self):
+        """
+        Test the fast safety loop refresh grid power in the loop snapshot and shed load.
+        """
+        self.network.updateStates()
+        snapshot = self.network.getSnapshot()
+        for node_id in ["car", "machine", "pump"]: # Surge between 2 loops
+            self.network.getNode(node_id).switchOn(True)
+        # FakeNetwork can't refresh only some entities, but switches states are read again
+        self.server.safetyLoop()
+        self.assertIsNot(self.network.getSnapshot(), snapshot)
+        self.assertEqual(self.network.getSnapshot().cycleId, snapshot.cycleId)
+        self.assertFalse(self.network.getNode("machine").isOn()) # Lowest priority
+        self.assertTrue(self.network.getNode("car").isOn())
+        with mock.patch.object(FakeNetwork, "refreshEntities", return_value={"linky"}):
+            self.server.safetyLoop()
+        snapshot = self.network.getSnapshot()
+        self.assertFalse(snapshot.isOn[snapshot.index["machine"]])
+        self.assertEqual(self.network.getCurrentPower("publicpowergrid"), 2080)
+        self.assertTrue(self.network.getNode("pump").isOn()) # Highest priority
+        timings = self.server.getLoopTimings()
+        self.assertEqual(timings["safety"]["count"], 2)
+        self.assertEqual(timings["safety.interval"]["count"], 1)
+
+    def test_constraints_timers(self):
+        """
+        Test constraints are checked only when a duration is reached or node state changed.
+        """
+        car = self.network.getNode("car")
+        constraints = car.setConstraints(ApplianceConstraints({"maxDurationOn": 600}))
+        scheduler = DeadlineScheduler()
+        constraints.registerTimers(scheduler)
+        start = datetime(2025, 1, 1, 12)
+        self.assertEqual(scheduler.runDue(start), 1)
+        self.assertIsNone(scheduler.getNextDeadline()) # Off without maxDurationOff
+        car.switchOn(True)
+        self.assertEqual(scheduler.runDue(start+timedelta(seconds=60)), 1)
+        self.assertEqual(scheduler.getNextDeadline(), start+timedelta(seconds=600))
+        self.assertEqual(scheduler.runDue(start+timedelta(seconds=300)), 0)
+        with self.assertRaises(ConstraintsException):
+            scheduler.runDue(start+timedelta(seconds=600))
+        self.assertFalse(car.isOn())
+
+    def test_strategies_scheduling(self):
+        """
+        Test a strategy is called again only when due or when a schedule is set.
+        """
+        strategy = self.server.strategies[0]
+        start = datetime(2025, 1, 1, 12)
+        with mock.patch.object(type(strategy), "updateNetwork", return_value=600) as update:
+            self.assertEqual(self.server.loop(start), 30) # server.loopDelay
+            self.assertEqual(self.server.getStrategiesNextRun()[strategy.strategyId],
+                start+timedelta(seconds=600))
+            self.server.loop(start+timedelta(seconds=30))
+            self.assertEqual(update.call_count, 1)
+            self.assertEqual(self.server.loop(start+timedelta(seconds=580)), 20)
+            self.server.loop(start+timedelta(seconds=600))
+            self.assertEqual(update.call_count, 2)
+            self.assertEqual(update.call_args.args[0], 600) # Time since last call
+            self.network.getNode("car").getSchedule().set_schedule(3600)
+            self.server.loop(start+timedelta(seconds=660))
+            self.assertEqual(update.call_count, 3)
+
+    def test_strategy_error(self):
+        """
+        Test a strategy raising an error does not stop others and is called again on next loop.
+        """
+        strategy = self.server.strategies[0]
+        other = mock.Mock(strategyId="other")
+        other.updateNetwork.return_value = 0
+        # pylint: disable=protected-access
+        self.server._strategiesQueue.append((datetime.min, 1, other))
+        start = datetime(2025, 1, 1, 12)
+        with mock.patch.object(type(strategy), "updateNetwork",
+                side_effect=ConstraintsException("Fail")) as update:
+            self.server.loop(start)
+            self.assertEqual(update.call_count, 1)
+            self.assertEqual(other.updateNetwork.call_count, 1)
+            self.assertEqual(self.server.getStrategiesNextRun(),
+                {strategy.strategyId: start, "other": start})
+            self.server.loop(start+timedelta(seconds=30))
+            self.assertEqual(update.call_count, 2)
+            self.assertEqual(other.updateNetwork.call_count, 2)
+
+    def test_memory_benchmark(self):
+        """
+        Report memory used per node by a 10000 nodes FakeNetwork.
+         Nodes and feeders are slot-based : every class of them defines __slots__,
+         so no instance has a __dict__.
+        """
+        logger = logging.getLogger(__name__)
+        nb_nodes = 10000
+        nodes_conf = [{"id": f"node_{i}", "class": "switch", "currentPower": 100,
+            "maxPower": 200, "isOn": False, "strategy": "solarnosell"} for i in range(nb_nodes)]
+        nodes_conf.append({"id": "linky", "class": "publicpowergrid", "currentPower": "SUM(out)",
+            "maxPower": 3100, "minPower": 0, "marginPower": 100,
+            "contract": {"class": "generic", "hoursRanges": []}})
+        gc.collect()
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        network = Network(logger, FakeNetwork(ConfigurationManager(logger)), nodes_conf)
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0]-start
+        tracemalloc.stop()
+        logger.info("FakeNetwork of %d nodes: %.0f bytes per node", nb_nodes, used/nb_nodes)
+        self.assertEqual(len(network.getAll("switch")), nb_nodes)
+        for node in network.getAll(""):
+            for obj in [node, node.getFeeder("currentPower"), node.getFeeder("isOn")]:
+                if obj is None:
+                    continue
+                for cls in type(obj).__mro__[:-1]: # All but object
+                    self.assertIn("__slots__", vars(cls), cls)
+                self.assertFalse(hasattr(obj, "__dict__"), type(obj))
+
+if __name__ == '__main__':
+    unittest.main()
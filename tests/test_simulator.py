@@ -0,0 +1,115 @@
+#!/usr/bin/env -S python3
+"""
+Test Simulator : accelerated simulation on a virtual clock.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+from datetime import datetime
+# pylint: disable=wrong-import-position, import-error
+sys.path.append(str(Path(__file__).parents[0]))
+import utils
+from openhems.simulator import Simulator
+from openhems import sweep
+from openhems.modules.util import getClock, VirtualClock, setClock
+from openhems.modules.util.time import HoursRanges
+
+CONFIG = utils.ROOT_PATH / "tests/data/openhems_fake4tests_simulation.yaml"
+
+class TestSimulator(unittest.TestCase):
+    """
+    Check simulation are deterministic and use the virtual clock everywhere.
+    """
+
+    def simulate(self, days=2, seed=0):
+        """
+        Run a simulation with daily schedules and return (result, cycles).
+        """
+        cycles = []
+        with Simulator.fromConfiguration(CONFIG, start=datetime(2025, 1, 1), seed=seed) as sim:
+            sim.addDailySchedule("car", 7200, "7h00")
+            sim.addDailySchedule("pump", 3600)
+            result = sim.run(days=days, onCycle=cycles.append)
+        return result, cycles
+
+    def test_run(self):
+        """
+        Test a simulation run each cycle without sleep and compute totals.
+        """
+        result, cycles = self.simulate()
+        self.assertNotIsInstance(getClock(), VirtualClock) # Restored
+        self.assertEqual(result.cycles, 2*24*60)
+        self.assertEqual(result.end, datetime(2025, 1, 2, 23, 59))
+        self.assertEqual(result.nodesOnTime["pump"], 2*3600)
+        self.assertGreaterEqual(result.nodesOnTime["car"], 4*3600)
+        self.assertAlmostEqual(result.nodesEnergy["pump"], 2*0.28)
+        self.assertAlmostEqual(result.cost, sum(c.cost for c in cycles))
+        # Schedules are set at midnight, in off-peak range : switch on at once
+        on = [c.time for c in cycles if c.decisions.get("pump")]
+        self.assertEqual(on, [datetime(2025, 1, 1), datetime(2025, 1, 2)])
+        self.assertGreaterEqual(cycles[0].gridPower, 1500+280) # After switch on
+
+    def test_deterministic(self):
+        """
+        Test two runs with the same seed give the same decisions and totals.
+        """
+        result1, cycles1 = self.simulate(days=1)
+        result2, cycles2 = self.simulate(days=1)
+        self.assertEqual(result1, result2)
+        self.assertEqual(cycles1, cycles2)
+
+    def test_virtual_clock(self):
+        """
+        Test time based code use the virtual clock when now is not given.
+        """
+        clock = VirtualClock(datetime(2025, 1, 1, 23, 0))
+        previous = setClock(clock)
+        try:
+            hoursRanges = HoursRanges(["22h-6h"], outRangeCost=0.3, defaultCost=0.15)
+            inOffpeak, rangeEnd, _ = hoursRanges.checkRange()
+            self.assertTrue(inOffpeak)
+            self.assertEqual(rangeEnd, datetime(2025, 1, 2, 6, 0))
+            clock.sleep(8*3600)
+            self.assertEqual(clock.now(), datetime(2025, 1, 2, 7, 0))
+            self.assertFalse(hoursRanges.checkRange()[0])
+        finally:
+            setClock(previous)
+
+class TestSweep(unittest.TestCase):
+    """
+    Check parameters sweep over a process pool.
+    """
+
+    def test_set_parameter(self):
+        """
+        Test parameters of strategies/nodes are set on a copy of the configuration.
+        """
+        sweep._initWorker(CONFIG) # pylint: disable=protected-access
+        base = sweep._BASE_CONFIGURATOR # pylint: disable=protected-access
+        configurator = base.copy()
+        sweep.setParameter(configurator, "node.pump.currentPower", 500)
+        sweep.setParameter(configurator, "server.loopDelay", 10)
+        pump = [n for n in configurator.get("network.nodes") if n["id"]=="pump"][0]
+        self.assertEqual(pump["currentPower"], 500)
+        self.assertEqual(configurator.get("server.loopDelay"), 10)
+        pump = [n for n in base.get("network.nodes") if n["id"]=="pump"][0]
+        self.assertEqual(pump["currentPower"], 280)
+        self.assertEqual(base.get("server.loopDelay"), 30)
+        with self.assertRaises(sweep.ConfigurationException):
+            sweep.setParameter(configurator, "strategy.unknown.ratio", 1)
+
+    def test_sweep(self):
+        """
+        Test each combination is simulated and results are in grid order.
+        """
+        grid = {"node.pump.currentPower": [280, 560], "server.loopDelay": [30, 60]}
+        rows = sweep.sweep(CONFIG, grid, start=datetime(2025, 1, 1), days=1,
+            schedules={"pump": (3600, None)}, maxWorkers=2)
+        self.assertEqual([(r["node.pump.currentPower"], r["server.loopDelay"]) for r in rows],
+            [(280, 30), (280, 60), (560, 30), (560, 60)])
+        self.assertAlmostEqual(rows[2]["gridEnergy"]-rows[0]["gridEnergy"], 0.28, places=2)
+        self.assertIn("selfConsumption", sweep.formatTable(rows).splitlines()[0])
+
+if __name__ == '__main__':
+    unittest.main()
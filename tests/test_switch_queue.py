@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Check switch commands collected during a server loop are sent grouped
+ (One Home-Assistant service call per direction).
+"""
+
+import sys
+import unittest
+from datetime import datetime
+from pathlib import Path
+# pylint: disable=wrong-import-position
+# pylint: disable=import-error
+sys.path.append(str(Path(__file__).parents[0]))
+from utils.fake_homeassistant import FakeHomeAssistantHttp, SAMPLE_STATES, get_server
+
+class TestSwitchQueue(unittest.TestCase):
+    """
+    Check switch command queue with Home-Assistant stand-in.
+    """
+
+    def setUp(self):
+        self.ha = FakeHomeAssistantHttp(SAMPLE_STATES)
+        self.server = get_server(self.ha)
+        self.network = self.server.getNetwork()
+        self.server.loop(datetime(2025, 4, 10, 12, 0, 0))
+        self.nodes = {node.id: node for node in self.network.getAll("switch")}
+
+    def tearDown(self):
+        self.ha.shutdown()
+
+    def test_grouped_commands(self):
+        """
+        Test commands are coalesced and sent with one call per direction.
+        """
+        self.network.queueSwitches()
+        self.assertTrue(self.nodes["car"].switchOn(True))
+        self.assertTrue(self.nodes["machine"].switchOn(True))
+        self.assertFalse(self.nodes["pump"].switchOn(False))
+        self.assertTrue(self.nodes["pump"].switchOn(True)) # Contradictory: dropped
+        # Wanted state is visible before commands are sent
+        self.assertTrue(self.nodes["car"].isOn())
+        self.assertEqual(self.ha.nb_calls("/services/switch/turn_on"), 0)
+        self.assertEqual(self.network.flushSwitches(), [])
+        self.assertEqual(self.ha.nb_calls("/services/switch/turn_on"), 1)
+        self.assertEqual(self.ha.nb_calls("/services/switch/turn_off"), 0)
+        self.assertIn(("/services/switch/turn_on",
+            {"entity_id": ["switch.car", "switch.machine"]}), self.ha.posts)
+        self.assertEqual(self.ha.states["switch.car"].state, "on")
+        self.assertEqual(self.ha.states["switch.pump"].state, "on")
+        self.assertTrue(self.nodes["car"].isOn())
+        self.assertTrue(self.nodes["pump"].isOn())
+
+    def test_failed_commands(self):
+        """
+        Test failed commands are reconciled to real state.
+        """
+        self.ha.errors["/services/switch/turn_on"] = 500
+        self.network.queueSwitches()
+        self.nodes["car"].switchOn(True)
+        self.nodes["pump"].switchOn(False)
+        failed = self.network.flushSwitches()
+        self.assertEqual([node.id for node in failed], ["car"])
+        self.assertFalse(self.nodes["car"].isOn())
+        self.assertFalse(self.nodes["pump"].isOn())
+        self.assertEqual(self.ha.states["switch.pump"].state, "off")
+
+    def test_immediate_outside_loop(self):
+        """
+        Test commands are sent immediately when queue is not open.
+        """
+        self.nodes["car"].switchOn(True)
+        self.assertEqual(self.ha.nb_calls("/services/switch/turn_on"), 1)
+        self.assertEqual(self.ha.states["switch.car"].state, "on")
+
+if __name__ == '__main__':
+    unittest.main()
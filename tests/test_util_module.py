@@ -5,6 +5,8 @@ Check common functionnality
 """
 
 import sys
+import json
+import time
 import unittest
 from datetime import datetime
 from pathlib import Path
@@ -16,11 +18,13 @@ import contextlib
 ROOT_PATH = Path(__file__).parents[1]
 sys.path.append(str(ROOT_PATH / "src"))
 from openhems.modules.network.driver.fake_network import FakeNetwork
+from openhems.modules.network import StateFeeder
 from openhems.modules.util import (
     NotificationManager, MessageHistory,
     HoursRanges,Time,
     CastUtililty,
-    CastException, ConfigurationManager
+    CastException, ConfigurationManager,
+    CircuitBreaker, CircuitState, LoopTimings, DeadlineScheduler
 )
 
 stdout_handler = logging.StreamHandler(stream=sys.stdout)
@@ -101,6 +105,73 @@ class TestUtilModule(unittest.TestCase):
         value = CastUtililty.toType('bool', 0)
         self.assertEqual(value, False)
 
+    def test_caster(self):
+        """
+        Test precompiled casters, with Home-Assistant unavailable states
+        """
+        to_int = CastUtililty.getCaster('int')
+        self.assertEqual(to_int('2'), 2)
+        self.assertEqual(to_int('2.7'), 2)
+        self.assertEqual(to_int(-3), -3)
+        self.assertIsNone(to_int(None))
+        self.assertIsNone(to_int('None'))
+        for state in ['unavailable', 'unknown']:
+            with self.assertRaises(CastException) as cm:
+                to_int(state)
+            self.assertEqual(cm.exception.defaultValue, CastException.UNAVAILABLE)
+        with self.assertRaises(CastException):
+            to_int('abc')
+        to_bool = CastUtililty.getCaster('bool')
+        self.assertTrue(to_bool('On'))
+        self.assertFalse(to_bool('off'))
+        self.assertFalse(to_bool('unavailable'))
+        self.assertTrue(to_bool(3))
+        self.assertEqual(CastUtililty.getCaster('float')('-3.5'), -3.5)
+        self.assertEqual(CastUtililty.getCaster('str')('unknown'), 'unknown')
+        self.assertEqual(CastUtililty.getCaster(None)('x'), 'x')
+        with self.assertRaises(CastException):
+            CastUtililty.getCaster('complex')
+
+    def test_caster_benchmark(self):
+        """
+        Micro-benchmark : precompiled casters against toType()
+         over a recorded Home-Assistant "/states" payload.
+        """
+        with open(ROOT_PATH / "tests" / "data" / "homeassistant_states.json",
+                encoding="utf-8") as f:
+            states = json.load(f)
+        types = {"sensor.power": "int", "switch.plug": "bool",
+            "sensor.temperature": "float", "input_text.label": "str"}
+        entities = [(elem["state"], types[elem["entity_id"].rsplit("_", 1)[0]])
+            for elem in states]
+        casters = {typename: CastUtililty.getCaster(typename) for typename in types.values()}
+        def with_to_type(state, typename):
+            try:
+                return CastUtililty.toType(typename, state)
+            except (CastException, ValueError):
+                return None
+        def with_caster(state, typename):
+            try:
+                return casters[typename](state)
+            except CastException:
+                return None
+        for state, typename in entities:
+            self.assertEqual(with_caster(state, typename), with_to_type(state, typename))
+        for state in ["inf", "-inf", "1e999", "nan"]:
+            with self.assertRaises(CastException):
+                casters["int"](state)
+        nb_cycles = 200
+        durations = []
+        for cast in [with_to_type, with_caster]:
+            start = time.perf_counter()
+            for _ in range(nb_cycles):
+                for state, typename in entities:
+                    cast(state, typename)
+            durations.append(time.perf_counter()-start)
+        # Report only : durations depend on the machine load
+        logger.info("Cast %d states x %d: toType()=%.4fs getCaster()=%.4fs",
+            len(entities), nb_cycles, durations[0], durations[1])
+
     # pylint: disable=invalid-name
     def test_check_range(self):
         """
@@ -184,5 +255,106 @@ class TestUtilModule(unittest.TestCase):
         length = len(output.split('\n'))
         self.assertTrue(length==3)
 
+    def test_circuit_breaker(self):
+        """
+        Test CircuitBreaker class : open after failure, half-open after delay,
+         delay doubled on each new failure.
+        """
+        now = [0]
+        breaker = CircuitBreaker(retryDelay=2, maxRetryDelay=8, clock=lambda: now[0])
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.state, CircuitState.OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.getRetryIn(), 2)
+        now[0] = 2
+        self.assertTrue(breaker.allow()) # Trial call
+        self.assertEqual(breaker.state, CircuitState.HALF_OPEN)
+        self.assertFalse(breaker.allow()) # Only one trial
+        breaker.failure()
+        self.assertEqual(breaker.getRetryIn(), 4)
+        now[0] = 6
+        self.assertTrue(breaker.allow())
+        breaker.success()
+        self.assertEqual(breaker.state, CircuitState.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_loop_timings(self):
+        """
+        Test LoopTimings class : min/mean/p95/max per phase on a rolling window.
+        """
+        now = [0]
+        timings = LoopTimings(window=20, clock=lambda: now[0])
+        for duration in range(1, 26):
+            with timings.measure("updateStates"):
+                now[0] += duration
+        with timings.measure("strategy.default"):
+            now[0] += 0.5
+        stats = timings.getStats()
+        self.assertEqual(set(stats.keys()), {"updateStates", "strategy.default"})
+        stats = stats["updateStates"]
+        self.assertEqual(stats["count"], 20) # 1 to 5 are out of window
+        self.assertEqual(stats["min"], 6)
+        self.assertEqual(stats["max"], 25)
+        self.assertEqual(stats["last"], 25)
+        self.assertEqual(stats["mean"], 15.5)
+        self.assertEqual(stats["p95"], 24)
+
+    def test_deadline_scheduler(self):
+        """
+        Test DeadlineScheduler class : only due clients are woken up.
+        """
+        woken = []
+        class Client:
+            """ Client recording it's wake up """
+            def __init__(self, name):
+                self.name = name
+            def wakeUp(self, now):
+                """ Record wake up """
+                woken.append((self.name, now))
+        scheduler = DeadlineScheduler()
+        a, b, c = Client("a"), Client("b"), Client("c")
+        scheduler.wakeAt(a, 20)
+        scheduler.wakeAt(b, 10)
+        scheduler.wakeAt(b, 30) # Replace previous deadline
+        feeder = StateFeeder(0)
+        scheduler.wakeOnChange(c, feeder)
+        self.assertEqual(scheduler.getNextDeadline(), 20)
+        self.assertEqual(scheduler.runDue(15), 0)
+        feeder.setValue(1)
+        self.assertEqual(scheduler.runDue(25), 2)
+        self.assertEqual(woken, [("a", 25), ("c", 25)])
+        scheduler.wakeAt(b, None)
+        self.assertIsNone(scheduler.getNextDeadline())
+        self.assertEqual(scheduler.runDue(100), 0)
+        self.assertEqual(len(scheduler), 0)
+
+    def test_deadline_scheduler_error(self):
+        """
+        Test a client raising does not lose the deadlines of other due clients.
+        """
+        woken = []
+        class Client:
+            """ Client recording it's wake up, raising on the first one if failing """
+            def __init__(self, name, failing=False):
+                self.name = name
+                self.failing = failing
+            def wakeUp(self, now):
+                """ Record wake up """
+                woken.append((self.name, now))
+                if self.failing:
+                    self.failing = False
+                    raise ValueError(self.name)
+        scheduler = DeadlineScheduler()
+        a, b = Client("a", failing=True), Client("b")
+        scheduler.wakeAt(a, 10)
+        scheduler.wakeAt(b, 20)
+        with self.assertRaises(ValueError):
+            scheduler.runDue(25)
+        self.assertEqual(woken, [("a", 25), ("b", 25)])
+        self.assertEqual(scheduler.getNextDeadline(), 25) # a is re-armed
+        self.assertEqual(scheduler.runDue(30), 1)
+        self.assertEqual(woken[-1], ("a", 30))
+
 if __name__ == '__main__':
     unittest.main()
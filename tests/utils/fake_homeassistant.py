@@ -0,0 +1,178 @@
+"""
+Local stand-in for Home-Assistant REST API, to test drivers without a real instance.
+"""
+import json
+import time
+import logging
+import threading
+from types import SimpleNamespace
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import jinja2
+from openhems.modules.network.driver.home_assistant_api import HomeAssistantAPI
+from openhems.modules.network import Network
+from openhems.modules.util import ConfigurationManager
+from openhems.server import OpenHEMSServer
+
+logger = logging.getLogger(__name__)
+
+# A small home : a public power grid and 3 switches
+SAMPLE_STATES = {
+    "sensor.grid_power": 500,
+    "switch.car": "off", "sensor.car_power": 0,
+    "switch.machine": "off", "sensor.machine_power": 0,
+    "switch.pump": "on", "sensor.pump_power": 280,
+    "sensor.other": 1
+}
+SAMPLE_NODES = [
+    {"id": "linky", "class": "publicpowergrid", "currentPower": "sensor.grid_power",
+        "marginPower": 1000, "maxPower": 9000, "minPower": 0,
+        "contract": {"class": "generic", "defaultPrice": 0.15}},
+    {"id": "car", "class": "switch", "currentPower": "sensor.car_power",
+        "isOn": "switch.car", "maxPower": 2000, "priority": 50},
+    {"id": "machine", "class": "switch", "currentPower": "sensor.machine_power",
+        "isOn": "switch.machine", "maxPower": 1200, "priority": 40},
+    {"id": "pump", "class": "switch", "currentPower": "sensor.pump_power",
+        "isOn": "switch.pump", "maxPower": 300, "priority": 60}
+]
+
+def get_server(fake, nodes=None, updater_class=HomeAssistantAPI, **conf_values):
+    """
+    Return an OpenHEMSServer using a HomeAssistantAPI connected to the stand-in.
+    """
+    conf = ConfigurationManager(logger)
+    conf.add("api.url", fake.url)
+    conf.add("api.long_lived_token", fake.token)
+    conf.add("server.strategies", [])
+    conf.add("network.nodes", SAMPLE_NODES if nodes is None else nodes)
+    for key, value in conf_values.items():
+        conf.add(key, value)
+    conf.completeWithDefaults()
+    updater = updater_class(conf)
+    network = Network(logger, updater, conf.get("network.nodes"))
+    return OpenHEMSServer(logger, network, conf)
+
+class FakeHomeAssistantHttp:
+    """
+    Minimal Home-Assistant REST API: /states, /states/<id>, /template,
+     /services/switch/turn_on|off, /services/notify/*, /components.
+    Calls are counted by path in self.calls and posted data kept in self.posts.
+    """
+    def __init__(self, states, token="secret-token"):
+        self.token = token
+        self.states = {}
+        for entity_id, state in states.items():
+            self.set_state(entity_id, state)
+        self.calls = {}
+        self.clients = set() # Client (host, port) : one per TCP connection
+        self.posts = []
+        self.errors = {} # path => HTTP error code to return
+        self.delays = {} # path => seconds to wait before response
+        self.lock = threading.Lock()
+        fake = self
+        class Handler(BaseHTTPRequestHandler):
+            """
+            Request handler bound to this fake.
+            """
+            protocol_version = "HTTP/1.1" # Allow keep-alive
+            # pylint: disable=invalid-name
+            def do_GET(self):
+                """ Handle GET """
+                fake.handle(self, None)
+            def do_POST(self):
+                """ Handle POST """
+                length = int(self.headers.get("Content-Length", 0))
+                fake.handle(self, json.loads(self.rfile.read(length) or b"{}"))
+            def log_message(self, *args): # pylint: disable=arguments-differ
+                pass
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/api"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def set_state(self, entity_id, state):
+        """
+        Set an entity state (and update last_changed).
+        """
+        self.states[entity_id] = SimpleNamespace(
+            entity_id=entity_id, state=str(state), attributes={},
+            last_changed=datetime.now(timezone.utc))
+
+    def as_dict(self, state):
+        """
+        Return a state as "/states" JSON element.
+        """
+        return {"entity_id": state.entity_id, "state": state.state,
+            "attributes": state.attributes,
+            "last_changed": state.last_changed.isoformat()}
+
+    def nb_calls(self, path=None):
+        """
+        Return number of calls on path (or all if None).
+        """
+        if path is None:
+            return sum(self.calls.values())
+        return self.calls.get(path, 0)
+
+    # pylint: disable=too-many-branches
+    def handle(self, request, data):
+        """
+        Dispatch a request.
+        """
+        path = request.path[4:] if request.path.startswith("/api") else request.path
+        with self.lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+            self.clients.add(request.client_address)
+            if data is not None:
+                self.posts.append((path, data))
+        if request.headers.get("Authorization") != "Bearer " + self.token:
+            return self.reply(request, 401, {"message": "Unauthorized"})
+        if path in self.delays:
+            time.sleep(self.delays[path])
+        if path in self.errors:
+            return self.reply(request, self.errors[path], {})
+        if path == "/states":
+            return self.reply(request, 200, [self.as_dict(s) for s in self.states.values()])
+        if path.startswith("/states/"):
+            state = self.states.get(path[8:])
+            if state is None:
+                return self.reply(request, 404, {"message": "Entity not found."})
+            return self.reply(request, 200, self.as_dict(state))
+        if path == "/template":
+            rendered = jinja2.Environment().from_string(data["template"]).render(
+                states=list(self.states.values()))
+            return self.reply(request, 200, rendered)
+        if path.startswith("/services/switch/turn_"):
+            expect = path[len("/services/switch/turn_"):]
+            ids = data["entity_id"]
+            if isinstance(ids, str):
+                ids = [ids]
+            changed = []
+            for entity_id in ids:
+                if entity_id in self.states and self.states[entity_id].state != expect:
+                    self.set_state(entity_id, expect)
+                    changed.append(self.as_dict(self.states[entity_id]))
+            return self.reply(request, 200, changed)
+        if path.startswith("/services/notify/"):
+            return self.reply(request, 200, [])
+        if path == "/components":
+            return self.reply(request, 200, ["sensor", "switch"])
+        return self.reply(request, 404, {"message": "Not found"})
+
+    def reply(self, request, code, body):
+        """
+        Send a JSON (or already rendered text) response.
+        """
+        payload = (body if isinstance(body, str) else json.dumps(body)).encode()
+        request.send_response(code)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def shutdown(self):
+        """
+        Stop server.
+        """
+        self.server.shutdown()
+        self.server.server_close()
@@ -10,7 +10,7 @@ from pathlib import Path
 ROOT_PATH = Path(__file__).parents[2]
 sys.path.append(str(ROOT_PATH / "src"))
 from openhems.main import OpenHEMSApplication
-from openhems.modules.util import DATETIME_PRINT_FORMAT
+from openhems.modules.util import DATETIME_PRINT_FORMAT, VirtualClock, setClock
 
 logger = logging.getLogger(__name__)
 
@@ -22,13 +22,16 @@ class TestStrategy(unittest.TestCase):
     def init(self, config_file, now=None):
         """
         Init the application
+         on a virtual clock (restored on tearDown()).
         """
         # pylint: disable=attribute-defined-outside-init
+        if now is None:
+            now = datetime.datetime.now()
+        self.clock = VirtualClock(now)
+        setClock(self.clock)
         self.app = OpenHEMSApplication(config_file)
         self.nodes = {}
         self._loop_delay = 1
-        if now is None:
-            now = datetime.datetime.now()
         self._now = now
         if self.app is None or self.app.server is None:
             return None
@@ -41,6 +44,9 @@ class TestStrategy(unittest.TestCase):
         print("Network is : ", self.get_network())
         return self.nodes
 
+    def tearDown(self):
+        setClock(None)
+
     def loop(self, loop_delay=None, now=None):
         """
         If set now, we jump to now
@@ -60,6 +66,7 @@ class TestStrategy(unittest.TestCase):
             self._now = now
         logger.debug("Time: %s, lastloop: %s s",
             self._now.strftime(DATETIME_PRINT_FORMAT), self._loop_delay)
+        self.clock.setTime(self._now)
         self.app.server.loop(self._now)
         self._loop_delay *= 2
         return self.nodes